@@ -4,7 +4,9 @@ Hero processing
 
 Calling detect_features assumes that the image processing environment has been
 initialized and will parse apart an image and feed it into the various models
-needed to detect AFK Arena Hero Features
+needed to detect AFK Arena Hero Features. The options of a request are read
+from the RequestContext passed in, so several rosters can be processed in
+threads at once
 """
 from typing import TYPE_CHECKING
 
@@ -17,8 +19,9 @@ from image_processing.database.configs.ascension_constants import (
     ABBREVIATED_ASCENSION_TYPES)
 from image_processing.utils.color_helper import MplColorHelper
 from image_processing.afk.hero.process_heroes import (
-    get_heroes, get_hero_contours)
+    cluster_segments, get_heroes, get_hero_contours)
 from image_processing.processing.image_data import SegmentResult
+from image_processing.processing.request_context import RequestContext
 from image_processing.models.model_attributes import (
     ASCENSION_STAR_LABELS, FI_LABELS, ModelResult, SI_LABELS)
 from image_processing.afk.roster.matrix import Matrix
@@ -26,7 +29,6 @@ from image_processing.afk.hero.hero_data import (
     DetectedHeroData, RosterData, HeroMatchJson)
 from image_processing.afk.roster.dimensions_object import DoubleCoordinates
 from image_processing.database.engravings_database import EngravingData
-from image_processing.utils.verbose_print import print_verbose
 
 if TYPE_CHECKING:
     from image_processing.models.yolov5.models.common import Detections
@@ -35,51 +37,79 @@ if TYPE_CHECKING:
 FONT = cv2.FONT_HERSHEY_SIMPLEX
 TEXT_COLOR = MplColorHelper().get_rgb("red")
 THICKNESS = 2
+# Star results below this confidence are re-checked with the border model
+ASCENSION_STAR_THRESHOLD = 0.75
 
 
-def detect_features(roster_image: np.ndarray):
+def detect_features(roster_image: np.ndarray,
+                    context: RequestContext = None):
     """
     Detect AFK Arena heroes from a roster screenshot and for each hero detect
         "FI", "SI", "Ascension", and "hero Name"
     Args:
         roster_image: image to run segmentation and detection on
+        context (RequestContext, optional): options and timer of the request,
+            built from the global variables when None. Defaults to None.
     """
+    if context is None:
+        context = RequestContext.from_globals(roster_image)
+    timer = context.timer
     blur_args = {"hsv_range": GV.HERO_ROSTER_HSV}
     # Run HSV segmentation on hero roster to get hero
-    GV.GLOBAL_TIMER.start('Roster Segmentation', reset=True)
-
-    segment_dict, segment_matrix = get_heroes(roster_image, blur_args)
-    GV.GLOBAL_TIMER.stop()
-
-    GV.GLOBAL_TIMER.start("Image Recognition")
-    detected_hero_data: list[DetectedHeroData] = []
-    for _pseudo_segment_name, segment_info in segment_dict.items():
-        # display_image(segment_info.image, display=True)
-
-        GV.GLOBAL_TIMER.start("Hero Detection")
-        hero_matches = GV.IMAGE_DB.search(segment_info)
-        GV.GLOBAL_TIMER.stop()
-
+    timer.start('Roster Segmentation', reset=True)
+
+    segment_dict, segment_matrix = get_heroes(roster_image, blur_args,
+                                              context=context)
+    timer.stop()
+
+    timer.start("Image Recognition")
+    segment_list = list(segment_dict.values())
+    if context.segments_callback is not None:
+        context.segments_callback(segment_matrix, segment_list)
+    timer.start("Hero Detection")
+    if GV.SEGMENT_HASH_DISTANCE is None:
+        hero_match_list = GV.IMAGE_DB.search_many(segment_list,
+                                                  context=context)
+    else:
+        # Search for one segment of each group of near duplicate segments and
+        #   share its matches with the rest of the group
+        representative_indices, segment_clusters = cluster_segments(
+            segment_list, GV.SEGMENT_HASH_DISTANCE)
+        context.print_verbose(
+            f"Searching {len(representative_indices)} unique segments out "
+            f"of {len(segment_list)}", verbose_level=1)
+        cluster_match_list = GV.IMAGE_DB.search_many(
+            [segment_list[segment_index]
+             for segment_index in representative_indices], context=context)
+        hero_match_list = [cluster_match_list[cluster_index]
+                           for cluster_index in segment_clusters]
+    timer.stop()
+
+    hero_name_results: list[HeroMatchJson] = []
+    for hero_matches in hero_match_list:
         best_hero_match = hero_matches.best()
-        print_verbose(f"Detected hero: {best_hero_match}", verbose_level=1)
+        context.print_verbose(f"Detected hero: {best_hero_match}",
+                              verbose_level=1)
         # Get the hero information about the detected hero
         best_match_info = GV.IMAGE_DB.hero_lookup[best_hero_match.name].first()
-        hero_prediction_result = HeroMatchJson(best_match_info.name,
+        hero_name_results.append(HeroMatchJson(best_match_info.name,
                                                best_hero_match.match_count,
-                                               best_hero_match.total_matches)
-
-        GV.GLOBAL_TIMER.start("Attribute Detection")
-        detected_hero_result = detect_attributes(hero_prediction_result,
-                                                 segment_info)
-        GV.GLOBAL_TIMER.stop()
-        detected_hero_data.append(detected_hero_result)
-
-       # When debugging Draw hero info on image
-        if GV.verbosity(2):
+                                               best_hero_match.total_matches))
+
+    timer.start("Attribute Detection")
+    detected_hero_data = detect_attributes_batch(hero_name_results,
+                                                 segment_list,
+                                                 context=context)
+    timer.stop()
+
+    # When debugging Draw hero info on image
+    if context.verbosity(2):
+        for segment_info, detected_hero_result in zip(segment_list,
+                                                      detected_hero_data):
             label_hero_feature(roster_image, segment_info,
                                detected_hero_result, segment_matrix)
 
-    GV.GLOBAL_TIMER.display()
+    timer.display()
 
     return RosterData(detected_hero_data, segment_matrix)
 
@@ -117,18 +147,23 @@ def label_hero_feature(roster_image: np.ndarray,
                 abs(font_scale), TEXT_COLOR, THICKNESS, cv2.LINE_AA)
 
 
-def detect_furniture(detected_furniture: DataFrame):
+def detect_furniture(detected_furniture: DataFrame,
+                     context: RequestContext = None):
     """_summary_
 
     Args:
         detected_furniture (DataFrame): _description_
+        context (RequestContext, optional): request the results are timed
+            on, built from the global variables when None. Defaults to None.
 
     Returns:
         _type_: _description_
     """
 
+    if context is None:
+        context = RequestContext.from_globals()
     furniture_result = ModelResult("0", 0)
-    GV.GLOBAL_TIMER.start("Detect Furniture")
+    context.timer.start("Detect Furniture")
     if len(detected_furniture) > 0:
         best_furniture_match = detected_furniture.sort_values(
             "confidence").iloc[0]
@@ -137,21 +172,26 @@ def detect_furniture(detected_furniture: DataFrame):
         if best_furniture_match["confidence"] >= 0.85:
             furniture_result = ModelResult(
                 best_furniture_label, best_furniture_match["confidence"])
-    GV.GLOBAL_TIMER.stop()
+    context.timer.stop()
     return furniture_result
 
 
-def detect_signature_item(detected_signature_items: DataFrame):
+def detect_signature_item(detected_signature_items: DataFrame,
+                          context: RequestContext = None):
     """_summary_
 
     Args:
         detected_signature_items (DataFrame): _description_
+        context (RequestContext, optional): request the results are timed
+            on, built from the global variables when None. Defaults to None.
 
     Returns:
         _type_: _description_
     """
+    if context is None:
+        context = RequestContext.from_globals()
     signature_item_result = ModelResult("0", 0)
-    GV.GLOBAL_TIMER.start("Detect SI")
+    context.timer.start("Detect SI")
     if len(detected_signature_items) > 0:
         best_signature_item_match = detected_signature_items.sort_values(
             "confidence", ascending=False).iloc[0]
@@ -162,24 +202,32 @@ def detect_signature_item(detected_signature_items: DataFrame):
             signature_item_result = ModelResult(
                 best_signature_item_label,
                 best_signature_item_match["confidence"])
-    GV.GLOBAL_TIMER.stop()
+    context.timer.stop()
     return signature_item_result
 
 
-def detect_ascension(detected_ascension_stars: DataFrame,
-                     image: np.ndarray):
-    """_summary_
+def detect_ascension_stars(detected_ascension_stars: DataFrame,
+                           context: RequestContext = None):
+    """
+    Find the ascension level of a hero from the ascension stars detected by
+        the FI/SI/Star model
 
     Args:
-        detected_ascension_stars (DataFrame): _description_
-        segment_info (processing.SegmentResult): object with info describing the
-            location of 'detected_hero_result' in DetectedHeroData
+        detected_ascension_stars (DataFrame): ascension star results from the
+            FI/SI/Star model for a single hero
+        context (RequestContext, optional): request the results are timed
+            on, built from the global variables when None. Defaults to None.
+
     Returns:
-        _type_: _description_
+        tuple[ModelResult, DoubleCoordinates]: the best ascension result and
+            the location of the stars it was detected from(None when no
+            stars were detected)
     """
+    if context is None:
+        context = RequestContext.from_globals()
     ascension_result = ModelResult("E", 0)
     best_match_coordinates = None
-    GV.GLOBAL_TIMER.start("Detect Ascension(All)")
+    context.timer.start("Detect Ascension(All)")
     if len(detected_ascension_stars) > 0:
         best_ascension_stars_match = detected_ascension_stars.sort_values(
             "confidence", ascending=False).iloc[0]
@@ -195,20 +243,57 @@ def detect_ascension(detected_ascension_stars: DataFrame,
         ascension_result = ModelResult(
             best_ascension_stars_label,
             best_ascension_stars_match["confidence"])
-    # If ascension score for ascended hero with stars is below 0.75
-    #   confidence, detect border results for E - A ascension levels
-    if ascension_result.score < 0.75:
-        GV.GLOBAL_TIMER.start("Detect Ascension(E-A)")
-        # pylint: disable=not-callable
-        raw_ascension_model_results: "Detections" = GV.ASCENSION_BORDER_MODEL(
-            [image], size=GV.MODEL_IMAGE_SIZE)
+    context.timer.stop()
 
-        labeled_ascension_model_results: DataFrame = \
-            raw_ascension_model_results.pandas().xyxy[0]
-        detected_ascension = labeled_ascension_model_results
+    return ascension_result, best_match_coordinates
+
+
+def needs_border_detection(ascension_result: ModelResult):
+    """
+    Check if an ascension result from `detect_ascension_stars` is too
+        uncertain and the ascension border model should be used to detect
+        E - A ascension levels
+
+    Args:
+        ascension_result (ModelResult): result of `detect_ascension_stars`
+
+    Returns:
+        bool: True when the ascension border model should be run
+    """
+    return ascension_result.score < ASCENSION_STAR_THRESHOLD
 
-        if len(detected_ascension) > 0:
 
+def detect_ascension_borders(images: list[np.ndarray],
+                             batch_size: int = None,
+                             context: RequestContext = None):
+    """
+    Detect E - A ascension levels from the hero borders of `images` using a
+        batched run of the ascension border model
+
+    Args:
+        images (list[np.ndarray]): RGB images of heroes
+        batch_size (int, optional): number of heroes per model forward pass.
+            Defaults to the batch size of `context`.
+        context (RequestContext, optional): options and timer of the request,
+            built from the global variables when None. Defaults to None.
+
+    Returns:
+        list[ModelResult | None]: best border result for each image, None
+            when no border was detected for the image
+    """
+    border_results: list[ModelResult | None] = []
+    if len(images) == 0:
+        return border_results
+
+    if context is None:
+        context = RequestContext.from_globals()
+    if batch_size is None:
+        batch_size = context.batch_size
+    context.timer.start("Detect Ascension(E-A)")
+    labeled_model_results = run_model_batch(GV.ASCENSION_BORDER_MODEL, images,
+                                            batch_size)
+    for detected_ascension in labeled_model_results:
+        if len(detected_ascension) > 0:
             best_ascension_match = detected_ascension.sort_values(
                 "confidence", ascending=False).iloc[0]
             best_ascension_label = (
@@ -216,28 +301,64 @@ def detect_ascension(detected_ascension_stars: DataFrame,
 
             ascension_result = ModelResult(best_ascension_label,
                                            best_ascension_match["confidence"])
+            context.print_verbose(f"Ascension Results: {ascension_result}")
+            border_results.append(ascension_result)
+        else:
+            border_results.append(None)
+    context.timer.stop()
+
+    return border_results
+
+
+def detect_ascension(detected_ascension_stars: DataFrame,
+                     image: np.ndarray,
+                     context: RequestContext = None):
+    """
+    Detect the ascension level of a single hero, falling back to the
+        ascension border model when the star results are not confident enough
 
-            print_verbose(f"Ascension Results: {ascension_result}")
-        GV.GLOBAL_TIMER.stop()
-    GV.GLOBAL_TIMER.stop()
+    Args:
+        detected_ascension_stars (DataFrame): ascension star results from the
+            FI/SI/Star model for `image`
+        image (np.ndarray): image of hero in RGB format
+        context (RequestContext, optional): options and timer of the request,
+            built from the global variables when None. Defaults to None.
+    Returns:
+        tuple[ModelResult, DoubleCoordinates]: the best ascension result and
+            the location of the ascension stars
+    """
+    ascension_result, best_match_coordinates = detect_ascension_stars(
+        detected_ascension_stars, context)
+    # If ascension score for ascended hero with stars is below 0.75
+    #   confidence, detect border results for E - A ascension levels
+    if needs_border_detection(ascension_result):
+        border_result = detect_ascension_borders([image], batch_size=1,
+                                                 context=context)[0]
+        if border_result is not None:
+            ascension_result = border_result
 
     return ascension_result, best_match_coordinates
 
 
 def detect_engraving(ascension_result: ModelResult,
                      image: np.ndarray,
-                     star_coordinates: DoubleCoordinates):
+                     star_coordinates: DoubleCoordinates,
+                     context: RequestContext = None):
     """_summary_
 
     Args:
         ascension_result (ModelResult): _description_
         image (np.ndarray): image in RGB format
         star_coordinates (DoubleCoordinates): _description_
+        context (RequestContext, optional): options of the request, built
+            from the global variables when None. Defaults to None.
 
     Returns:
         _type_: _description_
     """
 
+    if context is None:
+        context = RequestContext.from_globals()
     engraving_result = ModelResult("0", 0)
     # pylint: disable=unsupported-membership-test
     if ascension_result.label in ASCENSION_STAR_LABELS.inverse:
@@ -261,56 +382,204 @@ def detect_engraving(ascension_result: ModelResult,
         mean = cv2.mean(temp_image, mask=engraved_star_mask)
         engraving_results = GV.ENGRAVING_DB.search(
             EngravingData(mean[0], mean[1], mean[2]))
-        print_verbose(f"Engraving Result: {engraving_results}")
+        context.print_verbose(f"Engraving Result: {engraving_results}")
         engraving_result = engraving_results[0]
     return engraving_result
 
 
-def detect_attributes(name_result: HeroMatchJson, segment_info: SegmentResult,
-                      ):
+def run_model_batch(model, images: list[np.ndarray],
+                    batch_size: int = None) -> list[DataFrame]:
     """
-    Detect hero features such as FI, SI, Stars and ascension level using'
-        custom trained yolov5 and detectron2 image recognition models
+    Run a yolov5 model over `images` in chunks of `batch_size` so each chunk
+        only pays the model pre/post processing overhead once
 
     Args:
-        hero_image_info (HeroImage): A wrapper around an image detected from
-            the Flann image database that includes the image itself, the image
-            name and the location the image was loaded from
-        segment_info (processing.SegmentResult): object with info describing the
-            location of 'detected_hero_result' in DetectedHeroData
-        name_result (ModelResult): A model result containing the detected heroes
-            name and confidence/score of the hero prediction
+        model (torch.Tensor): yolov5 model to run the images through
+        images (list[np.ndarray]): RGB images sized to GV.MODEL_IMAGE_SIZE
+        batch_size (int, optional): maximum number of images passed to the
+            model in a single forward pass, when None or less than 1 all
+            images are passed at once. Defaults to GV.MODEL_BATCH_SIZE.
+
     Returns:
-        [type]: [description]
+        list[DataFrame]: labeled model results for each image, in the same
+            order as `images`
     """
+    if batch_size is None:
+        batch_size = GV.MODEL_BATCH_SIZE
+    if batch_size is None or batch_size < 1:
+        batch_size = max(len(images), 1)
+
+    labeled_model_results: list[DataFrame] = []
+    for batch_start in range(0, len(images), batch_size):
+        # pylint: disable=not-callable
+        raw_model_results: "Detections" = model(
+            images[batch_start:batch_start + batch_size],
+            size=GV.MODEL_IMAGE_SIZE)
+        labeled_model_results.extend(raw_model_results.pandas().xyxy)
+    return labeled_model_results
+
 
+def prepare_model_image(segment_info: SegmentResult):
+    """
+    Resize a segmented hero to the size expected by the yolov5 models and
+        convert it to RGB
+
+    Args:
+        segment_info (processing.SegmentResult): segmented hero to convert
+
+    Returns:
+        np.ndarray: RGB image of GV.MODEL_IMAGE_SIZE x GV.MODEL_IMAGE_SIZE
+    """
     resized_image = cv2.resize(segment_info.image,
                                (GV.MODEL_IMAGE_SIZE, GV.MODEL_IMAGE_SIZE))
-    rgb_image = cv2.cvtColor(resized_image, cv2.COLOR_BGR2RGB)
+    return cv2.cvtColor(resized_image, cv2.COLOR_BGR2RGB)
 
-    # pylint: disable=not-callable
-    GV.GLOBAL_TIMER.start("Attribute Model Results")
-    raw_model_results: "Detections" = GV.FI_SI_STAR_MODEL(
-        [rgb_image], size=GV.MODEL_IMAGE_SIZE)
-    GV.GLOBAL_TIMER.stop()
 
-    labeled_model_results: DataFrame = raw_model_results.pandas().xyxy[0]
+def split_attribute_results(labeled_model_results: DataFrame):
+    """
+    Split the FI/SI/Star model results for a single hero by attribute
+
+    Args:
+        labeled_model_results (DataFrame): FI/SI/Star model results
 
+    Returns:
+        tuple[DataFrame, DataFrame, DataFrame]: furniture, ascension star and
+            signature item results
+    """
     detected_furniture: DataFrame = labeled_model_results.loc[
         labeled_model_results['class'].isin(FI_LABELS.keys())]
     detected_ascension_stars: DataFrame = labeled_model_results.loc[
         labeled_model_results['class'].isin(ASCENSION_STAR_LABELS.keys())]
     detected_signature_items: DataFrame = labeled_model_results.loc[
         labeled_model_results['class'].isin(SI_LABELS.keys())]
+    return detected_furniture, detected_ascension_stars, detected_signature_items
+
+
+def detect_attributes_batch(name_results: list[HeroMatchJson],
+                            segment_list: list[SegmentResult],
+                            batch_size: int = None,
+                            context: RequestContext = None):
+    """
+    Detect hero features such as FI, SI, Stars and ascension level for every
+        hero in `segment_list`, running the heroes through the FI/SI/Star model
+        in batches of `batch_size`. Heroes whose star results are not
+        confident enough are then run through the ascension border model in a
+        second batched pass
+
+    When `context` has a hero callback the heroes are instead run through
+        both models one batch at a time, and the callback is called for each
+        hero of a batch as soon as the batch is done
+
+    Args:
+        name_results (list[HeroMatchJson]): the detected name of each hero in
+            `segment_list`
+        segment_list (list[processing.SegmentResult]): segmented heroes in
+            roster order
+        batch_size (int, optional): number of heroes per model forward pass.
+            Defaults to the batch size of `context`.
+        context (RequestContext, optional): options and timer of the request,
+            built from the global variables when None. Defaults to None.
+
+    Returns:
+        list[DetectedHeroData]: detected attributes for each hero, in the same
+            order as `segment_list`
+    """
+    if context is None:
+        context = RequestContext.from_globals()
+    if batch_size is None:
+        batch_size = context.batch_size
+    if context.hero_callback is None:
+        return _detect_attributes_chunk(name_results, segment_list,
+                                        batch_size, context)
+
+    chunk_size = batch_size
+    if chunk_size is None or chunk_size < 1:
+        chunk_size = max(len(segment_list), 1)
+    detected_hero_data: list[DetectedHeroData] = []
+    for chunk_start in range(0, len(segment_list), chunk_size):
+        chunk_hero_data = _detect_attributes_chunk(
+            name_results[chunk_start:chunk_start + chunk_size],
+            segment_list[chunk_start:chunk_start + chunk_size],
+            batch_size, context)
+        for hero_offset, hero_data in enumerate(chunk_hero_data):
+            context.hero_callback(chunk_start + hero_offset, hero_data)
+        detected_hero_data.extend(chunk_hero_data)
+    return detected_hero_data
+
+
+def _detect_attributes_chunk(name_results: list[HeroMatchJson],
+                             segment_list: list[SegmentResult],
+                             batch_size: int,
+                             context: RequestContext):
+    """
+    Detect the attributes of every hero in `segment_list` with batched runs
+        of the FI/SI/Star model and then the ascension border model, see
+        `detect_attributes_batch`
+    """
+    rgb_images = [prepare_model_image(segment_info)
+                  for segment_info in segment_list]
+
+    context.timer.start("Attribute Model Results")
+    labeled_model_results = run_model_batch(GV.FI_SI_STAR_MODEL, rgb_images,
+                                            batch_size)
+    context.timer.stop()
+
+    split_results = [split_attribute_results(model_results)
+                     for model_results in labeled_model_results]
+    ascension_results = [detect_ascension_stars(detected_ascension_stars,
+                                                context)
+                         for _, detected_ascension_stars, _ in split_results]
+
+    # Run the ascension border model once for every hero that has an
+    #   uncertain star result and merge the border results back in
+    border_indices = [
+        hero_index for hero_index, (ascension_result, _) in enumerate(
+            ascension_results) if needs_border_detection(ascension_result)]
+    border_results = detect_ascension_borders(
+        [rgb_images[hero_index] for hero_index in border_indices], batch_size,
+        context)
+    for hero_index, border_result in zip(border_indices, border_results):
+        if border_result is not None:
+            ascension_results[hero_index] = (
+                border_result, ascension_results[hero_index][1])
+
+    detected_hero_data: list[DetectedHeroData] = []
+    for name_result, rgb_image, split_result, ascension_result_tuple in zip(
+            name_results, rgb_images, split_results, ascension_results):
+        detected_furniture, _, detected_signature_items = split_result
+        ascension_result, star_coordinates = ascension_result_tuple
+
+        furniture_result = detect_furniture(detected_furniture, context)
+        signature_item_result = detect_signature_item(
+            detected_signature_items, context)
+        engraving_result = detect_engraving(
+            ascension_result, rgb_image, star_coordinates, context)
+
+        detected_hero_data.append(DetectedHeroData(
+            name_result, signature_item_result, furniture_result,
+            ascension_result, engraving_result, rgb_image))
+    return detected_hero_data
+
+
+def detect_attributes(name_result: HeroMatchJson, segment_info: SegmentResult,
+                      context: RequestContext = None):
+    """
+    Detect hero features such as FI, SI, Stars and ascension level using'
+        custom trained yolov5 and detectron2 image recognition models
+
+    Args:
+        hero_image_info (HeroImage): A wrapper around an image detected from
+            the Flann image database that includes the image itself, the image
+            name and the location the image was loaded from
+        segment_info (processing.SegmentResult): object with info describing the
+            location of 'detected_hero_result' in DetectedHeroData
+        name_result (ModelResult): A model result containing the detected heroes
+            name and confidence/score of the hero prediction
+        context (RequestContext, optional): options and timer of the request,
+            built from the global variables when None. Defaults to None.
+    Returns:
+        [type]: [description]
+    """
 
-    furniture_result = detect_furniture(detected_furniture)
-    ascension_result, star_coordinates = detect_ascension(
-        detected_ascension_stars, rgb_image)
-    signature_item_result = detect_signature_item(detected_signature_items)
-    engraving_result = detect_engraving(
-        ascension_result, rgb_image, star_coordinates)
-
-    hero_data = DetectedHeroData(name_result, signature_item_result,
-                                 furniture_result, ascension_result,
-                                 engraving_result, rgb_image)
-    return hero_data
+    return detect_attributes_batch([name_result], [segment_info],
+                                   context=context)[0]
@@ -1,12 +1,20 @@
 import json
 from pathlib import Path
 import re
-from typing import Union
+from typing import TYPE_CHECKING, Union
+
+import cv2
 import numpy as np
 
 from image_processing.models.model_attributes import ModelResult
 from image_processing.afk.roster.matrix import Matrix
 
+if TYPE_CHECKING:
+    from image_processing.processing.image_data import SegmentResult
+
+# Order of the fields of a hero position in RosterMatrixJson.to_list
+HERO_POSITION_KEYS = ("row", "column", "x", "y", "width", "height")
+
 
 class HeroImage:
     """
@@ -56,6 +64,68 @@ class HeroImage:
         return f"HeroImage<{self._raw_name, self.image_path}>"
 
 
+class HeroRecord:
+    """
+    Lightweight record of a hero portrait in the image database, holding the
+        portrait's path and the database image indices its descriptors were
+        added under instead of its pixels. The portrait is only read from
+        disk when `load_image` is called
+    """
+    __slots__ = ("name", "image_path", "start_index", "stop_index")
+
+    def __init__(self, hero_name: str, image_path: Path, start_index: int,
+                 stop_index: int = None):
+        """
+        Create a record of a portrait
+
+        Args:
+            hero_name (str): name of the hero in the portrait
+            image_path (Path): path the portrait can be read from
+            start_index (int): first database image index of the portrait
+            stop_index (int, optional): database image index after the last
+                one of the portrait. Defaults to start_index + 1.
+        """
+        self.name = hero_name
+        self.image_path = image_path
+        self.start_index = start_index
+        if stop_index is None:
+            stop_index = start_index + 1
+        self.stop_index = stop_index
+
+    @property
+    def index_range(self) -> range:
+        """
+        Database image indices of the portrait, one for every crop it was
+            added with
+        """
+        return range(self.start_index, self.stop_index)
+
+    def load_image(self) -> np.ndarray:
+        """
+        Read the portrait from `image_path`
+
+        Raises:
+            FileNotFoundError: raised when the portrait cannot be read
+
+        Returns:
+            np.ndarray: BGR image of the portrait
+        """
+        image = None
+        if self.image_path is not None:
+            image = cv2.imread(str(self.image_path))
+        if image is None:
+            raise FileNotFoundError(
+                f"Hero Image not found: {self.image_path}")
+        return image
+
+    def __str__(self):
+        return (f"HeroRecord<{self.name}, {self.image_path}, "
+                f"indices={self.start_index}:{self.stop_index}>")
+
+    def __repr__(self) -> str:
+        return str(self)
+
+
 class RosterJson:
     """_summary_
 
@@ -116,17 +186,127 @@ class RosterJson:
         raw_hero_list = json_dict["heroes"]
         hero_list = []
         for hero_dict in raw_hero_list:
-            detected_hero = DetectedHeroData(
-                HeroMatchJson.from_dict(hero_dict["name"]),
-                ModelResult.from_dict(hero_dict["signature_item"]),
-                ModelResult.from_dict(hero_dict["furniture"]),
-                ModelResult.from_dict(hero_dict["ascension"]),
-                ModelResult.from_dict(hero_dict["engraving"]))
-            hero_list.append(detected_hero)
+            hero_list.append(DetectedHeroData.from_dict(hero_dict))
         roster_instance = RosterJson(
             hero_list, json_dict["rows"], json_dict["columns"])
         return roster_instance
 
+    def to_list(self):
+        """
+        Convert the RosterJson object into a [rows, columns, heroes] list,
+            the positional layout used by the msgpack wire format
+        """
+        return [self.row_length, self.column_length,
+                [hero_data.to_list() for hero_data in self.hero_data_list]]
+
+    @classmethod
+    def from_list(cls, roster_list: list):
+        """
+        Create a RosterJson from the list returned by `to_list`
+        """
+        row_length, column_length, raw_hero_list = roster_list
+        return RosterJson(
+            [DetectedHeroData.from_list(hero_list)
+             for hero_list in raw_hero_list],
+            row_length, column_length)
+
+
+class RosterMatrixJson:
+    """
+    Layout of the heroes segmented from a roster, sent to streaming clients
+        as soon as the roster is segmented and before any hero is detected
+    """
+
+    def __init__(self, row_len: int, column_len: int,
+                 hero_positions: list[dict[str, int]]):
+        """
+        Create the layout of a roster
+
+        Args:
+            row_len (int): number of rows in the roster
+            column_len (int): number of heroes in the longest row
+            hero_positions (list[dict[str, int]]): "row", "column", "x", "y",
+                "width" and "height" of each hero, in the order the heroes
+                are detected
+        """
+        self.row_length = row_len
+        self.column_length = column_len
+        self.hero_positions = hero_positions
+
+    @classmethod
+    def from_segments(cls, roster_matrix: Matrix,
+                      segment_list: list["SegmentResult"]):
+        """
+        Create the layout of the heroes in `segment_list` from the matrix
+            they were segmented into
+
+        Args:
+            roster_matrix (Matrix): matrix returned by `get_heroes`
+            segment_list (list[SegmentResult]): segmented heroes in the order
+                they are detected
+        """
+        matrix_positions: dict[int, tuple[int, int]] = {}
+        for row_index, hero_row in enumerate(roster_matrix):
+            for column_index, row_item in enumerate(hero_row):
+                matrix_positions[id(row_item)] = (row_index, column_index)
+
+        hero_positions = []
+        for segment_info in segment_list:
+            row_index, column_index = matrix_positions.get(
+                id(segment_info.segment_location), (-1, -1))
+            dimensions = segment_info.segment_location.dimensions
+            hero_positions.append({
+                "row": row_index, "column": column_index,
+                "x": int(dimensions.x), "y": int(dimensions.y),
+                "width": int(dimensions.width),
+                "height": int(dimensions.height)})
+
+        column_length = 0
+        if len(roster_matrix) > 0:
+            column_length = len(max(roster_matrix, key=len))
+        return cls(len(roster_matrix), column_length, hero_positions)
+
+    def json_dict(self):
+        """
+        Convert the RosterMatrixJson object into a serializable dictionary
+        """
+        return {"rows": self.row_length, "columns": self.column_length,
+                "heroes": self.hero_positions}
+
+    def json(self):
+        """
+        Convert the RosterMatrixJson object into a str
+        """
+        return json.dumps(self.json_dict())
+
+    @classmethod
+    def from_json(cls, json_str: str):
+        """
+        Create a RosterMatrixJson from the str returned by `json`
+        """
+        json_dict: dict = json.loads(json_str)
+        return cls(json_dict["rows"], json_dict["columns"],
+                   json_dict["heroes"])
+
+    def to_list(self):
+        """
+        Convert the RosterMatrixJson object into a [rows, columns, positions]
+            list, each position is [row, column, x, y, width, height]
+        """
+        return [self.row_length, self.column_length,
+                [[hero_position[key] for key in HERO_POSITION_KEYS]
+                 for hero_position in self.hero_positions]]
+
+    @classmethod
+    def from_list(cls, matrix_list: list):
+        """
+        Create a RosterMatrixJson from the list returned by `to_list`
+        """
+        row_length, column_length, raw_positions = matrix_list
+        return cls(row_length, column_length,
+                   [dict(zip(HERO_POSITION_KEYS, hero_position))
+                    for hero_position in raw_positions])
+
 
 class RosterData:
     """_summary_
@@ -155,6 +335,12 @@ class RosterData:
         """
         return self.roster_json().json()
 
+    def to_list(self):
+        """
+        Convert a roster_json into the list returned by `RosterJson.to_list`
+        """
+        return self.roster_json().to_list()
+
 
 class DetectedHeroData:
     """_summary_
@@ -195,6 +381,40 @@ class DetectedHeroData:
         }
         return hero_dict
 
+    @classmethod
+    def from_dict(cls, hero_dict: dict):
+        """
+        Create a DetectedHeroData from the dictionary returned by `to_dict`
+        """
+        return cls(HeroMatchJson.from_dict(hero_dict["name"]),
+                   ModelResult.from_dict(hero_dict["signature_item"]),
+                   ModelResult.from_dict(hero_dict["furniture"]),
+                   ModelResult.from_dict(hero_dict["ascension"]),
+                   ModelResult.from_dict(hero_dict["engraving"]))
+
+    def to_list(self):
+        """
+        Convert the DetectedHeroData into a [name, signature_item,
+            furniture, ascension, engraving] list, the positional layout
+            used by the msgpack wire format
+        """
+        return [self.name.to_list(), self.signature_item.to_list(),
+                self.furniture.to_list(), self.ascension.to_list(),
+                self.engraving.to_list()]
+
+    @classmethod
+    def from_list(cls, hero_list: list):
+        """
+        Create a DetectedHeroData from the list returned by `to_list`
+        """
+        (name_list, signature_item_list, furniture_list, ascension_list,
+         engraving_list) = hero_list
+        return cls(HeroMatchJson.from_list(name_list),
+                   ModelResult.from_list(signature_item_list),
+                   ModelResult.from_list(furniture_list),
+                   ModelResult.from_list(ascension_list),
+                   ModelResult.from_list(engraving_list))
+
     def __str__(self):
         """_summary_
         """
@@ -255,6 +475,22 @@ class HeroMatchJson:
         return {"name": self.hero_name, "match_count": self.match_count,
                 "total_matches": self.total_matches}
 
+    @classmethod
+    def from_list(cls, hero_match_list: list):
+        """
+        Create a HeroMatchJson from the list returned by `to_list`
+        """
+        return HeroMatchJson(*hero_match_list)
+
+    def to_list(self):
+        """
+        Convert the HeroMatchJson into a [name, match_count, total_matches]
+            list, the positional layout used by the msgpack wire format
+        """
+        return [self.hero_name, int(self.match_count),
+                None if self.total_matches is None
+                else int(self.total_matches)]
+
     def __str__(self):
         """_summary_
         """
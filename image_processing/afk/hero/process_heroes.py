@@ -15,21 +15,30 @@ import imutils
 #   without it Module raises AttributeError
 # pylint: disable=unused-import
 from imutils import contours  # noqa
+import numpy as np
 from numpy import array, ndarray
 
 import image_processing.globals as GV
+from image_processing.load_images import CropImageInfo, crop_heroes
 from image_processing.afk.roster.dimensions_object import (DimensionsObject)
 from image_processing.afk.roster.matrix import Matrix
 from image_processing.afk.roster.RowItem import RowItem
 from image_processing.processing.types.contour_types import (
     CONTOUR_LIST, HIERARCHY_RELATIONSHIP, Contour, ImageContours)
 from image_processing.processing.image_data import SegmentResult
+from image_processing.processing.request_context import RequestContext
 from image_processing.processing.image_processing_utils import HSVRange, blur_image
 from image_processing.utils.utils import list_median
 
 # pylint: disable=invalid-name
 HERO_DICT = Dict[str, SegmentResult]
 
+# Area of a segment that is hashed, the same window hero searches start with
+#   so ascension borders, stars and SI/FI icons do not change the hash
+SEGMENT_HASH_WINDOW = CropImageInfo(0.15, 0.08, 0.25, 0.2)
+# Side length of the difference hash, each hash has SEGMENT_HASH_SIZE ** 2 bits
+SEGMENT_HASH_SIZE = 16
+
 
 class LineSegment():
     """_summary_
@@ -198,6 +207,7 @@ def get_heroes(roster_image: ndarray,  blur_args: dict,
                dimension_median_difference: int = 0.15,
                si_adjustment: int = 0.2,
                row_eliminate: int = 5,
+               context: RequestContext = None,
                ) -> Tuple[HERO_DICT, Matrix]:
     """
     Parse a screenshot or image of an AFK arena hero roster into sub
@@ -215,6 +225,9 @@ def get_heroes(roster_image: ndarray,  blur_args: dict,
             median hero shape) that are near the same size as the median
             hero detection)
         blur_args: keyword arguments for `processing.blur_image` method
+        context: request the segmentation is part of, detected heroes are
+            drawn onto its image in debug mode. Built from the global
+            variables when None
 
     Return:
         [Tuple(HERO_DICT, Ma.Matrix)]
@@ -222,6 +235,8 @@ def get_heroes(roster_image: ndarray,  blur_args: dict,
             (Ma.Matrix) of positions images were detected in
     """
 
+    if context is None:
+        context = RequestContext.from_globals()
     original_image_unmodifiable = roster_image.copy()
     hero_dict: HERO_DICT = {}
     contour_container_list: List[List[Contour]] = []
@@ -314,17 +329,17 @@ def get_heroes(roster_image: ndarray,  blur_args: dict,
                     merged_row_item.dimensions.x:
                     merged_row_item.dimensions.x2]
 
-                if GV.DEBUG:
+                if context.debug:
                     merged_vertex = merged_row_item.dimensions.coords()
-                    cv2.rectangle(GV.IMAGE_SS,
+                    cv2.rectangle(context.image,
                                   merged_vertex.vertex1(),
                                   merged_vertex.vertex2(),
                                   (255, 0, 0), 2)
             hero_dict[_hero_name] = {}
-            if GV.DEBUG:
+            if context.debug:
                 vertex_tuple = merged_row_item.dimensions.coords()
                 cv2.rectangle(
-                    GV.IMAGE_SS,
+                    context.image,
                     vertex_tuple.vertex1(),
                     vertex_tuple.vertex2(),
                     (0, 0, 0), 2)
@@ -339,3 +354,63 @@ def get_heroes(roster_image: ndarray,  blur_args: dict,
                 original_image_unmodifiable)
 
     return hero_dict, hero_matrix
+
+
+def segment_hash(image: ndarray) -> ndarray:
+    """
+    Compute the difference hash of the center of a segmented hero, every bit
+        records whether a pixel of the shrunken grayscale image is brighter
+        than the pixel to its left
+
+    Args:
+        image (ndarray): BGR image of a segmented hero
+
+    Returns:
+        ndarray: SEGMENT_HASH_SIZE ** 2 bits packed into a uint8 array
+    """
+    window = crop_heroes([image], SEGMENT_HASH_WINDOW)[0]
+    gray_image = cv2.cvtColor(window, cv2.COLOR_BGR2GRAY)
+    small_image = cv2.resize(gray_image,
+                             (SEGMENT_HASH_SIZE + 1, SEGMENT_HASH_SIZE),
+                             interpolation=cv2.INTER_AREA)
+    return np.packbits(small_image[:, 1:] > small_image[:, :-1])
+
+
+def cluster_segments(segment_list: List[SegmentResult],
+                     max_distance: int) -> Tuple[List[int], List[int]]:
+    """
+    Group near duplicate segments, such as the same hero showing up several
+        times on an ascension or copy screen, by the hamming distance
+        between their difference hashes. Each segment joins the cluster
+        with the closest representative when it is within `max_distance`
+        bits, otherwise it starts a new cluster
+
+    Args:
+        segment_list (List[SegmentResult]): segmented heroes in roster order
+        max_distance (int): largest hamming distance between the hash of a
+            segment and the hash of its cluster's representative
+
+    Returns:
+        Tuple[List[int], List[int]]: index of each cluster's representative
+            in `segment_list`, and the cluster of every segment in
+            `segment_list`
+    """
+    representative_indices: List[int] = []
+    representative_hashes: List[ndarray] = []
+    segment_clusters: List[int] = []
+    for segment_index, segment_info in enumerate(segment_list):
+        image_hash = segment_hash(segment_info.image)
+        cluster_index = None
+        if representative_hashes:
+            distances = np.unpackbits(
+                np.bitwise_xor(representative_hashes, image_hash),
+                axis=1).sum(axis=1)
+            closest_cluster = int(np.argmin(distances))
+            if distances[closest_cluster] <= max_distance:
+                cluster_index = closest_cluster
+        if cluster_index is None:
+            cluster_index = len(representative_indices)
+            representative_indices.append(segment_index)
+            representative_hashes.append(image_hash)
+        segment_clusters.append(cluster_index)
+    return representative_indices, segment_clusters
@@ -2,15 +2,14 @@ import os
 from pathlib import Path
 import re
 import time
-import pickle
 import typing
 from typing import List, Set, Union, Dict
 
-import cv2
-import dill
-
 import image_processing.globals as GV
 from image_processing.afk.hero.hero_data import HeroImage
+from image_processing.database.descriptor_index import DEFAULT_INDEX_BACKEND
+from image_processing.database.descriptor_store import (
+    load_store, refresh_store, save_store, update_store)
 from image_processing.database.image_database import build_flann
 
 
@@ -40,9 +39,60 @@ def find_images(folder_path: Path, file_dict: FilePathDict):
             file_dict[hero_name].add(file_path)
 
 
+def list_hero_images(file_dict: FilePathDict) -> List[HeroImage]:
+    """
+    Create a HeroImage for every hero portrait in `file_dict`, the portraits
+        are read later by the process extracting their features
+
+    Args:
+        file_dict (FilePathDict): dictionary of portrait file names to the
+            paths they were found at
+
+    Raises:
+        FileNotFoundError: raised when a hero_path does not exist
+
+    Returns:
+        List[HeroImage]: hero portraits sorted by file name and path so the
+            database is always built in the same order
+    """
+    hero_images: List[HeroImage] = []
+
+    for raw_hero_name, hero_path_set in sorted(file_dict.items()):
+        for hero_path in sorted(hero_path_set):
+            if not os.path.exists(hero_path):
+                raise FileNotFoundError(hero_path)
+            hero_name, *_ = re.split(r"\.", raw_hero_name)
+            hero_images.append(HeroImage(hero_name, None, hero_path))
+    return hero_images
+
+
+def find_hero_images(hero_portrait_directories: list[Path] = None
+                     ) -> List[HeroImage]:
+    """
+    Find every hero portrait in `hero_portrait_directories`
+
+    Args:
+        hero_portrait_directories (list[Path], optional): a list of directories
+            to search for hero_portraits. Defaults to
+            GV.HERO_PORTRAIT_DIRECTORIES
+
+    Returns:
+        List[HeroImage]: hero portraits that have not been read yet
+    """
+    file_dict: FilePathDict = {}
+
+    if hero_portrait_directories is None:
+        hero_portrait_directories = GV.HERO_PORTRAIT_DIRECTORIES
+
+    for hero_portrait_dir in hero_portrait_directories:
+        find_images(hero_portrait_dir, file_dict)
+    return list_hero_images(file_dict)
+
+
 def build_database(enriched_db: bool = False,
                    hero_portrait_directories: list[Path] = None,
-                   base_images: list[HeroImage] = None) -> "ImageSearch":
+                   base_images: list[HeroImage] = None,
+                   workers: int = None) -> "ImageSearch":
     """ 
     Build and save a new hero database
 
@@ -57,6 +107,8 @@ def build_database(enriched_db: bool = False,
             passed in then the detection and loading of portraits from
             `hero_portrait_directories` will be skipped, when None the images
             be auto detected from `hero_portrait_directories`. Defaults to None.
+        workers (int, optional): number of processes to read portraits and
+            extract features with. Defaults to os.cpu_count()
 
     Raises:
         FileNotFoundError: raised when a hero_path does not exist, or when an
@@ -70,62 +122,123 @@ def build_database(enriched_db: bool = False,
     start_time = time.time()
 
     if base_images is None:
-        file_dict: FilePathDict = {}
-
-        if hero_portrait_directories is None:
-            hero_portrait_directories = GV.HERO_PORTRAIT_DIRECTORIES
-
-        for hero_portrait_dir in hero_portrait_directories:
-            find_images(hero_portrait_dir, file_dict)
-        base_images: List[HeroImage] = []
-
-        for raw_hero_name, hero_path_set in file_dict.items():
-            for hero_path in hero_path_set:
-                if not os.path.exists(hero_path):
-                    raise FileNotFoundError(hero_path)
-                hero_image = cv2.imread(str(hero_path))
-                if hero_image is None:
-                    raise FileNotFoundError(
-                        f"Hero Image not found: {hero_path}")
-                hero_name, *_ = re.split(r"\.", raw_hero_name)
-                base_images.append(HeroImage(
-                    hero_name, hero_image, hero_path))
-    image_db: "ImageSearch" = build_flann(base_images,
-                                          enriched_db=enriched_db)
+        base_images = find_hero_images(hero_portrait_directories)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    image_db: "ImageSearch" = build_flann(
+        base_images, enriched_db=enriched_db, workers=workers,
+        max_keypoints=GV.MAX_KEYPOINTS,
+        keypoint_radius=GV.KEYPOINT_NMS_RADIUS,
+        index_backend=GV.IMAGE_INDEX_BACKEND or DEFAULT_INDEX_BACKEND,
+        descriptor_dimensions=GV.DESCRIPTOR_DIMENSIONS,
+        root_sift=GV.ROOT_SIFT,
+        binary_shortlist=GV.BINARY_SHORTLIST,
+        global_shortlist=GV.GLOBAL_SHORTLIST,
+        verify_candidates=GV.VERIFY_CANDIDATES)
 
+    save_store(image_db, GV.DATABASE_STORE_DIR)
     end_time = time.time()
-    with open(GV.DATABASE_PICKLE_PATH, 'wb') as handle:
-        dill.dump(image_db, handle)
     if GV.verbosity(1):
         print(f"Database built! Built in {end_time-start_time} seconds")
     return image_db
 
 
-def load_database(pickle_path: Path = GV.DATABASE_PICKLE_PATH
-                  ) -> "ImageSearch":
+def load_database(store_dir: Path = GV.DATABASE_STORE_DIR,
+                  index_backend: str = None) -> "ImageSearch":
     """
-    Load hero database from pickle file.
+    Load hero database from a descriptor store.
+
+    Args:
+        store_dir (Path, optional): directory the database was saved in.
+            Defaults to GV.DATABASE_STORE_DIR.
+        index_backend (str, optional): nearest neighbor backend to search
+            with. Defaults to GV.IMAGE_INDEX_BACKEND, or the backend the
+            database was built with when that is None.
 
     Return:
         "ImageSearch" database object
     """
-    if pickle_path.exists():
-        if GV.verbosity(1):
-            print("Loading database!")
-        start_time = time.time()
-        with open(pickle_path, 'rb') as handle:
-            image_db: "ImageSearch" = pickle.load(handle)
-        end_time = time.time()
-        if GV.verbosity(1):
-            print(
-                f"Database loaded! Loaded in {end_time - start_time} seconds")
-        image_db.matcher.train()
-
-    else:
+    if GV.verbosity(1):
+        print("Loading database!")
+    try:
+        image_db = load_store(store_dir,
+                              index_backend or GV.IMAGE_INDEX_BACKEND)
+    except FileNotFoundError as exception:
         raise FileNotFoundError(
-            f"Unable to find {GV.DATABASE_PICKLE_PATH}. Please call "
+            f"Unable to find {store_dir}. Please call "
             "image_processing.build_db.build_database to generate a new "
-            "database")
+            "database") from exception
+    return image_db
+
+
+def refresh_database(image_db: "ImageSearch" = None,
+                     store_dir: Path = GV.DATABASE_STORE_DIR
+                     ) -> "ImageSearch":
+    """
+    Apply any heroes added to or removed from the descriptor store since
+        `image_db` was loaded, falls back to loading the whole database when
+        `image_db` is None or the store was rebuilt
+
+    Args:
+        image_db (ImageSearch, optional): database previously loaded from
+            `store_dir`. Defaults to None.
+        store_dir (Path, optional): directory the database was saved in.
+            Defaults to GV.DATABASE_STORE_DIR.
+
+    Return:
+        "ImageSearch" database object
+    """
+    if image_db is None:
+        return load_database(store_dir)
+    return refresh_store(image_db, store_dir)
+
+
+def add_heroes(hero_paths: list[Path], enriched_db: bool = None,
+               store_dir: Path = GV.DATABASE_STORE_DIR) -> "ImageSearch":
+    """
+    Add hero portraits to the saved hero database without rebuilding it, only
+        the new portraits have their features extracted and indexed
+
+    Args:
+        hero_paths (list[Path]): paths to the hero portraits to add
+        enriched_db (bool, optional): flag to add every hero to the database a
+            second time with parts of the the image border removed from each
+            side. Defaults to None, adding them the same way as the heroes
+            the database was built with.
+        store_dir (Path, optional): directory the database was saved in.
+            Defaults to GV.DATABASE_STORE_DIR.
+
+    Return:
+        "ImageSearch" database object with the heroes added
+    """
+    file_dict: FilePathDict = {}
+    for hero_path in hero_paths:
+        hero_path = Path(hero_path)
+        file_dict.setdefault(hero_path.name, set()).add(hero_path)
+
+    image_db = load_database(store_dir)
+    image_db.add_heroes(list_hero_images(file_dict), enriched_db=enriched_db)
+    update_store(image_db, store_dir)
+    return image_db
+
+
+def remove_heroes(hero_names: list[str],
+                  store_dir: Path = GV.DATABASE_STORE_DIR) -> "ImageSearch":
+    """
+    Remove heroes from the saved hero database without rebuilding it
+
+    Args:
+        hero_names (list[str]): names of the heroes to remove
+        store_dir (Path, optional): directory the database was saved in.
+            Defaults to GV.DATABASE_STORE_DIR.
+
+    Return:
+        "ImageSearch" database object with the heroes removed
+    """
+    image_db = load_database(store_dir)
+    for hero_name in hero_names:
+        image_db.remove_hero(hero_name)
+    update_store(image_db, store_dir)
     return image_db
 
 
@@ -0,0 +1,180 @@
+"""
+Module containing the ORB first stage of ImageSearch
+
+ORB descriptors are 32 byte binary strings that are cheap to extract and are
+compared with the Hamming distance through a FAISS multi-hash index, an LSH
+index that hashes fixed substrings of each descriptor so it is built the same
+way every time and does not need to be saved. Voting with them
+gives a short list of candidate heroes for a segment, so the SIFT descriptors
+of the segment only need to be matched against the descriptors of those
+heroes instead of the whole database
+"""
+import copy
+import threading
+from typing import List
+
+import cv2
+import numpy as np
+from faiss import IndexBinaryMultiHash
+
+ORB_DESCRIPTOR_SIZE = 32
+# Hash tables of the multi-hash index and the bits of each table's key
+LSH_TABLE_COUNT = 6
+LSH_KEY_BITS = 12
+
+
+class BinaryPrefilter:
+    """
+    ORB descriptors of every database image in an LSH index, used to
+        shortlist the heroes a segment's SIFT descriptors are matched against
+    """
+
+    def __init__(self, shortlist_size: int = 3, min_votes: int = 10,
+                 lowes_ratio: float = 0.8, max_features: int = 500):
+        """
+        Create an empty prefilter
+
+        Args:
+            shortlist_size (int, optional): number of heroes to shortlist.
+                Defaults to 3.
+            min_votes (int, optional): ORB matches passing the ratio test a
+                segment needs before its shortlist is trusted. Defaults to 10.
+            lowes_ratio (float, optional): ratio test applied to the ORB
+                matches. Defaults to 0.8.
+            max_features (int, optional): ORB keypoints extracted from each
+                image. Defaults to 500.
+        """
+        self.shortlist_size = shortlist_size
+        self.min_votes = min_votes
+        self.lowes_ratio = lowes_ratio
+        self.max_features = max_features
+
+        self._thread_local = threading.local()
+        self._pending: List[np.ndarray] = []
+        self.descriptors = np.empty((0, ORB_DESCRIPTOR_SIZE), dtype=np.uint8)
+        # ORB descriptors of image `i` are rows offsets[i]:offsets[i + 1]
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self._index: IndexBinaryMultiHash = None
+        self.trained = False
+
+    @property
+    def extractor(self) -> cv2.ORB:
+        """
+        ORB feature extractor for the current thread
+        """
+        if not hasattr(self._thread_local, "extractor"):
+            self._thread_local.extractor = cv2.ORB_create(
+                nfeatures=self.max_features)
+        return self._thread_local.extractor
+
+    @property
+    def image_count(self) -> int:
+        """
+        Number of images in the prefilter, including queued images
+        """
+        return len(self.offsets) - 1 + len(self._pending)
+
+    def detect(self, processed_image: np.ndarray) -> np.ndarray:
+        """
+        Extract the ORB descriptors of a preprocessed image
+
+        Args:
+            processed_image (np.ndarray): image returned by
+                ImageSearch.image_pre_process
+
+        Returns:
+            np.ndarray: (n, 32) uint8 descriptors
+        """
+        _keypoints, descriptor = self.extractor.detectAndCompute(
+            processed_image, None)
+        if descriptor is None:
+            return np.empty((0, ORB_DESCRIPTOR_SIZE), dtype=np.uint8)
+        return descriptor
+
+    def copy(self) -> "BinaryPrefilter":
+        """
+        Copy of the prefilter that can be loaded or trained again without
+            changing this one, the descriptors and index are shared until they
+            are replaced
+        """
+        prefilter_copy = copy.copy(self)
+        prefilter_copy._pending = list(self._pending)
+        return prefilter_copy
+
+    def add(self, descriptor: np.ndarray):
+        """
+        Queue the ORB descriptors of the next image to be added on the next
+            call to `train`
+        """
+        if descriptor is None:
+            descriptor = np.empty((0, ORB_DESCRIPTOR_SIZE), dtype=np.uint8)
+        self._pending.append(descriptor)
+        self.trained = False
+
+    def set_descriptors(self, descriptors: np.ndarray, offsets: np.ndarray):
+        """
+        Replace the ORB descriptors of every image without training
+
+        Args:
+            descriptors (np.ndarray): (n, 32) uint8 descriptors of every
+                image, can be memory mapped
+            offsets (np.ndarray): (image_count + 1) int64 row offsets of each
+                image into `descriptors`
+        """
+        self._pending = []
+        self.descriptors = descriptors
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.trained = False
+
+    def train(self):
+        """
+        Stack any queued descriptors and build the LSH index over them
+        """
+        if self._pending:
+            sizes = [len(descriptor) for descriptor in self._pending]
+            self.offsets = np.concatenate(
+                [self.offsets, self.offsets[-1] + np.cumsum(sizes)])
+            self.descriptors = np.concatenate(
+                [self.descriptors, *self._pending]).astype(np.uint8)
+            self._pending = []
+
+        self._index = None
+        if len(self.descriptors) >= 2:
+            self._index = IndexBinaryMultiHash(
+                ORB_DESCRIPTOR_SIZE * 8, LSH_TABLE_COUNT, LSH_KEY_BITS)
+            self._index.add(np.ascontiguousarray(self.descriptors))
+        self.trained = True
+
+    def shortlist(self, query: np.ndarray, image_hero_ids: np.ndarray,
+                  live_images: np.ndarray) -> np.ndarray:
+        """
+        Vote for the hero of the closest database image of every query ORB
+            descriptor that passes the ratio test
+
+        Args:
+            query (np.ndarray): (n, 32) uint8 ORB descriptors of a segment
+            image_hero_ids (np.ndarray): hero id of every image index
+            live_images (np.ndarray): boolean mask of the image indices that
+                have not been removed
+
+        Returns:
+            np.ndarray: ids of up to `shortlist_size` heroes with the most
+                votes, None when there were fewer than `min_votes` votes
+        """
+        if self._index is None or query is None or len(query) == 0:
+            return None
+
+        distances, rows = self._index.search(np.ascontiguousarray(query), 2)
+        distances = distances.astype(np.float64)
+        # LSH can come back with fewer than 2 neighbors for a descriptor
+        good_mask = ((rows >= 0).all(axis=1) &
+                     (distances[:, 0] < self.lowes_ratio * distances[:, 1]))
+        vote_images = np.searchsorted(self.offsets, rows[good_mask, 0],
+                                      side="right") - 1
+        vote_images = vote_images[live_images[vote_images]]
+        if len(vote_images) < self.min_votes:
+            return None
+
+        votes = np.bincount(image_hero_ids[vote_images])
+        shortlist = np.argsort(-votes, kind="stable")[:self.shortlist_size]
+        return shortlist[votes[shortlist] > 0]
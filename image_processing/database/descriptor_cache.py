@@ -0,0 +1,176 @@
+"""
+Module containing a content addressed LRU cache used by ImageSearch to skip
+SIFT extraction and database lookups for segment images it has already seen
+"""
+import hashlib
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+
+def image_key(image: np.ndarray) -> str:
+    """
+    Create a key for the pixels of `image`
+
+    Args:
+        image (np.ndarray): image to hash
+
+    Returns:
+        str: hex digest of the image shape, dtype and pixels
+    """
+    image_hash = hashlib.blake2b(digest_size=16)
+    image_hash.update(f"{image.shape}{image.dtype}".encode("utf-8"))
+    image_hash.update(np.ascontiguousarray(image).data)
+    return image_hash.hexdigest()
+
+
+def entry_size(value: Any) -> int:
+    """
+    Approximate the number of bytes `value` holds in memory
+
+    Args:
+        value (Any): numpy array or tuple/list of numpy arrays
+
+    Returns:
+        int: size of value in bytes
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(
+            entry_size(sub_value) for sub_value in value)
+    return sys.getsizeof(value)
+
+
+class DescriptorCache:
+    """
+    A thread safe LRU cache bounded by the number of bytes its entries hold.
+        When a `spill_directory` is provided entries evicted from memory are
+        written to disk and read back on a later miss, so they survive
+        process restarts
+    """
+
+    def __init__(self, max_bytes: int, spill_directory: Path = None):
+        """
+        Args:
+            max_bytes (int): number of bytes the in memory entries can use
+            spill_directory (Path, optional): directory to write evicted
+                entries to, when None evicted entries are dropped.
+                Defaults to None.
+        """
+        self.max_bytes = max_bytes
+        self.spill_directory = spill_directory
+        self.entries: OrderedDict[str, tuple[Any, int]] = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if self.spill_directory is not None:
+            os.makedirs(self.spill_directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __str__(self):
+        return (f"DescriptorCache<entries={len(self.entries)}, "
+                f"bytes={self.current_bytes}/{self.max_bytes}, "
+                f"hits={self.hits}, misses={self.misses}>")
+
+    def _spill_path(self, key: str):
+        """
+        Path an entry for `key` is spilled to
+        """
+        file_name = hashlib.blake2b(key.encode("utf-8"),
+                                    digest_size=16).hexdigest()
+        return self.spill_directory.joinpath(f"{file_name}.pickle")
+
+    def get(self, key: str):
+        """
+        Fetch the value stored for `key`, checking the spill directory when
+            it is not in memory
+
+        Args:
+            key (str): key to look up
+
+        Returns:
+            Any | None: the cached value, or None on a miss
+        """
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+
+        value = None
+        if self.spill_directory is not None:
+            spill_path = self._spill_path(key)
+            try:
+                with open(spill_path, "rb") as handle:
+                    value = pickle.load(handle)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                value = None
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self.put(key, value)
+        return value
+
+    def put(self, key: str, value: Any):
+        """
+        Store `value` for `key`, evicting the least recently used entries
+            when the cache is over `max_bytes`
+
+        Args:
+            key (str): key to store value under
+            value (Any): value to store
+        """
+        value_size = entry_size(value)
+        evicted: list[tuple[str, Any]] = []
+        with self._lock:
+            if key in self.entries:
+                self.current_bytes -= self.entries.pop(key)[1]
+            if value_size <= self.max_bytes:
+                self.entries[key] = (value, value_size)
+                self.current_bytes += value_size
+            else:
+                evicted.append((key, value))
+
+            while self.current_bytes > self.max_bytes and self.entries:
+                evicted_key, (evicted_value, evicted_size) = (
+                    self.entries.popitem(last=False))
+                self.current_bytes -= evicted_size
+                evicted.append((evicted_key, evicted_value))
+
+        if self.spill_directory is not None:
+            for evicted_key, evicted_value in evicted:
+                self._spill(evicted_key, evicted_value)
+
+    def _spill(self, key: str, value: Any):
+        """
+        Write an evicted entry to the spill directory
+        """
+        spill_path = self._spill_path(key)
+        if spill_path.exists():
+            return
+        temp_path = spill_path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(temp_path, "wb") as handle:
+            pickle.dump(value, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, spill_path)
+
+    def clear(self):
+        """
+        Remove every in memory entry, spilled entries are left on disk
+        """
+        with self._lock:
+            self.entries.clear()
+            self.current_bytes = 0
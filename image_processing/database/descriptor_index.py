@@ -0,0 +1,737 @@
+"""
+Module containing the nearest neighbor index ImageSearch matches SIFT
+descriptors against
+
+The descriptors are split into IndexSegments that each search their
+descriptors with an IndexBackend, the approximate nearest neighbor library
+used can be chosen per database to trade recall for latency
+"""
+import copy
+import hashlib
+import math
+from pathlib import Path
+from typing import Dict, List, Set, Tuple, Type
+
+import cv2
+import numpy as np
+from faiss import ParameterSpace, index_factory, read_index, write_index
+
+from image_processing.database.descriptor_transform import DescriptorTransform
+
+FLANN_INDEX_KDTREE = 1
+DESCRIPTOR_DIMENSIONS = 128
+
+
+class IndexBackend:
+    """
+    Interface for an approximate nearest neighbor index over a descriptor
+        matrix. Rows returned by `search` are rows of the matrix the index was
+        built with
+    """
+    name = ""
+
+    def settings(self) -> str:
+        """
+        Identifies the backend and every parameter that changes the index it
+            builds, saved indexes are only reused when this matches
+        """
+        raise NotImplementedError
+
+    def build(self, index_data: np.ndarray):
+        """
+        Build the index over `index_data`
+
+        Args:
+            index_data (np.ndarray): (n, d) float32 descriptors
+        """
+        raise NotImplementedError
+
+    def save(self, index_path: Path):
+        """
+        Write the built index to `index_path`
+        """
+        raise NotImplementedError
+
+    def load(self, index_data: np.ndarray, index_path: Path) -> bool:
+        """
+        Load an index previously written by `save` for `index_data`
+
+        Returns:
+            bool: True when the index was loaded
+        """
+        raise NotImplementedError
+
+    def search(self, query: np.ndarray,
+               k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the `k` nearest rows of every query descriptor
+
+        Args:
+            query (np.ndarray): (n, d) float32 descriptors to search for
+            k (int): number of neighbors to return, at most the number of
+                rows the index was built with
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (n, k) int64 rows, -1 when no
+                neighbor was found, and (n, k) L2 distances
+        """
+        raise NotImplementedError
+
+
+class FlannBackend(IndexBackend):
+    """
+    Randomized KD-trees from cv2.flann_Index
+    """
+    name = "flann"
+
+    def __init__(self, index_params: dict = None, search_params: dict = None):
+        """
+        Args:
+            index_params (dict, optional): FLANN index parameters. Defaults to
+                a randomized KD-tree index with 5 trees.
+            search_params (dict, optional): FLANN search parameters. Defaults
+                to 50 checks.
+        """
+        if index_params is None:
+            index_params = {"algorithm": FLANN_INDEX_KDTREE, "trees": 5}
+        if search_params is None:
+            search_params = {"checks": 50}
+        self.index_params = index_params
+        self.search_params = search_params
+        self._index: cv2.flann_Index = None
+
+    def settings(self) -> str:
+        return f"{self.name}:{sorted(self.index_params.items())}"
+
+    def build(self, index_data: np.ndarray):
+        self._index = cv2.flann_Index(index_data, self.index_params)
+
+    def save(self, index_path: Path):
+        self._index.save(str(index_path))
+
+    def load(self, index_data: np.ndarray, index_path: Path) -> bool:
+        index = cv2.flann_Index()
+        if not index.load(index_data, str(index_path)):
+            return False
+        self._index = index
+        return True
+
+    def search(self, query: np.ndarray,
+               k: int) -> Tuple[np.ndarray, np.ndarray]:
+        rows, squared_distances = self._index.knnSearch(
+            query, k, params=self.search_params)
+        return (rows.astype(np.int64).reshape(len(query), k),
+                np.sqrt(squared_distances.reshape(len(query), k)))
+
+
+class FaissBackend(IndexBackend):
+    """
+    Base class for FAISS indexes created with `index_factory`
+    """
+
+    def __init__(self):
+        self._index = None
+
+    def index_key(self, row_count: int, dimensions: int) -> str:
+        """
+        FAISS index_factory key to build an index over `row_count` rows of
+            `dimensions` wide descriptors with
+        """
+        raise NotImplementedError
+
+    def search_parameters(self) -> Dict[str, int]:
+        """
+        FAISS parameters to set on the index before searching
+        """
+        return {}
+
+    def _set_search_parameters(self):
+        parameter_space = ParameterSpace()
+        for parameter_name, parameter_value in self.search_parameters(
+        ).items():
+            # Indexes that fell back to a flat index do not have the parameter
+            try:
+                parameter_space.set_index_parameter(
+                    self._index, parameter_name, parameter_value)
+            except RuntimeError:
+                pass
+
+    def build(self, index_data: np.ndarray):
+        row_count, dimensions = index_data.shape
+        self._index = index_factory(dimensions,
+                                    self.index_key(row_count, dimensions))
+        index_data = np.ascontiguousarray(index_data, dtype=np.float32)
+        if not self._index.is_trained:
+            self._index.train(index_data)
+        self._index.add(index_data)
+        self._set_search_parameters()
+
+    def save(self, index_path: Path):
+        write_index(self._index, str(index_path))
+
+    def load(self, index_data: np.ndarray, index_path: Path) -> bool:
+        index = read_index(str(index_path))
+        if index.ntotal != len(index_data):
+            return False
+        self._index = index
+        self._set_search_parameters()
+        return True
+
+    def search(self, query: np.ndarray,
+               k: int) -> Tuple[np.ndarray, np.ndarray]:
+        squared_distances, rows = self._index.search(query, k)
+        distances = np.sqrt(np.maximum(squared_distances, 0))
+        distances[rows < 0] = np.inf
+        return rows.astype(np.int64), distances
+
+
+class FaissHNSWBackend(FaissBackend):
+    """
+    FAISS IndexHNSWFlat, exact distances over a navigable small world graph
+    """
+    name = "hnsw"
+
+    def __init__(self, neighbors: int = 32, ef_search: int = 64):
+        """
+        Args:
+            neighbors (int, optional): graph neighbors of each descriptor.
+                Defaults to 32.
+            ef_search (int, optional): size of the candidate list while
+                searching, higher has better recall. Defaults to 64.
+        """
+        super().__init__()
+        self.neighbors = neighbors
+        self.ef_search = ef_search
+
+    def settings(self) -> str:
+        return f"{self.name}:{self.neighbors}"
+
+    def index_key(self, row_count: int, dimensions: int) -> str:
+        return f"HNSW{self.neighbors},Flat"
+
+    def search_parameters(self) -> Dict[str, int]:
+        return {"efSearch": self.ef_search}
+
+
+class FaissIVFPQBackend(FaissBackend):
+    """
+    FAISS IVF,PQ index, descriptors are bucketed by a coarse quantizer and
+        product quantized so the index is a fraction of the descriptor size
+    """
+    name = "ivfpq"
+    # Training points FAISS needs for each IVF list/PQ centroid
+    TRAINING_POINTS = 39
+    PQ_CENTROIDS = 256
+
+    def __init__(self, sub_quantizers: int = 16, n_probe: int = 16):
+        """
+        Args:
+            sub_quantizers (int, optional): number of 8 bit codes each
+                descriptor is compressed to. Defaults to 16.
+            n_probe (int, optional): number of IVF lists searched, higher has
+                better recall. Defaults to 16.
+        """
+        super().__init__()
+        self.sub_quantizers = sub_quantizers
+        self.n_probe = n_probe
+
+    def settings(self) -> str:
+        return f"{self.name}:{self.sub_quantizers}"
+
+    def index_key(self, row_count: int, dimensions: int) -> str:
+        # Small segments such as a few newly added heroes do not have enough
+        #   descriptors to train the quantizers and are searched exactly
+        if row_count < self.TRAINING_POINTS * self.PQ_CENTROIDS:
+            return "Flat"
+        list_count = min(int(4 * math.sqrt(row_count)),
+                         row_count // self.TRAINING_POINTS)
+        # Every sub quantizer needs an equal share of the dimensions
+        sub_quantizers = math.gcd(self.sub_quantizers, dimensions)
+        return f"IVF{list_count},PQ{sub_quantizers}"
+
+    def search_parameters(self) -> Dict[str, int]:
+        return {"nprobe": self.n_probe}
+
+
+INDEX_BACKENDS: Dict[str, Type[IndexBackend]] = {
+    FlannBackend.name: FlannBackend,
+    FaissHNSWBackend.name: FaissHNSWBackend,
+    FaissIVFPQBackend.name: FaissIVFPQBackend}
+DEFAULT_INDEX_BACKEND = FlannBackend.name
+
+
+def create_backend(backend_name: str = DEFAULT_INDEX_BACKEND) -> IndexBackend:
+    """
+    Create an IndexBackend from its name
+
+    Args:
+        backend_name (str, optional): one of INDEX_BACKENDS. Defaults to
+            DEFAULT_INDEX_BACKEND.
+
+    Raises:
+        ValueError: raised when `backend_name` is not a known backend
+    """
+    if backend_name not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown index backend '{backend_name}', expected "
+                         f"one of {list(INDEX_BACKENDS)}")
+    return INDEX_BACKENDS[backend_name]()
+
+
+class IndexSegment:
+    """
+    The descriptors of every image in a segment stacked into one matrix and
+        searched with an IndexBackend
+
+    The backend index can be saved and loaded again without being rebuilt.
+        Images can be removed, their descriptors stay in the descriptor
+        matrix but are left out of the backend index the next time it is built
+    """
+
+    def __init__(self, backend_name: str = DEFAULT_INDEX_BACKEND,
+                 transform: DescriptorTransform = None):
+        """
+        Create an empty segment
+
+        Args:
+            backend_name (str, optional): name of the IndexBackend to search
+                with. Defaults to DEFAULT_INDEX_BACKEND.
+            transform (DescriptorTransform, optional): transform applied to
+                descriptors before they are indexed, fit on the descriptors
+                of this segment when it is not fitted yet. Defaults to None.
+        """
+        self.backend_name = backend_name
+        self._backend = create_backend(backend_name)
+        if transform is None:
+            transform = DescriptorTransform()
+        self.transform = transform
+
+        self._pending: List[np.ndarray] = []
+        self.descriptors = np.empty((0, DESCRIPTOR_DIMENSIONS),
+                                    dtype=np.float32)
+        # Descriptors of image `i` are rows offsets[i]:offsets[i + 1]
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.removed_images: Set[int] = set()
+        self.trained = False
+        # Descriptor row of every row in the backend index, None when no
+        #   images are removed and the rows are the same
+        self._index_rows: np.ndarray = None
+        self._index_size = 0
+        # Hash of `descriptors` and `offsets`, see `descriptor_checksum`
+        self._descriptor_checksum: str = None
+
+    @property
+    def image_count(self) -> int:
+        """
+        Number of images in the index, including queued and removed images
+        """
+        return len(self.offsets) - 1 + len(self._pending)
+
+    def add(self, descriptor: np.ndarray):
+        """
+        Queue the descriptors of a single image to be added on the next call
+            to `train`
+
+        Args:
+            descriptor (np.ndarray): (n, 128) descriptors of an image, None
+                when the image had no keypoints
+        """
+        if descriptor is None:
+            descriptor = np.empty((0, DESCRIPTOR_DIMENSIONS), dtype=np.float32)
+        self._pending.append(descriptor)
+        self.trained = False
+
+    def copy(self) -> "IndexSegment":
+        """
+        Copy of the segment that can have images removed and its index
+            rebuilt or loaded without changing this segment, the descriptors
+            and the current backend index are shared until they are replaced
+        """
+        segment_copy = copy.copy(self)
+        # Backends replace their index when building or loading instead of
+        #   changing it, so a shallow copy keeps this segment's index intact
+        segment_copy._backend = copy.copy(self._backend)
+        segment_copy._pending = list(self._pending)
+        segment_copy.removed_images = set(self.removed_images)
+        return segment_copy
+
+    def remove_image(self, image_index: int):
+        """
+        Exclude the image at `image_index` from search results, the index
+            needs to be trained again before searching
+        """
+        self.removed_images.add(image_index)
+        self.trained = False
+
+    def image_descriptors(self, image_index: int) -> np.ndarray:
+        """
+        Get the descriptors of the image at `image_index`
+        """
+        return self.descriptors[self.offsets[image_index]:
+                                self.offsets[image_index + 1]]
+
+    def set_descriptors(self, descriptors: np.ndarray, offsets: np.ndarray,
+                        removed_images: Set[int] = None):
+        """
+        Replace every descriptor in the segment without training it
+
+        Args:
+            descriptors (np.ndarray): (n, 128) float32 descriptors of every
+                image, can be memory mapped
+            offsets (np.ndarray): (image_count + 1) int64 row offsets of each
+                image into `descriptors`
+            removed_images (Set[int], optional): images to exclude from search
+                results. Defaults to None.
+        """
+        self._pending = []
+        self.descriptors = descriptors
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.removed_images = set(removed_images or ())
+        self.trained = False
+        self._index_size = 0
+        self._descriptor_checksum = None
+
+    def _fit_transform(self):
+        """
+        Fit the transform on the descriptors of this segment when no other
+            segment sharing it has fit it yet
+        """
+        if not self.transform.fitted:
+            self.transform.fit(self.descriptors)
+
+    def descriptor_checksum(self) -> str:
+        """
+        Hash the descriptors and offsets of the segment, computed once since
+            they never change after the queued descriptors are added
+
+        Returns:
+            str: hex digest identifying the descriptors
+        """
+        if self._descriptor_checksum is None:
+            descriptor_hash = hashlib.blake2b(digest_size=16)
+            descriptor_hash.update(np.ascontiguousarray(self.offsets).data)
+            descriptor_hash.update(
+                np.ascontiguousarray(self.descriptors).data)
+            self._descriptor_checksum = descriptor_hash.hexdigest()
+        return self._descriptor_checksum
+
+    def checksum(self) -> str:
+        """
+        Hash the descriptors, offsets, removed images, transform and backend
+            settings, a saved index is only valid for the exact data it was
+            trained on
+
+        Returns:
+            str: hex digest identifying the index contents
+        """
+        self._fit_transform()
+        index_hash = hashlib.blake2b(digest_size=16)
+        index_hash.update(self._backend.settings().encode("utf-8"))
+        index_hash.update(self.transform.checksum().encode("utf-8"))
+        index_hash.update(f"{sorted(self.removed_images)}".encode("utf-8"))
+        index_hash.update(np.ascontiguousarray(self.offsets).data)
+        index_hash.update(np.ascontiguousarray(self.descriptors).data)
+        return index_hash.hexdigest()
+
+    def _index_data(self) -> np.ndarray:
+        """
+        Stack any queued descriptors and transform the descriptor rows of
+            every image that has not been removed
+
+        Returns:
+            np.ndarray: descriptors the backend index is built over
+        """
+        if self._pending:
+            sizes = [len(descriptor) for descriptor in self._pending]
+            self.offsets = np.concatenate(
+                [self.offsets, self.offsets[-1] + np.cumsum(sizes)])
+            self.descriptors = np.concatenate(
+                [self.descriptors, *self._pending]).astype(np.float32)
+            self._pending = []
+            self._descriptor_checksum = None
+        if len(self.descriptors) > 0:
+            self._fit_transform()
+
+        self._index_rows = None
+        if not self.removed_images:
+            return self.transform.apply(self.descriptors)
+        live_rows = np.ones(len(self.descriptors), dtype=bool)
+        for image_index in self.removed_images:
+            live_rows[self.offsets[image_index]:
+                      self.offsets[image_index + 1]] = False
+        self._index_rows = np.flatnonzero(live_rows)
+        return self.transform.apply(self.descriptors[self._index_rows])
+
+    def train(self):
+        """
+        Build the backend index over the descriptors of every image that has
+            not been removed
+        """
+        index_data = self._index_data()
+        self._index_size = len(index_data)
+        if self._index_size > 0:
+            self._backend.build(index_data)
+        self.trained = True
+
+    def save(self, index_path: Path):
+        """
+        Write the trained backend index to `index_path`, the descriptors
+            themselves are saved separately
+        """
+        if self._index_size > 0:
+            self._backend.save(index_path)
+
+    def load(self, index_path: Path) -> bool:
+        """
+        Load a backend index previously written by `save` for the current
+            descriptors
+
+        Args:
+            index_path (Path): path the index was saved to
+
+        Returns:
+            bool: True when the index was loaded, False when it needs to be
+                rebuilt with `train`
+        """
+        index_data = self._index_data()
+        self._index_size = 0
+        if len(index_data) > 0:
+            if not Path(index_path).exists():
+                return False
+            if not self._backend.load(index_data, index_path):
+                return False
+        self._index_size = len(index_data)
+        self.trained = True
+        return True
+
+    def knn_search(self, query: np.ndarray,
+                   k: int = 2) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Find the `k` nearest database descriptors of every query descriptor
+
+        Args:
+            query (np.ndarray): (n, d) float32 descriptors to search for,
+                already passed through the segment's transform
+            k (int, optional): number of neighbors to return. Defaults to 2.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: (n, k) L2 distances,
+                (n, k) image index and (n, k) descriptor index inside of that
+                image for each neighbor. Missing neighbors have an infinite
+                distance
+        """
+        distances = np.full((len(query), k), np.inf, dtype=np.float32)
+        image_indices = np.zeros((len(query), k), dtype=np.int64)
+        train_indices = np.zeros((len(query), k), dtype=np.int64)
+        if self._index_size == 0 or len(query) == 0:
+            return distances, image_indices, train_indices
+
+        neighbor_count = min(k, self._index_size)
+        rows, neighbor_distances = self._backend.search(
+            np.ascontiguousarray(query, dtype=np.float32), neighbor_count)
+        found = rows >= 0
+        rows = np.where(found, rows, 0)
+        if self._index_rows is not None:
+            rows = self._index_rows[rows]
+        neighbor_images = np.searchsorted(self.offsets, rows,
+                                          side="right") - 1
+        distances[:, :neighbor_count] = np.where(found, neighbor_distances,
+                                                 np.inf)
+        image_indices[:, :neighbor_count] = neighbor_images
+        train_indices[:, :neighbor_count] = (
+            rows - self.offsets[neighbor_images])
+        return distances, image_indices, train_indices
+
+
+class SegmentedIndex:
+    """
+    A list of IndexSegments searched together, the first segment holds the
+        images the database was built with and every later segment holds a
+        batch of images added afterwards. Adding or removing images only
+        rebuilds the segments they belong to
+
+    Image indices are global, the images of segment `s` come right after the
+        images of segment `s - 1`
+    """
+
+    def __init__(self, backend_name: str = DEFAULT_INDEX_BACKEND,
+                 transform: DescriptorTransform = None):
+        """
+        Create an index without any segments
+
+        Args:
+            backend_name (str, optional): name of the IndexBackend new
+                segments search with. Defaults to DEFAULT_INDEX_BACKEND.
+            transform (DescriptorTransform, optional): transform shared by
+                every segment, fit on the first segment that is trained.
+                Defaults to None.
+        """
+        create_backend(backend_name)
+        self.backend_name = backend_name
+        if transform is None:
+            transform = DescriptorTransform()
+        self.transform = transform
+        self.segments: List[IndexSegment] = []
+
+    def copy(self) -> "SegmentedIndex":
+        """
+        Copy of the index whose segments can be changed without changing this
+            index, see IndexSegment.copy
+        """
+        index_copy = SegmentedIndex(self.backend_name, self.transform)
+        index_copy.segments = [segment.copy() for segment in self.segments]
+        return index_copy
+
+    def new_segment(self) -> IndexSegment:
+        """
+        Append an empty segment, images added after this go into it
+        """
+        segment = IndexSegment(self.backend_name, self.transform)
+        self.segments.append(segment)
+        return segment
+
+    def segment_starts(self) -> np.ndarray:
+        """
+        Global index of the first image in every segment
+        """
+        return np.cumsum(
+            [0] + [segment.image_count for segment in self.segments[:-1]],
+            dtype=np.int64)
+
+    def _locate(self, image_index: int) -> Tuple[IndexSegment, int]:
+        """
+        Find the segment holding `image_index` and its index in that segment
+        """
+        segment_starts = self.segment_starts()
+        segment_index = np.searchsorted(segment_starts, image_index,
+                                        side="right") - 1
+        return (self.segments[segment_index],
+                image_index - segment_starts[segment_index])
+
+    def add(self, descriptor: np.ndarray):
+        """
+        Queue the descriptors of a single image, a new segment is started when
+            the last segment has already been trained
+
+        Args:
+            descriptor (np.ndarray): (n, 128) descriptors of an image
+        """
+        if not self.segments or self.segments[-1].trained:
+            self.new_segment()
+        self.segments[-1].add(descriptor)
+
+    def remove_image(self, image_index: int):
+        """
+        Exclude the image at global `image_index` from search results
+        """
+        segment, segment_image_index = self._locate(image_index)
+        segment.remove_image(segment_image_index)
+
+    def is_removed(self, image_index: int) -> bool:
+        """
+        Check if the image at global `image_index` was removed
+        """
+        segment, segment_image_index = self._locate(image_index)
+        return segment_image_index in segment.removed_images
+
+    def train(self):
+        """
+        Build the backend index of every segment that changed since it was
+            last trained
+        """
+        for segment in self.segments:
+            if not segment.trained:
+                segment.train()
+
+    def knn_search(self, query: np.ndarray,
+                   k: int = 2) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Find the `k` nearest database descriptors of every query descriptor
+            across all segments
+
+        Args:
+            query (np.ndarray): (n, 128) float32 descriptors to search for
+            k (int, optional): number of neighbors to return. Defaults to 2.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: (n, k) L2 distances,
+                (n, k) global image index and (n, k) descriptor index inside
+                of that image for each neighbor
+        """
+        if len(self.segments) == 0:
+            return IndexSegment(self.backend_name).knn_search(query, k)
+        query = self.transform.apply(query)
+        if len(self.segments) == 1:
+            return self.segments[0].knn_search(query, k)
+
+        segment_results = [segment.knn_search(query, k)
+                           for segment in self.segments]
+        distances = np.hstack([result[0] for result in segment_results])
+        image_indices = np.hstack(
+            [result[1] + segment_start for result, segment_start in
+             zip(segment_results, self.segment_starts())])
+        train_indices = np.hstack([result[2] for result in segment_results])
+
+        nearest = np.argsort(distances, axis=1, kind="stable")[:, :k]
+        return (np.take_along_axis(distances, nearest, axis=1),
+                np.take_along_axis(image_indices, nearest, axis=1),
+                np.take_along_axis(train_indices, nearest, axis=1))
+
+    def knn_search_images(self, query: np.ndarray, image_indices: np.ndarray,
+                          k: int = 2
+                          ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Find the `k` nearest descriptors of every query descriptor among the
+            descriptors of the images at `image_indices` only, with an exact
+            brute force search instead of the segment indexes
+
+        Args:
+            query (np.ndarray): (n, 128) float32 descriptors to search for
+            image_indices (np.ndarray): global indices of the images to search
+            k (int, optional): number of neighbors to return. Defaults to 2.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: (n, k) L2 distances,
+                (n, k) global image index and (n, k) descriptor index inside
+                of that image for each neighbor. Missing neighbors have an
+                infinite distance
+        """
+        segment_starts = self.segment_starts()
+        image_descriptors = []
+        for image_index in image_indices:
+            segment_index = np.searchsorted(segment_starts, image_index,
+                                            side="right") - 1
+            image_descriptors.append(
+                self.segments[segment_index].image_descriptors(
+                    image_index - segment_starts[segment_index]))
+        image_sizes = [len(descriptor) for descriptor in image_descriptors]
+        row_count = sum(image_sizes)
+
+        distances = np.full((len(query), k), np.inf, dtype=np.float32)
+        neighbor_images = np.zeros((len(query), k), dtype=np.int64)
+        train_indices = np.zeros((len(query), k), dtype=np.int64)
+        if row_count == 0 or len(query) == 0:
+            return distances, neighbor_images, train_indices
+
+        database = self.transform.apply(np.concatenate(image_descriptors))
+        query = self.transform.apply(query)
+        row_images = np.repeat(np.asarray(image_indices, dtype=np.int64),
+                               image_sizes)
+        row_offsets = np.arange(row_count) - np.repeat(
+            np.cumsum([0] + image_sizes[:-1]), image_sizes)
+
+        # |q - d|^2 without the |q|^2 term, which does not change the order
+        #   of a query's neighbors and is added back to the nearest ones
+        partial_distances = (
+            np.einsum("ij,ij->i", database, database)[None] -
+            2 * query @ database.T)
+        query_norms = np.einsum("ij,ij->i", query, query)
+        query_rows = np.arange(len(query))
+        # k is small, repeated argmin is cheaper than a partition of every row
+        for neighbor in range(min(k, row_count)):
+            nearest = partial_distances.argmin(axis=1)
+            distances[:, neighbor] = np.sqrt(np.maximum(
+                partial_distances[query_rows, nearest] + query_norms, 0))
+            neighbor_images[:, neighbor] = row_images[nearest]
+            train_indices[:, neighbor] = row_offsets[nearest]
+            partial_distances[query_rows, nearest] = np.inf
+        return distances, neighbor_images, train_indices
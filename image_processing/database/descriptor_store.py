@@ -0,0 +1,555 @@
+"""
+Module for saving and loading an ImageSearch database as a versioned on disk
+store instead of a pickle
+
+A store is a directory containing
+    manifest.json: format version, store id, lowes ratio, keypoint cap, index
+        backend, descriptor transform settings, whether the database is
+        enriched, every index segment and the hero name, path, crop state and
+        removed state of every image index
+    transform.npz: PCA projection fit on the descriptors of the first
+        segment, only written when the database projects its descriptors
+    binary_descriptors.npy, binary_offsets.npy: ORB descriptors of every
+        image and their per image row offsets, only written when the database
+        has a BinaryPrefilter
+    global_descriptors.npy: (image_count, d) float32 global descriptor of
+        every image, only written when the database has a GlobalPrefilter
+    keypoints.npy, keypoint_offsets.npy: position of every SIFT descriptor
+        and their per image row offsets, only written when the database has
+        a GeometricVerifier
+    segment_<n>/: one directory for each index segment, holding
+        descriptors.npy: every SIFT descriptor in the segment as one
+            contiguous (n, 128) float32 matrix before it is transformed,
+            memory mapped when loaded
+        offsets.npy: (image_count + 1) int64 array, the descriptors of image
+            `i` in the segment are rows offsets[i]:offsets[i + 1]
+        index_<checksum>.<backend>: trained index of the segment's
+            IndexBackend, only valid for the descriptors, removed images and
+            backend settings matching the checksum
+
+The first segment holds the images the store was built with. Heroes added
+afterwards are appended as new segments and removed heroes are tombstoned in
+the manifest, so updating the store only writes what changed
+"""
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+import image_processing.globals as GV
+from image_processing.afk.hero.hero_data import HeroImage
+from image_processing.database.descriptor_index import (
+    DEFAULT_INDEX_BACKEND, IndexSegment)
+from image_processing.database.image_database import ImageSearch
+
+STORE_VERSION = 2
+
+DESCRIPTORS_FILE = "descriptors.npy"
+OFFSETS_FILE = "offsets.npy"
+TRANSFORM_FILE = "transform.npz"
+BINARY_DESCRIPTORS_FILE = "binary_descriptors.npy"
+BINARY_OFFSETS_FILE = "binary_offsets.npy"
+GLOBAL_DESCRIPTORS_FILE = "global_descriptors.npy"
+KEYPOINTS_FILE = "keypoints.npy"
+KEYPOINT_OFFSETS_FILE = "keypoint_offsets.npy"
+MANIFEST_FILE = "manifest.json"
+
+
+class StoreVersionException(Exception):
+    """
+    Raised when a descriptor store was written with an unsupported format
+        version
+    """
+
+
+def index_file_name(index_checksum: str, backend_name: str) -> str:
+    """
+    Name of the file the `backend_name` index with `index_checksum` is saved
+        in
+    """
+    return f"index_{index_checksum}.{backend_name}"
+
+
+def read_manifest(store_dir: Path) -> dict:
+    """
+    Read and validate the manifest of the store in `store_dir`
+
+    Raises:
+        FileNotFoundError: raised when `store_dir` does not contain a store
+        StoreVersionException: raised when the store was written by an
+            incompatible version
+    """
+    manifest_path = Path(store_dir).joinpath(MANIFEST_FILE)
+    if not manifest_path.exists():
+        raise FileNotFoundError(manifest_path)
+    with open(manifest_path, "r", encoding="utf-8") as manifest_file:
+        manifest: dict = json.load(manifest_file)
+    if manifest.get("version") != STORE_VERSION:
+        raise StoreVersionException(
+            f"Descriptor store {store_dir} has version "
+            f"{manifest.get('version')}, expected {STORE_VERSION}")
+    return manifest
+
+
+def _temp_path(file_path: Path) -> Path:
+    """
+    Unique hidden path next to `file_path` to write it to before it is moved
+        into place, so processes writing the same file do not share a
+        temporary file and a reader never sees a partially written one
+    """
+    return file_path.with_name(f".{file_path.name}.{uuid.uuid4().hex}.tmp")
+
+
+def write_manifest(store_dir: Path, manifest: dict):
+    """
+    Atomically replace the manifest of the store in `store_dir`
+    """
+    manifest_path = Path(store_dir).joinpath(MANIFEST_FILE)
+    temp_path = _temp_path(manifest_path)
+    with open(temp_path, "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(temp_path, manifest_path)
+
+
+def _write_segment(segment: IndexSegment, segment_dir: Path) -> dict:
+    """
+    Write the parts of `segment` that are not already in `segment_dir`. The
+        descriptors of a segment never change once it is trained, only its
+        index is rebuilt when images are removed
+
+    Returns:
+        dict: manifest entry of the segment
+    """
+    segment_dir.mkdir(parents=True, exist_ok=True)
+    if not segment_dir.joinpath(DESCRIPTORS_FILE).exists():
+        _save_array(segment_dir, OFFSETS_FILE, segment.offsets)
+        _save_array(segment_dir, DESCRIPTORS_FILE, segment.descriptors)
+
+    index_checksum = segment.checksum()
+    index_path = segment_dir.joinpath(
+        index_file_name(index_checksum, segment.backend_name))
+    if not index_path.exists():
+        _save_index(segment, index_path)
+    return {"directory": segment_dir.name,
+            "index_backend": segment.backend_name,
+            "image_count": segment.image_count,
+            "descriptor_count": len(segment.descriptors),
+            "index_checksum": index_checksum}
+
+
+def _save_array(store_dir: Path, file_name: str, array: np.ndarray):
+    """
+    Atomically replace `file_name` in `store_dir` with `array`
+    """
+    file_path = store_dir.joinpath(file_name)
+    temp_path = _temp_path(file_path)
+    with open(temp_path, "wb") as array_file:
+        np.save(array_file, array)
+    os.replace(temp_path, file_path)
+
+
+def _save_index(segment: IndexSegment, index_path: Path):
+    """
+    Atomically write the trained index of `segment` to `index_path`, several
+        worker processes can rebuild and save the same index while another
+        process is loading it
+    """
+    temp_path = _temp_path(index_path)
+    segment.save(temp_path)
+    # Segments without any live descriptors have no index to save
+    if temp_path.exists():
+        os.replace(temp_path, index_path)
+
+
+def _stored_rows(store_dir: Path, file_name: str) -> int:
+    """
+    Number of rows in the array saved as `file_name`, -1 when it is missing
+    """
+    file_path = store_dir.joinpath(file_name)
+    if not file_path.exists():
+        return -1
+    return len(np.load(file_path, mmap_mode="r"))
+
+
+def _write_prefilters(image_db: ImageSearch, store_dir: Path):
+    """
+    Write the descriptors of the BinaryPrefilter and GlobalPrefilter, and
+        the keypoints of the GeometricVerifier, of `image_db` that are not
+        already in `store_dir`. The files cover every segment so they are
+        replaced as a whole, offsets are replaced after the rows they index
+    """
+    binary_prefilter = image_db.binary_prefilter
+    if (binary_prefilter is not None and
+            _stored_rows(store_dir, BINARY_OFFSETS_FILE) !=
+            len(binary_prefilter.offsets)):
+        _save_array(store_dir, BINARY_DESCRIPTORS_FILE,
+                    binary_prefilter.descriptors)
+        _save_array(store_dir, BINARY_OFFSETS_FILE, binary_prefilter.offsets)
+
+    global_prefilter = image_db.global_prefilter
+    if (global_prefilter is not None and
+            _stored_rows(store_dir, GLOBAL_DESCRIPTORS_FILE) !=
+            len(global_prefilter.descriptors)):
+        _save_array(store_dir, GLOBAL_DESCRIPTORS_FILE,
+                    global_prefilter.descriptors)
+
+    verifier = image_db.verifier
+    if (verifier is not None and
+            _stored_rows(store_dir, KEYPOINT_OFFSETS_FILE) !=
+            len(verifier.offsets)):
+        _save_array(store_dir, KEYPOINTS_FILE, verifier.keypoints)
+        _save_array(store_dir, KEYPOINT_OFFSETS_FILE, verifier.offsets)
+
+
+def _load_prefilters(image_db: ImageSearch, store_dir: Path):
+    """
+    Load and train the BinaryPrefilter and GlobalPrefilter, and the keypoints
+        of the GeometricVerifier, of `image_db` from `store_dir`. A stage is
+        disabled when the store does not have its data for every image
+    """
+    image_count = len(image_db.index_lookup)
+    if image_db.binary_prefilter is not None:
+        if _stored_rows(store_dir, BINARY_OFFSETS_FILE) != image_count + 1:
+            if GV.verbosity(1):
+                print(f"Disabling binary prefilter, {store_dir} does not "
+                      "have ORB descriptors for every image")
+            image_db.binary_prefilter = None
+        else:
+            image_db.binary_prefilter.set_descriptors(
+                np.load(store_dir.joinpath(BINARY_DESCRIPTORS_FILE),
+                        mmap_mode="r"),
+                np.load(store_dir.joinpath(BINARY_OFFSETS_FILE)))
+            image_db.binary_prefilter.train()
+
+    if image_db.global_prefilter is not None:
+        if _stored_rows(store_dir, GLOBAL_DESCRIPTORS_FILE) != image_count:
+            if GV.verbosity(1):
+                print(f"Disabling global prefilter, {store_dir} does not "
+                      "have global descriptors for every image")
+            image_db.global_prefilter = None
+        else:
+            image_db.global_prefilter.set_descriptors(
+                np.load(store_dir.joinpath(GLOBAL_DESCRIPTORS_FILE)))
+            image_db.global_prefilter.train()
+
+    if image_db.verifier is not None:
+        if _stored_rows(store_dir, KEYPOINT_OFFSETS_FILE) != image_count + 1:
+            if GV.verbosity(1):
+                print(f"Disabling geometric verification, {store_dir} does "
+                      "not have keypoints for every image")
+            image_db.verifier = None
+        else:
+            image_db.verifier.set_keypoints(
+                np.load(store_dir.joinpath(KEYPOINTS_FILE), mmap_mode="r"),
+                np.load(store_dir.joinpath(KEYPOINT_OFFSETS_FILE)))
+
+
+def _build_manifest(image_db: ImageSearch,
+                    segment_entries: List[dict]) -> dict:
+    """
+    Create the manifest describing `image_db`
+    """
+    images = []
+    for hero_index in range(len(image_db.index_lookup)):
+        hero_record = image_db.index_lookup[hero_index].hero_index_lookup[
+            hero_index]
+        images.append({"name": hero_record.name,
+                       "path": str(hero_record.image_path),
+                       "cropped": image_db.cropped_images[hero_index],
+                       "removed": image_db.matcher.is_removed(hero_index)})
+    return {"version": STORE_VERSION,
+            "store_id": image_db.store_id,
+            "ratio": image_db.ratio,
+            "max_keypoints": image_db.max_keypoints,
+            "keypoint_radius": image_db.keypoint_radius,
+            "index_backend": image_db.matcher.backend_name,
+            "descriptor_dimensions": image_db.matcher.transform.dimensions,
+            "root_sift": image_db.matcher.transform.root_sift,
+            "binary_shortlist": image_db.binary_shortlist,
+            "global_shortlist": image_db.global_shortlist,
+            "verify_candidates": image_db.verify_candidates,
+            "enriched_db": image_db.enriched_db,
+            "descriptor_count": sum(segment_entry["descriptor_count"]
+                                    for segment_entry in segment_entries),
+            "segments": segment_entries,
+            "images": images}
+
+
+def save_store(image_db: ImageSearch, store_dir: Path):
+    """
+    Write all of `image_db` to `store_dir` as a new store, the store is
+        written to a temporary directory first and then moved into place so a
+        reader never sees a partially written store
+
+    Args:
+        image_db (ImageSearch): database to save
+        store_dir (Path): directory to save the store in
+    """
+    store_dir = Path(store_dir)
+    temp_dir = store_dir.with_name(f"{store_dir.name}.tmp")
+    old_dir = store_dir.with_name(f"{store_dir.name}.old")
+    for stale_dir in (temp_dir, old_dir):
+        if stale_dir.exists():
+            shutil.rmtree(stale_dir)
+    temp_dir.mkdir(parents=True)
+
+    image_db.store_id = uuid.uuid4().hex
+    segment_entries = [
+        _write_segment(segment,
+                       temp_dir.joinpath(f"segment_{segment_index:03d}"))
+        for segment_index, segment in enumerate(image_db.matcher.segments)]
+    image_db.matcher.transform.save(temp_dir.joinpath(TRANSFORM_FILE))
+    _write_prefilters(image_db, temp_dir)
+    write_manifest(temp_dir, _build_manifest(image_db, segment_entries))
+
+    if store_dir.exists():
+        os.replace(store_dir, old_dir)
+    os.replace(temp_dir, store_dir)
+    if old_dir.exists():
+        shutil.rmtree(old_dir)
+
+
+def update_store(image_db: ImageSearch, store_dir: Path):
+    """
+    Write the changes made to `image_db` since it was loaded from or saved to
+        `store_dir`. New segments are appended, the indexes of segments with
+        removed images are written next to the old ones and the manifest is
+        replaced last, so a reader sees either the old or the new store
+
+    When `image_db` did not come from `store_dir` the whole store is
+        rewritten with `save_store`
+
+    Args:
+        image_db (ImageSearch): database to save
+        store_dir (Path): directory of the store `image_db` was loaded from
+    """
+    store_dir = Path(store_dir)
+    try:
+        manifest = read_manifest(store_dir)
+    except (FileNotFoundError, StoreVersionException):
+        manifest = {}
+    if (not manifest or manifest["store_id"] != image_db.store_id or
+            len(manifest["segments"]) > len(image_db.matcher.segments)):
+        save_store(image_db, store_dir)
+        return
+
+    segment_entries = []
+    for segment_index, segment in enumerate(image_db.matcher.segments):
+        segment_dir = store_dir.joinpath(f"segment_{segment_index:03d}")
+        # Left over from an update that never wrote its manifest
+        if segment_index >= len(manifest["segments"]) and segment_dir.exists():
+            shutil.rmtree(segment_dir)
+        segment_entries.append(_write_segment(segment, segment_dir))
+    if not store_dir.joinpath(TRANSFORM_FILE).exists():
+        image_db.matcher.transform.save(store_dir.joinpath(TRANSFORM_FILE))
+    _write_prefilters(image_db, store_dir)
+    write_manifest(store_dir, _build_manifest(image_db, segment_entries))
+
+    for segment_entry in segment_entries:
+        current_index = index_file_name(segment_entry["index_checksum"],
+                                        image_db.matcher.backend_name)
+        for index_path in store_dir.joinpath(
+                segment_entry["directory"]).glob(index_file_name("*", "*")):
+            if index_path.name != current_index:
+                index_path.unlink()
+
+
+def _load_segments(image_db: ImageSearch, manifest: dict, store_dir: Path,
+                   first_segment: int = 0) -> bool:
+    """
+    Add the images and index segments in `manifest` starting at
+        `first_segment` to `image_db`
+
+    Returns:
+        bool: True when a stale index had to be rebuilt and the manifest was
+            updated
+    """
+    image_records: List[Dict] = manifest["images"]
+    segment_entries: List[Dict] = manifest["segments"]
+    manifest_changed = False
+
+    image_start = sum(segment_entry["image_count"] for segment_entry in
+                      segment_entries[:first_segment])
+    for segment_entry in segment_entries[first_segment:]:
+        segment_dir = store_dir.joinpath(segment_entry["directory"])
+        segment_records = image_records[
+            image_start:image_start + segment_entry["image_count"]]
+
+        for image_record in segment_records:
+            hero_info = HeroImage(image_record["name"], None,
+                                  Path(image_record["path"]), clean_name=False)
+            image_db.register_image(hero_info, image_record["cropped"])
+
+        segment = image_db.matcher.new_segment()
+        segment.set_descriptors(
+            np.load(segment_dir.joinpath(DESCRIPTORS_FILE), mmap_mode="r"),
+            np.load(segment_dir.joinpath(OFFSETS_FILE)))
+        for image_offset, image_record in enumerate(segment_records):
+            if image_record["removed"]:
+                image_db.tombstone_image(image_start + image_offset)
+
+        manifest_changed |= _load_segment_index(segment, segment_entry,
+                                                segment_dir)
+        image_start += segment_entry["image_count"]
+    return manifest_changed
+
+
+def _load_segment_index(segment: IndexSegment, segment_entry: dict,
+                        segment_dir: Path) -> bool:
+    """
+    Load the saved index of `segment` when one was built from the exact
+        descriptors, removed images and backend settings of the segment,
+        otherwise build and save it
+
+    Returns:
+        bool: True when the index of the store's own backend was rebuilt and
+            `segment_entry` was updated
+    """
+    index_checksum = segment.checksum()
+    index_path = segment_dir.joinpath(
+        index_file_name(index_checksum, segment.backend_name))
+    if index_path.exists() and segment.load(index_path):
+        return False
+
+    if GV.verbosity(1):
+        print(f"Building {segment.backend_name} index in {segment_dir}")
+    segment.train()
+    _save_index(segment, index_path)
+    if segment_entry["index_checksum"] == index_checksum:
+        return False
+    # Indexes of a backend selected at load time are saved next to the
+    #   store's own index but are not recorded in the manifest
+    if segment.backend_name != segment_entry.get("index_backend",
+                                                 segment.backend_name):
+        return False
+    segment_entry["index_checksum"] = index_checksum
+    return True
+
+
+def load_store(store_dir: Path, index_backend: str = None) -> ImageSearch:
+    """
+    Load an ImageSearch database from `store_dir`, descriptors are memory
+        mapped and hero portraits are not loaded
+
+    Args:
+        store_dir (Path): directory the store was saved in
+        index_backend (str, optional): IndexBackend to search with, an index
+            is built for it the first time a store is loaded with a backend
+            other than the one it was built with. Defaults to the backend the
+            store was built with.
+
+    Raises:
+        FileNotFoundError: raised when `store_dir` does not contain a store
+        StoreVersionException: raised when the store was written by an
+            incompatible version
+
+    Returns:
+        ImageSearch: database with its trained index
+    """
+    store_dir = Path(store_dir)
+    start_time = time.time()
+    manifest = read_manifest(store_dir)
+
+    if index_backend is None:
+        index_backend = manifest.get("index_backend", DEFAULT_INDEX_BACKEND)
+
+    image_db = ImageSearch(lowes_ratio=manifest["ratio"],
+                           max_keypoints=manifest.get("max_keypoints"),
+                           keypoint_radius=manifest.get("keypoint_radius", 0.0),
+                           index_backend=index_backend,
+                           descriptor_dimensions=manifest.get(
+                               "descriptor_dimensions"),
+                           root_sift=manifest.get("root_sift", False),
+                           binary_shortlist=manifest.get("binary_shortlist"),
+                           global_shortlist=manifest.get("global_shortlist"),
+                           verify_candidates=manifest.get("verify_candidates"),
+                           enriched_db=manifest.get("enriched_db", any(
+                               image_record["cropped"] for image_record in
+                               manifest["images"])))
+    image_db.store_id = manifest["store_id"]
+    # A missing projection is fit again on the first segment, which
+    #   rebuilds the segment indexes when it does not match the saved one
+    image_db.matcher.transform.load(store_dir.joinpath(TRANSFORM_FILE))
+    if _load_segments(image_db, manifest, store_dir):
+        write_manifest(store_dir, manifest)
+    _load_prefilters(image_db, store_dir)
+    image_db.update_hero_ids()
+
+    if GV.verbosity(1):
+        print(f"Loaded {len(manifest['images'])} images and "
+              f"{manifest['descriptor_count']} descriptors from {store_dir} "
+              f"in {time.time() - start_time} seconds")
+    return image_db
+
+
+def refresh_store(image_db: ImageSearch, store_dir: Path) -> ImageSearch:
+    """
+    Apply the changes made to the store in `store_dir` since `image_db` was
+        loaded. Appended segments are loaded and newly removed images are
+        tombstoned, only the indexes of segments that changed are loaded
+        again
+
+    The changes are applied to a copy of `image_db` that is returned once
+        every change was applied, so searches still running on `image_db`
+        are not affected and `image_db` is left unchanged when refreshing
+        fails. When the store was rebuilt or changed in a way that cannot be
+        applied incrementally the whole store is loaded again
+
+    Args:
+        image_db (ImageSearch): database previously loaded from `store_dir`
+        store_dir (Path): directory the store was saved in
+
+    Returns:
+        ImageSearch: copy of `image_db` with the changes applied, or a newly
+            loaded database
+    """
+    store_dir = Path(store_dir)
+    manifest = read_manifest(store_dir)
+    image_records: List[Dict] = manifest["images"]
+    loaded_segments = len(image_db.matcher.segments)
+    loaded_images = len(image_db.index_lookup)
+
+    if (manifest["store_id"] != image_db.store_id or
+            len(manifest["segments"]) < loaded_segments or
+            len(image_records) < loaded_images or
+            any(image_db.matcher.is_removed(hero_index) and
+                not image_records[hero_index]["removed"]
+                for hero_index in range(loaded_images))):
+        return load_store(store_dir, image_db.matcher.backend_name)
+
+    start_time = time.time()
+    image_db = image_db.copy()
+    changed_segments = set()
+    segment_starts = image_db.matcher.segment_starts()
+    for hero_index in range(loaded_images):
+        if (image_records[hero_index]["removed"] and
+                not image_db.matcher.is_removed(hero_index)):
+            image_db.tombstone_image(hero_index)
+            changed_segments.add(np.searchsorted(
+                segment_starts, hero_index, side="right") - 1)
+
+    manifest_changed = False
+    for segment_index in sorted(changed_segments):
+        manifest_changed |= _load_segment_index(
+            image_db.matcher.segments[segment_index],
+            manifest["segments"][segment_index],
+            store_dir.joinpath(
+                manifest["segments"][segment_index]["directory"]))
+    manifest_changed |= _load_segments(image_db, manifest, store_dir,
+                                       first_segment=loaded_segments)
+    if manifest_changed:
+        write_manifest(store_dir, manifest)
+    if len(image_records) > loaded_images:
+        _load_prefilters(image_db, store_dir)
+    image_db.update_hero_ids()
+
+    if GV.verbosity(1):
+        print(f"Refreshed {len(changed_segments)} segments and loaded "
+              f"{len(manifest['segments']) - loaded_segments} new segments "
+              f"from {store_dir} in {time.time() - start_time} seconds")
+    return image_db
@@ -0,0 +1,148 @@
+"""
+Module for projecting SIFT descriptors into a smaller space before they are
+indexed and searched
+
+RootSIFT (Arandjelovic and Zisserman, 2012) L1 normalizes every descriptor and
+takes its square root, so that comparing descriptors with L2 distance compares
+them with the Hellinger kernel. PCA projects the descriptors onto their
+`dimensions` largest principal components, shrinking the index and the cost
+of every distance computation
+"""
+import hashlib
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# Descriptors sampled from the database to fit the PCA projection
+PCA_SAMPLE_SIZE = 100000
+
+
+class DescriptorTransform:
+    """
+    Optional RootSIFT normalization followed by an optional PCA projection,
+        the projection is fit once on the database descriptors and then
+        applied to both database and query descriptors
+    """
+
+    def __init__(self, dimensions: int = None, root_sift: bool = False):
+        """
+        Create an unfitted transform
+
+        Args:
+            dimensions (int, optional): number of principal components to
+                project descriptors onto, None keeps every dimension.
+                Defaults to None.
+            root_sift (bool, optional): apply RootSIFT normalization before
+                projecting. Defaults to False.
+
+        Raises:
+            ValueError: raised when `dimensions` is not between 1 and 128
+        """
+        if dimensions is not None and not 0 < dimensions <= 128:
+            raise ValueError(
+                f"Descriptor dimensions must be between 1 and 128, got "
+                f"{dimensions}")
+        self.dimensions = dimensions
+        self.root_sift = root_sift
+        self.mean: np.ndarray = None
+        self.components: np.ndarray = None
+
+    @property
+    def fitted(self) -> bool:
+        """
+        True when the transform can be applied
+        """
+        return self.dimensions is None or self.components is not None
+
+    def settings(self) -> str:
+        """
+        String identifying the configuration of the transform
+        """
+        return f"dimensions={self.dimensions}:root_sift={self.root_sift}"
+
+    def checksum(self) -> str:
+        """
+        Hash the settings and fitted projection, an index built from
+            transformed descriptors is only valid for the exact projection
+        """
+        transform_hash = hashlib.blake2b(digest_size=16)
+        transform_hash.update(self.settings().encode("utf-8"))
+        if self.components is not None:
+            transform_hash.update(self.mean.data)
+            transform_hash.update(self.components.data)
+        return transform_hash.hexdigest()
+
+    def _normalize(self, descriptors: np.ndarray) -> np.ndarray:
+        """
+        Convert `descriptors` to float32 and apply RootSIFT when enabled
+        """
+        descriptors = np.asarray(descriptors, dtype=np.float32)
+        if not self.root_sift:
+            return descriptors
+        l1_norms = np.abs(descriptors).sum(axis=1, keepdims=True)
+        return np.sqrt(descriptors / np.maximum(l1_norms, 1e-7))
+
+    def fit(self, descriptors: np.ndarray):
+        """
+        Fit the PCA projection on `descriptors`, evenly spaced rows are
+            sampled when there are more than PCA_SAMPLE_SIZE
+
+        Args:
+            descriptors (np.ndarray): (n, 128) database descriptors
+        """
+        if self.dimensions is None:
+            return
+        sample_step = max(1, len(descriptors) // PCA_SAMPLE_SIZE)
+        sample = np.ascontiguousarray(
+            self._normalize(descriptors[::sample_step]))
+        if len(sample) < self.dimensions:
+            raise ValueError(
+                f"Cannot fit {self.dimensions} principal components on "
+                f"{len(sample)} descriptors")
+        mean, components = cv2.PCACompute(sample, mean=None,
+                                          maxComponents=self.dimensions)
+        self.mean = np.ascontiguousarray(mean.ravel(), dtype=np.float32)
+        self.components = np.ascontiguousarray(components, dtype=np.float32)
+
+    def apply(self, descriptors: np.ndarray) -> np.ndarray:
+        """
+        Transform `descriptors` into the space the index is searched in
+
+        Args:
+            descriptors (np.ndarray): (n, 128) SIFT descriptors
+
+        Returns:
+            np.ndarray: (n, dimensions) contiguous float32 descriptors
+        """
+        descriptors = self._normalize(descriptors)
+        if self.components is not None:
+            descriptors = (descriptors - self.mean) @ self.components.T
+        return np.ascontiguousarray(descriptors, dtype=np.float32)
+
+    def save(self, transform_path: Path):
+        """
+        Write the fitted projection to `transform_path`
+        """
+        if self.components is not None:
+            with open(transform_path, "wb") as transform_file:
+                np.savez(transform_file, mean=self.mean,
+                         components=self.components)
+
+    def load(self, transform_path: Path) -> bool:
+        """
+        Load a projection previously written by `save`
+
+        Returns:
+            bool: True when a projection matching `dimensions` was loaded
+        """
+        if self.dimensions is None or not Path(transform_path).exists():
+            return False
+        with np.load(transform_path) as transform_data:
+            mean = transform_data["mean"]
+            components = transform_data["components"]
+        if components.shape != (self.dimensions, len(mean)):
+            return False
+        self.mean = mean
+        self.components = components
+        return True
@@ -0,0 +1,161 @@
+"""
+Module containing the geometric verification stage of ImageSearch
+
+Votes from nearest neighbor matching only count how many descriptors of a
+segment look like a hero, not whether they sit where they should. When the
+votes of the top heroes are close, the keypoints of the segment are matched
+against each candidate portrait on its own and a RANSAC homography is fit to
+the matches. The hero whose portrait explains the most matches with a single
+homography wins, and the margin between its inliers and the runner up gives
+a confidence that does not depend on how many descriptors the segment had
+"""
+import copy
+from typing import List
+
+import cv2
+import numpy as np
+
+# Matches a portrait needs to pass the ratio test before a homography is fit
+MIN_HOMOGRAPHY_MATCHES = 4
+# Distance in pixels of HERO_PORTRAIT_SIZE images a match can be from where
+#   the homography projects it and still count as an inlier
+RANSAC_REPROJECTION_ERROR = 8.0
+RANSAC_MAX_ITERATIONS = 500
+
+
+class GeometricVerifier:
+    """
+    Keypoint positions of every database image, used to re-rank the top heroes
+        of an ambiguous search by the inliers of a RANSAC homography
+    """
+
+    def __init__(self, candidate_count: int = 3, min_inliers: int = 8,
+                 vote_ratio: float = 0.5):
+        """
+        Create an empty verifier
+
+        Args:
+            candidate_count (int, optional): number of top heroes verified for
+                an ambiguous search. Defaults to 3.
+            min_inliers (int, optional): inliers the best hero needs before
+                the verification is trusted. Defaults to 8.
+            vote_ratio (float, optional): a search is ambiguous when the
+                second best hero has at least this share of the best hero's
+                votes. Defaults to 0.5.
+        """
+        self.candidate_count = candidate_count
+        self.min_inliers = min_inliers
+        self.vote_ratio = vote_ratio
+
+        self._pending: List[np.ndarray] = []
+        self.keypoints = np.empty((0, 2), dtype=np.float32)
+        # Keypoints of image `i` are rows offsets[i]:offsets[i + 1], in the
+        #   same order as the image's descriptors
+        self.offsets = np.zeros(1, dtype=np.int64)
+
+    @property
+    def image_count(self) -> int:
+        """
+        Number of images in the verifier, including queued images
+        """
+        return len(self.offsets) - 1 + len(self._pending)
+
+    def copy(self) -> "GeometricVerifier":
+        """
+        Copy of the verifier that can be loaded or trained again without
+            changing this one, the keypoints are shared until they are replaced
+        """
+        verifier_copy = copy.copy(self)
+        verifier_copy._pending = list(self._pending)
+        return verifier_copy
+
+    def add(self, keypoints: np.ndarray):
+        """
+        Queue the keypoint positions of the next image to be added on the next
+            call to `train`
+        """
+        if keypoints is None:
+            keypoints = np.empty((0, 2), dtype=np.float32)
+        self._pending.append(keypoints)
+
+    def set_keypoints(self, keypoints: np.ndarray, offsets: np.ndarray):
+        """
+        Replace the keypoint positions of every image
+
+        Args:
+            keypoints (np.ndarray): (n, 2) float32 positions of every image,
+                can be memory mapped
+            offsets (np.ndarray): (image_count + 1) int64 row offsets of each
+                image into `keypoints`
+        """
+        self._pending = []
+        self.keypoints = keypoints
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    def train(self):
+        """
+        Stack any queued keypoint positions
+        """
+        if self._pending:
+            sizes = [len(keypoints) for keypoints in self._pending]
+            self.offsets = np.concatenate(
+                [self.offsets, self.offsets[-1] + np.cumsum(sizes)])
+            self.keypoints = np.concatenate(
+                [self.keypoints, *self._pending]).astype(np.float32)
+            self._pending = []
+
+    def is_ambiguous(self, match_counts: np.ndarray,
+                     confident_count: int) -> bool:
+        """
+        Check if the votes of a search are close enough to verify
+
+        Args:
+            match_counts (np.ndarray): vote counts of a search in decending
+                order
+            confident_count (int): votes the best hero needs before a search
+                is trusted
+
+        Returns:
+            bool: True when the best hero has fewer than `confident_count`
+                votes or the runner up is within `vote_ratio` of it
+        """
+        if len(match_counts) == 0:
+            return False
+        if match_counts[0] < confident_count:
+            return True
+        return (len(match_counts) > 1 and
+                match_counts[1] >= self.vote_ratio * match_counts[0])
+
+    def image_keypoints(self, image_index: int,
+                        train_indices: np.ndarray) -> np.ndarray:
+        """
+        Positions of the keypoints at `train_indices` inside of an image
+        """
+        return np.asarray(self.keypoints[
+            self.offsets[image_index] + train_indices], dtype=np.float32)
+
+    def inlier_count(self, query_points: np.ndarray,
+                     train_points: np.ndarray) -> int:
+        """
+        Fit a homography from `query_points` to `train_points` with RANSAC
+
+        Args:
+            query_points (np.ndarray): (n, 2) positions in the segment
+            train_points (np.ndarray): (n, 2) positions of the matching
+                keypoints in a database image
+
+        Returns:
+            int: number of matches consistent with the homography, 0 when
+                there are too few matches or no homography was found
+        """
+        if len(query_points) < MIN_HOMOGRAPHY_MATCHES:
+            return 0
+        # USAC's RANSAC stops sampling far sooner than cv2.RANSAC when most
+        #   matches are outliers, which is the case for every wrong hero
+        homography, inlier_mask = cv2.findHomography(
+            query_points.reshape(-1, 1, 2), train_points.reshape(-1, 1, 2),
+            cv2.USAC_FAST, RANSAC_REPROJECTION_ERROR,
+            maxIters=RANSAC_MAX_ITERATIONS)
+        if homography is None:
+            return 0
+        return int(np.count_nonzero(inlier_mask))
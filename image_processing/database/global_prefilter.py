@@ -0,0 +1,176 @@
+"""
+Module containing the global descriptor first stage of ImageSearch
+
+Every portrait is summarized by a single vector, a color histogram of its
+center concatenated with a coarse grid of gradient orientations. The vectors
+of every database image sit in a FAISS flat index, so shortlisting the heroes
+closest to a segment costs one small exact search before any local features
+are matched
+"""
+import copy
+from typing import List
+
+import cv2
+import numpy as np
+from faiss import IndexFlatL2
+
+from image_processing.load_images import CropImageInfo, crop_heroes
+
+# Area of a portrait or segment the global descriptor is computed from, the
+#   same window searches start with so roster borders and stars are left out
+GLOBAL_WINDOW = CropImageInfo(0.15, 0.08, 0.25, 0.2)
+GLOBAL_IMAGE_SIZE = 64
+# Hue, saturation and value bins of the color histogram
+HISTOGRAM_BINS = (8, 4, 4)
+GRADIENT_CELLS = 8
+GRADIENT_ORIENTATIONS = 4
+GLOBAL_DESCRIPTOR_SIZE = (int(np.prod(HISTOGRAM_BINS)) +
+                          GRADIENT_CELLS * GRADIENT_CELLS *
+                          GRADIENT_ORIENTATIONS)
+
+
+def _unit_vector(vector: np.ndarray) -> np.ndarray:
+    """
+    Scale `vector` to unit L2 norm, zero vectors are returned unchanged
+    """
+    return vector / max(float(np.linalg.norm(vector)), 1e-7)
+
+
+def global_descriptor(image: np.ndarray) -> np.ndarray:
+    """
+    Describe the center of a BGR portrait or segment with a single vector
+
+    Args:
+        image (np.ndarray): BGR image of a hero
+
+    Returns:
+        np.ndarray: (GLOBAL_DESCRIPTOR_SIZE,) float32 unit vector, half of its
+            weight from the color histogram and half from the gradients
+    """
+    window = crop_heroes([image], GLOBAL_WINDOW)[0]
+    small_image = cv2.resize(window, (GLOBAL_IMAGE_SIZE, GLOBAL_IMAGE_SIZE),
+                             interpolation=cv2.INTER_AREA)
+
+    hsv_image = cv2.cvtColor(small_image, cv2.COLOR_BGR2HSV)
+    histogram = cv2.calcHist([hsv_image], [0, 1, 2], None,
+                             list(HISTOGRAM_BINS),
+                             [0, 180, 0, 256, 0, 256]).ravel()
+    # Square root of the normalized histogram, so L2 distance between
+    #   histograms follows the Hellinger distance
+    histogram = np.sqrt(histogram / max(float(histogram.sum()), 1.0))
+
+    gray_image = cv2.cvtColor(small_image, cv2.COLOR_BGR2GRAY).astype(
+        np.float32)
+    magnitude, angle = cv2.cartToPolar(
+        cv2.Sobel(gray_image, cv2.CV_32F, 1, 0),
+        cv2.Sobel(gray_image, cv2.CV_32F, 0, 1))
+    orientation = (angle * GRADIENT_ORIENTATIONS /
+                   (2 * np.pi)).astype(np.int32) % GRADIENT_ORIENTATIONS
+    # Average gradient magnitude of each orientation in every grid cell
+    gradients = np.stack(
+        [cv2.resize(np.where(orientation == orientation_bin, magnitude, 0),
+                    (GRADIENT_CELLS, GRADIENT_CELLS),
+                    interpolation=cv2.INTER_AREA)
+         for orientation_bin in range(GRADIENT_ORIENTATIONS)], axis=-1)
+
+    return (np.concatenate([_unit_vector(histogram),
+                            _unit_vector(gradients.ravel())]) /
+            np.sqrt(2)).astype(np.float32)
+
+
+class GlobalPrefilter:
+    """
+    Global descriptor of every database image in a FAISS flat index, used to
+        shortlist the heroes a segment's SIFT descriptors are matched against
+    """
+
+    def __init__(self, shortlist_size: int = 5):
+        """
+        Create an empty prefilter
+
+        Args:
+            shortlist_size (int, optional): number of heroes to shortlist.
+                Defaults to 5.
+        """
+        self.shortlist_size = shortlist_size
+        self._pending: List[np.ndarray] = []
+        # Global descriptor of image `i` is row `i`
+        self.descriptors = np.empty((0, GLOBAL_DESCRIPTOR_SIZE),
+                                    dtype=np.float32)
+        self._index: IndexFlatL2 = None
+        self.trained = False
+
+    @property
+    def image_count(self) -> int:
+        """
+        Number of images in the prefilter, including queued images
+        """
+        return len(self.descriptors) + len(self._pending)
+
+    def copy(self) -> "GlobalPrefilter":
+        """
+        Copy of the prefilter that can be loaded or trained again without
+            changing this one, the descriptors and index are shared until they
+            are replaced
+        """
+        prefilter_copy = copy.copy(self)
+        prefilter_copy._pending = list(self._pending)
+        return prefilter_copy
+
+    def add(self, descriptor: np.ndarray):
+        """
+        Queue the global descriptor of the next image to be added on the next
+            call to `train`
+        """
+        self._pending.append(descriptor)
+        self.trained = False
+
+    def set_descriptors(self, descriptors: np.ndarray):
+        """
+        Replace the global descriptors of every image without training
+        """
+        self._pending = []
+        self.descriptors = descriptors
+        self.trained = False
+
+    def train(self):
+        """
+        Stack any queued descriptors and rebuild the flat index over them
+        """
+        if self._pending:
+            self.descriptors = np.concatenate(
+                [self.descriptors, np.stack(self._pending)]).astype(
+                    np.float32)
+            self._pending = []
+        self._index = IndexFlatL2(GLOBAL_DESCRIPTOR_SIZE)
+        self._index.add(np.ascontiguousarray(self.descriptors))
+        self.trained = True
+
+    def shortlist(self, query: np.ndarray, image_hero_ids: np.ndarray,
+                  live_images: np.ndarray) -> np.ndarray:
+        """
+        Rank the database images by their distance to the global descriptor
+            of a segment and keep the heroes of the closest images
+
+        Args:
+            query (np.ndarray): (GLOBAL_DESCRIPTOR_SIZE,) global descriptor of
+                a segment
+            image_hero_ids (np.ndarray): hero id of every image index
+            live_images (np.ndarray): boolean mask of the image indices that
+                have not been removed
+
+        Returns:
+            np.ndarray: ids of the `shortlist_size` closest heroes, None when
+                the database is empty
+        """
+        if self._index is None or self._index.ntotal == 0 or query is None:
+            return None
+        _distances, rows = self._index.search(
+            np.ascontiguousarray(query.reshape(1, -1)), self._index.ntotal)
+        ranked_images = rows[0][rows[0] >= 0]
+        ranked_images = ranked_images[live_images[ranked_images]]
+        # First occurrence of each hero in distance order
+        ranked_heroes = image_hero_ids[ranked_images]
+        _unique_heroes, first_ranks = np.unique(ranked_heroes,
+                                                return_index=True)
+        return ranked_heroes[np.sort(first_ranks)[:self.shortlist_size]]
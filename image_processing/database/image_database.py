@@ -1,24 +1,184 @@
-from typing import Any, Dict, List, TypedDict, Union
+import copy
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+from typing import Dict, List, NamedTuple
 
 import cv2
 import numpy as np
 
 from image_processing.processing.image_data import SegmentResult
+from image_processing.processing.request_context import RequestContext
 import image_processing.globals as GV
-from image_processing.afk.hero.hero_data import HeroImage
-from image_processing.load_images import CropImageInfo, crop_heroes
+from image_processing.afk.hero.hero_data import HeroImage, HeroRecord
+from image_processing.database.binary_prefilter import BinaryPrefilter
+from image_processing.database.descriptor_cache import (
+    DescriptorCache, image_key)
+from image_processing.database.descriptor_index import (
+    DEFAULT_INDEX_BACKEND, SegmentedIndex)
+from image_processing.database.descriptor_transform import DescriptorTransform
+from image_processing.database.geometric_verifier import GeometricVerifier
+from image_processing.database.global_prefilter import (
+    GlobalPrefilter, global_descriptor)
+from image_processing.load_images import (
+    CropImageInfo, crop_heroes, crop_window)
+
+
+SIFT_PATCH_SIZE = 16
+# Amount Lowe's ratio is loosened by each time too few features pass
+RATIO_STEP = 0.05
+# Votes the best hero needs before a search is trusted without retrying
+CONFIDENT_MATCH_COUNT = 10
+
+
+class KnnMatches(NamedTuple):
+    """
+    k=2 knn matches for a set of query descriptors stored as arrays
+
+    distances: (n, 2) array with the distance to the best and second best
+        database descriptor of each query descriptor
+    image_indices: (n,) array with the database image index of the best match
+        of each query descriptor
+    train_indices: (n,) array with the descriptor index of the best match
+        inside of its database image
+    """
+    distances: np.ndarray
+    image_indices: np.ndarray
+    train_indices: np.ndarray
+
+    def __len__(self):
+        return len(self.image_indices)
+
+    def ratios(self) -> np.ndarray:
+        """
+        Lowe's ratio of the best to the second best distance of every match,
+            infinite when the ratio is undefined so the match never passes
+            the ratio test
 
+        Returns:
+            np.ndarray: (n,) float64 ratios
+        """
+        best_distances = self.distances[:, 0].astype(np.float64)
+        second_distances = self.distances[:, 1].astype(np.float64)
+        match_ratios = np.full(len(self), np.inf)
+        np.divide(best_distances, second_distances, out=match_ratios,
+                  where=(second_distances > 0) & np.isfinite(best_distances))
+        return match_ratios
+
+    def slice(self, start: int, stop: int):
+        """
+        Return the matches for query descriptors [start, stop)
+        """
+        return KnnMatches(self.distances[start:stop],
+                          self.image_indices[start:stop],
+                          self.train_indices[start:stop])
 
-FLANN_INDEX_KDTREE = 1
+    @classmethod
+    def from_mask(cls, mask: np.ndarray, masked_matches: "KnnMatches",
+                  unmasked_matches: "KnnMatches"):
+        """
+        Interleave the matches of the descriptors selected by `mask` with the
+            matches of the rest of the descriptors, restoring the original
+            descriptor order
+
+        Args:
+            mask (np.ndarray): boolean mask that selected the descriptors
+                `masked_matches` came from
+            masked_matches (KnnMatches): matches for descriptors in `mask`
+            unmasked_matches (KnnMatches): matches for descriptors not in
+                `mask`
+        """
+        combined_matches: List[np.ndarray] = []
+        for masked_array, unmasked_array in zip(masked_matches,
+                                                unmasked_matches):
+            combined_array = np.empty(
+                (len(mask), *masked_array.shape[1:]), dtype=masked_array.dtype)
+            combined_array[mask] = masked_array
+            combined_array[~mask] = unmasked_array
+            combined_matches.append(combined_array)
+        return cls(*combined_matches)
+
+    @classmethod
+    def from_neighbors(cls, distances: np.ndarray, image_indices: np.ndarray,
+                       train_indices: np.ndarray):
+        """
+        Create KnnMatches from the k=2 neighbors returned by
+            SegmentedIndex.knn_search, only the indices of the closest neighbor
+            are kept
+
+        Args:
+            distances (np.ndarray): (n, 2) distance to both neighbors
+            image_indices (np.ndarray): (n, 2) image index of both neighbors
+            train_indices (np.ndarray): (n, 2) descriptor index of both
+                neighbors inside of their image
+        """
+        return cls(distances.reshape(-1, 2), image_indices[:, 0].copy(),
+                   train_indices[:, 0].copy())
 
-image_search_dict = TypedDict("image_search_dict", {
-                              "images": Dict[str,
-                                             Dict[Union[str, int],
-                                                  Union[np.ndarray,
-                                                  HeroImage]]],
-                              "names": Dict[int, str],
-                              "descriptors": Any,
-                              "matcher": cv2.FlannBasedMatcher})
+
+class SegmentFeatures(NamedTuple):
+    """
+    SIFT features extracted from a single preprocessed image
+
+    keypoints: (n, 2) array with the (x, y) position of each keypoint
+    descriptors: (n, 128) float32 array with the descriptor of each keypoint
+    image_shape: shape of the preprocessed image the features came from
+    image_key: hash of the preprocessed image the features came from, and of
+        the segment image when the database has a GlobalPrefilter
+    binary_descriptors: (m, 32) uint8 ORB descriptors of the image, None when
+        the database has no BinaryPrefilter
+    global_descriptor: global descriptor of the segment, None when the
+        database has no GlobalPrefilter
+    """
+    keypoints: np.ndarray
+    descriptors: np.ndarray
+    image_shape: tuple
+    image_key: str = None
+    binary_descriptors: np.ndarray = None
+    global_descriptor: np.ndarray = None
+
+    def __len__(self):
+        return len(self.descriptors)
+
+    def window_mask(self, crop_info: CropImageInfo = None):
+        """
+        Find the keypoints that lie inside of the area `crop_heroes` would
+            keep for `crop_info`
+
+        Args:
+            crop_info (CropImageInfo): Named Tuple that contains information on
+                how much to crop the image. When this is None every keypoint
+                is kept
+
+        Returns:
+            np.ndarray: boolean mask of the keypoints inside the crop window
+        """
+        if not crop_info:
+            return np.ones(len(self), dtype=bool)
+        top, bottom, left, right = crop_window(self.image_shape, crop_info)
+        x_coords = self.keypoints[:, 0]
+        y_coords = self.keypoints[:, 1]
+        return ((x_coords >= left) & (x_coords < right) &
+                (y_coords >= top) & (y_coords < bottom))
+
+
+class PortraitDescriptors(NamedTuple):
+    """
+    Descriptors extracted from a hero portrait for the database
+
+    descriptors: (n, 128) float32 SIFT descriptors
+    binary_descriptors: (m, 32) uint8 ORB descriptors, None when the database
+        has no BinaryPrefilter
+    global_descriptor: global descriptor of the portrait, None when the
+        database has no GlobalPrefilter
+    keypoints: (n, 2) float32 position of each SIFT descriptor, None when the
+        database has no GeometricVerifier
+    """
+    descriptors: np.ndarray
+    binary_descriptors: np.ndarray = None
+    global_descriptor: np.ndarray = None
+    keypoints: np.ndarray = None
 
 
 class NoMatchException(Exception):
@@ -33,31 +193,70 @@ class NoMatchException(Exception):
 
 
 class ImageDatabaseHero:
-    """_summary_
-
-    Returns:
-        _type_: _description_
+    """
+    Every portrait of a single hero in the image database, stored as
+        HeroRecords so no portrait pixels are kept in memory
     """
 
-    def __init__(self, hero_name: str, hero_info: HeroImage,
-                 hero_index: int):
-        """_summary_
+    def __init__(self, hero_name: str):
+        """
+        Create a hero without any portraits
 
         Args:
-            hero_name (str): _description_
-            hero_info (HeroImage): _description_
-            hero_index (int): _description_
+            hero_name (str): name of the hero
         """
         self.name = hero_name
-        self.hero_instances: List[HeroImage] = [hero_info]
-        self.hero_index_lookup: Dict[int, HeroImage] = {
-            hero_index: hero_info}
+        # Portraits that still have at least one image in the database
+        self.hero_instances: List[HeroRecord] = []
+        self.hero_index_lookup: Dict[int, HeroRecord] = {}
 
-    def first(self):
-        """_summary_
+    def add_index(self, hero_index: int, image_path) -> HeroRecord:
+        """
+        Record that the image at `hero_index` came from the portrait at
+            `image_path`, extending the last record when the portrait was
+            also the previous image
+
+        Args:
+            hero_index (int): database image index of the image
+            image_path (Path): path of the portrait the image came from
 
         Returns:
-            _type_: _description_
+            HeroRecord: record of the portrait
+        """
+        hero_record = None
+        if self.hero_instances:
+            hero_record = self.hero_instances[-1]
+        if (hero_record is None or hero_record.image_path != image_path or
+                hero_record.stop_index != hero_index):
+            hero_record = HeroRecord(self.name, image_path, hero_index)
+            self.hero_instances.append(hero_record)
+        else:
+            hero_record.stop_index += 1
+        self.hero_index_lookup[hero_index] = hero_record
+        return hero_record
+
+    def copy(self) -> "ImageDatabaseHero":
+        """
+        Copy of the hero whose portraits can be added or removed without
+            changing this hero
+        """
+        record_copies: Dict[int, HeroRecord] = {
+            id(hero_record): HeroRecord(
+                hero_record.name, hero_record.image_path,
+                hero_record.start_index, hero_record.stop_index)
+            for hero_record in self.hero_index_lookup.values()}
+        hero_copy = ImageDatabaseHero(self.name)
+        hero_copy.hero_instances = [record_copies[id(hero_record)]
+                                    for hero_record in self.hero_instances]
+        hero_copy.hero_index_lookup = {
+            hero_index: record_copies[id(hero_record)]
+            for hero_index, hero_record in self.hero_index_lookup.items()}
+        return hero_copy
+
+    def first(self):
+        """
+        Record of the first portrait of the hero still in the database, None
+            when every portrait was removed
         """
         if len(self.hero_instances) == 0:
             return None
@@ -65,7 +264,8 @@ class ImageDatabaseHero:
             return self.hero_instances[0]
 
     def __str__(self):
-        return f"ImageDatabaseHero<{self.name}, image_count={len(self.hero_instances)}>"
+        return (f"ImageDatabaseHero<{self.name}, "
+                f"portrait_count={len(self.hero_instances)}>")
 
     def __repr__(self) -> str:
         return str(self)
@@ -96,47 +296,158 @@ class FeatureMatch:
 
 class HeroMatchList:
     """
-    Wrapper around a list of "HeroMatch" objects that has several utility
-        methods for keeping track of the number of flann matches for each hero.
-        By default at all times this data structure should provide a sorted
-        list of HeroMatch objects based on decending HeroMatch.match_count
+    Compact collection of the hero votes from a search. The votes are stored
+        as parallel arrays of hero ids, match counts, summed match distances
+        and homography inliers that are always sorted with the geometrically
+        verified heroes first by decending inlier count, followed by the rest
+        by decending match count. HeroMatch objects are only created when the
+        list is indexed or iterated over
     """
 
-    def __init__(self, matches: List["HeroMatch"]):
+    def __init__(self, hero_names: List[str],
+                 hero_ids: np.ndarray = None,
+                 match_counts: np.ndarray = None,
+                 distances: np.ndarray = None,
+                 features: Dict[int, KnnMatches] = None,
+                 inliers: np.ndarray = None,
+                 verified_confidence: float = None):
         """
-        Wrapper around a list of "HeroMatch" objects that has several utility
-        methods for keeping track of the number of flann matches for each hero.
-        By default at all times this data structure should provide a sorted
-        list of HeroMatch objects based on decending HeroMatch.match_count
+        Compact collection of the hero votes from a search
 
         Args:
-            matches (List[HeroMatch]): list of hero matches to add
+            hero_names (List[str]): lookup table from hero id to hero name,
+                shared with the ImageSearch that created the list
+            hero_ids (np.ndarray, optional): id of each hero that was voted
+                for. Defaults to no heroes
+            match_counts (np.ndarray, optional): number of votes for each hero
+                in `hero_ids`. Defaults to no heroes
+            distances (np.ndarray, optional): sum of the match distances for
+                each hero in `hero_ids`. Defaults to no heroes
+            features (Dict[int, KnnMatches], optional): per feature match
+                detail for each hero id, only recorded in debug mode.
+                Defaults to None
+            inliers (np.ndarray, optional): homography inliers of each hero in
+                `hero_ids`, -1 for heroes that were not verified. Defaults to
+                no verified heroes
+            verified_confidence (float, optional): confidence of the
+                geometric verification, None when the search was not
+                verified. Defaults to None
         """
-        self.hero_matches: List[HeroMatch] = []
-        self.hero_dict: Dict[str, HeroMatch] = {}
-        self.current_iter = 0
+        self.hero_names = hero_names
+        if hero_ids is None:
+            hero_ids = np.empty(0, dtype=np.int64)
+            match_counts = np.empty(0, dtype=np.int64)
+            distances = np.empty(0, dtype=np.float64)
+        if inliers is None:
+            inliers = np.full(len(hero_ids), -1, dtype=np.int64)
+        self.hero_ids: np.ndarray = None
+        self.match_counts: np.ndarray = None
+        self.distances: np.ndarray = None
+        self.inliers: np.ndarray = None
         self.total_matches = 0
+        self._set_votes(hero_ids, match_counts, distances, inliers)
+        self.features = features
+        self.verified_confidence = verified_confidence
 
-        self.extend(matches)
+    def _set_votes(self, hero_ids: np.ndarray, match_counts: np.ndarray,
+                   distances: np.ndarray, inliers: np.ndarray):
+        """
+        Store the vote arrays sorted by decending inlier count and then by
+            decending match count, keeping the order they were passed in for
+            ties
+        """
+        sort_order = np.lexsort((-match_counts, -inliers))
+        self.hero_ids = hero_ids[sort_order]
+        self.match_counts = match_counts[sort_order]
+        self.distances = distances[sort_order]
+        self.inliers = inliers[sort_order]
+        self.total_matches = int(self.match_counts.sum())
+
+    def set_inliers(self, hero_ids: np.ndarray, inliers: np.ndarray,
+                    verified_confidence: float):
+        """
+        Record the geometric verification of the heroes in `hero_ids` and
+            re-rank the list so the verified heroes come first
 
-    def __iter__(self):
+        Args:
+            hero_ids (np.ndarray): ids of the verified heroes, every id has to
+                already be in the list
+            inliers (np.ndarray): homography inliers of each hero in
+                `hero_ids`
+            verified_confidence (float): confidence of the verification
         """
-        Return object to iterate over
+        new_inliers = self.inliers.copy()
+        hero_positions = {int(hero_id): position for position, hero_id in
+                          enumerate(self.hero_ids)}
+        for hero_id, hero_inliers in zip(hero_ids, inliers):
+            new_inliers[hero_positions[int(hero_id)]] = hero_inliers
+        self._set_votes(self.hero_ids, self.match_counts, self.distances,
+                        new_inliers)
+        self.verified_confidence = verified_confidence
+
+    @classmethod
+    def from_votes(cls, hero_names: List[str], voted_hero_ids: np.ndarray,
+                   vote_distances: np.ndarray,
+                   features: Dict[int, KnnMatches] = None):
+        """
+        Count every vote in `voted_hero_ids` into a new HeroMatchList
+
+        Args:
+            hero_names (List[str]): lookup table from hero id to hero name
+            voted_hero_ids (np.ndarray): hero id of every feature vote
+            vote_distances (np.ndarray): match distance of every feature vote
+            features (Dict[int, KnnMatches], optional): per feature match
+                detail for each hero id. Defaults to None
+        """
+        match_counts = np.bincount(voted_hero_ids, minlength=len(hero_names))
+        distances = np.bincount(voted_hero_ids, weights=vote_distances,
+                                minlength=len(hero_names))
+
+        # Heroes are stored in the order they were first voted for so ties
+        #   in the vote count keep a stable order
+        hero_ids, first_vote = np.unique(voted_hero_ids, return_index=True)
+        hero_ids = hero_ids[np.argsort(first_vote)]
+        return cls(hero_names, hero_ids, match_counts[hero_ids],
+                   distances[hero_ids], features)
+
+    def summary(self):
+        """
+        Copy of the vote arrays that can be cached and turned back into a
+            HeroMatchList with `from_summary`
 
         Returns:
-            self
+            tuple: hero ids, match counts, distances, inliers and the
+                verified confidence
         """
-        return self
+        return (self.hero_ids.copy(), self.match_counts.copy(),
+                self.distances.copy(), self.inliers.copy(),
+                self.verified_confidence)
 
-    def __next__(self):
+    @classmethod
+    def from_summary(cls, hero_names: List[str], summary: tuple):
         """
-        Provide the next element to iterate over
+        Create a HeroMatchList from the output of `summary`
+
+        Args:
+            hero_names (List[str]): lookup table from hero id to hero name
+            summary (tuple): hero ids, match counts, distances, inliers and
+                the verified confidence
         """
-        if self.current_iter < len(self.hero_matches):
-            self.current_iter += 1
-            return self.hero_matches[self.current_iter - 1]
-        self.current_iter = 0
-        raise StopIteration
+        hero_ids, match_counts, distances, inliers, verified_confidence = (
+            summary)
+        return cls(hero_names, hero_ids.copy(), match_counts.copy(),
+                   distances.copy(), inliers=inliers.copy(),
+                   verified_confidence=verified_confidence)
+
+    def __len__(self):
+        return len(self.hero_ids)
+
+    def __iter__(self):
+        """
+        Iterate over the HeroMatches in order of decending match count
+        """
+        for index in range(len(self.hero_ids)):
+            yield self[index]
 
     def __getitem__(self, index: int):
         """
@@ -145,57 +456,100 @@ class HeroMatchList:
         Args:
             index (int): Index of list to get
         """
-        return self.hero_matches[index]
+        hero_inliers = None
+        if self.inliers[index] >= 0:
+            hero_inliers = int(self.inliers[index])
+        hero_match = HeroMatch(self.hero_names[self.hero_ids[index]],
+                               int(self.match_counts[index]),
+                               float(self.distances[index]), hero_inliers)
+        hero_match.total_matches = self.total_matches
+        return hero_match
 
     def __str__(self):
 
-        return f"HeroMatchList<len={len(self.hero_matches)}, top={self.hero_matches[:3]}>"
+        return (f"HeroMatchList<len={len(self.hero_ids)}, "
+                f"top={[self[index] for index in range(min(len(self), 3))]}>")
 
-    def append(self, match: "HeroMatch", sort: bool = True):
+    def extend(self, matches: "HeroMatchList"):
         """
-        Adds a single 'HeroMatch' into 'HeroMatch' list
-            and then optionally sorts self to maintain the match_count order
+        Merge a 'HeroMatchList' object into self and combine all matches
+            that are for the same hero
 
         Args:
-            match (HeroMatch): match getting added to list
-            sort (bool): flag to sort the match list after adding new element
+            matches (HeroMatchList): matches to get merged in
         """
-        self.total_matches += match.match_count
-        if match.name in self.hero_dict:
-            self.hero_dict[match.name].combine(match)
-        else:
-            self.hero_dict[match.name] = match
-            self.hero_matches.append(match)
-        if sort:
-            self.sort()
-
-    def sort(self):
-        """
-        Sort list so matches are ordered by decreasing hero_match.match_count
-        """
-        self.hero_matches.sort(key=lambda hero_match: hero_match.match_count,
-                               reverse=True)
-
-    def extend(self, matches: Union[List["HeroMatch"], "HeroMatchList"]):
+        combined_ids = np.concatenate([self.hero_ids, matches.hero_ids])
+        hero_ids, first_index, inverse = np.unique(
+            combined_ids, return_index=True, return_inverse=True)
+        match_counts = np.bincount(
+            inverse, weights=np.concatenate(
+                [self.match_counts, matches.match_counts]),
+            minlength=len(hero_ids)).astype(np.int64)
+        distances = np.bincount(
+            inverse, weights=np.concatenate(
+                [self.distances, matches.distances]),
+            minlength=len(hero_ids))
+        inliers = np.full(len(hero_ids), -1, dtype=np.int64)
+        np.maximum.at(inliers, inverse,
+                      np.concatenate([self.inliers, matches.inliers]))
+
+        features = None
+        if self.features is not None and matches.features is not None:
+            features = dict(self.features)
+            for hero_id, hero_features in matches.features.items():
+                if hero_id in features:
+                    hero_features = KnnMatches(*[
+                        np.concatenate([old_array, new_array])
+                        for old_array, new_array in zip(features[hero_id],
+                                                        hero_features)])
+                features[hero_id] = hero_features
+
+        order = np.argsort(first_index)
+        self._set_votes(hero_ids[order], match_counts[order],
+                        distances[order], inliers[order])
+        self.features = features
+        if self.verified_confidence is None:
+            self.verified_confidence = matches.verified_confidence
+
+    def feature_matches(self, hero_name: str):
         """
-        Merge a List[HeroMatch] or 'HeroMatchList' object into self and
-            combine all matches that are for the same hero
+        Materialize a FeatureMatch for every feature that voted for
+            `hero_name`. Feature detail is only recorded in debug mode
 
         Args:
-            matches (List[HeroMatch]): matches to get merged in
+            hero_name (str): name of hero to get features for
+
+        Raises:
+            ValueError: raised when feature detail was not recorded
+
+        Returns:
+            List[FeatureMatch]: features that voted for `hero_name`
         """
-        for hero_match in matches:
-            self.append(hero_match, sort=False)
-        self.sort()
+        if self.features is None:
+            raise ValueError(
+                "Feature matches are only recorded for debug requests")
+        hero_id = self.hero_names.index(hero_name)
+        if hero_id not in self.features:
+            return []
+        hero_features = self.features[hero_id]
+        # The query index is not tracked once segments are merged, -1 marks
+        #   it as unknown
+        return [FeatureMatch(hero_name, int(image_index),
+                             cv2.DMatch(-1, int(train_index),
+                                        int(image_index), float(distance)))
+                for distance, image_index, train_index in zip(
+                    hero_features.distances[:, 0],
+                    hero_features.image_indices,
+                    hero_features.train_indices)]
 
     def best(self):
         """
-        Returns the HeroMatch with the highest number of matches
+        Returns the HeroMatch with the most homography inliers when the
+            search was verified, otherwise the one with the highest number of
+            matches
         """
-        if len(self.hero_matches) > 0:
-            best_match = self.hero_matches[0]
-            best_match.total_matches = self.total_matches
-            return best_match
+        if len(self.hero_ids) > 0:
+            return self[0]
         raise NoMatchException("No HeroMatch to return object length is 0")
 
 
@@ -205,14 +559,24 @@ class HeroMatch:
             that a hero has recieved
     """
 
-    def __init__(self, hero_name: str):
+    def __init__(self, hero_name: str, match_count: int = 0,
+                 distance: float = 0.0, inliers: int = None):
         """
         Args:
             hero_name (str): hero name to keep track of FeatureMatch'
+            match_count (int): number of feature matches the hero has
+                recieved. Defaults to 0
+            distance (float): sum of the distances of every feature match.
+                Defaults to 0.0
+            inliers (int): homography inliers of the hero's best portrait,
+                None when the hero was not geometrically verified. Defaults to
+                None
         """
         self.name = hero_name
-        self.matches: List[FeatureMatch] = []
+        self.distance = distance
+        self.inliers = inliers
 
+        self._match_count = match_count
         self._total_matches = -1
 
     @property
@@ -247,6 +611,15 @@ class HeroMatch:
         """
         return self.match_count / self.total_matches
 
+    @property
+    def mean_distance(self):
+        """
+        Average distance of the feature matches for this hero
+        """
+        if self.match_count == 0:
+            return 0.0
+        return self.distance / self.match_count
+
     def __str__(self):
         """
         String representation of object, that shows hero name and match_count
@@ -256,8 +629,11 @@ class HeroMatch:
             match_percentage_str = f"{match_percentage:.2f}%"
         else:
             match_percentage_str = "?%"
+        inliers_str = ""
+        if self.inliers is not None:
+            inliers_str = f", inliers={self.inliers}"
         return (f"HeroMatch<{self.name}, match_count={self.match_count}, "
-                f"confidence={match_percentage_str}>")
+                f"confidence={match_percentage_str}{inliers_str}>")
 
     def __repr__(self) -> str:
         return str(self)
@@ -265,28 +641,48 @@ class HeroMatch:
     @property
     def match_count(self):
         """
-        Property method  that calculates number of FeatureMatches for hero
+        Property method  that returns the number of FeatureMatches for hero
         """
-        return len(self.matches)
+        return self._match_count
 
-    def add_match(self, feature_match: FeatureMatch):
-        """
-        Adds a new flann_match to object
-        Args:
-            feature_match (FeatureMatch): match getting added
-        """
-        self.matches.append(feature_match)
 
-    def combine(self, new_match: "HeroMatch"):
-        """
-        Combine 'new_match' into HeroMatch object
+def select_keypoints(keypoint_positions: np.ndarray, responses: np.ndarray,
+                     max_keypoints: int, radius: float = 0.0) -> np.ndarray:
+    """
+    Select the `max_keypoints` strongest keypoints by response, skipping any
+        keypoint within `radius` pixels of a stronger keypoint that was
+        already selected(spatial non-maximum suppression)
 
-        Args:
-            new_match (HeroImage): object getting combined with self
-        """
+    Args:
+        keypoint_positions (np.ndarray): (n, 2) (x, y) position of each
+            keypoint
+        responses (np.ndarray): (n,) response of each keypoint
+        max_keypoints (int): maximum number of keypoints to select
+        radius (float, optional): suppression radius in pixels, 0 to only
+            select by response. Defaults to 0.0.
 
-        for match in new_match.matches:
-            self.matches.append(match)
+    Returns:
+        np.ndarray: indices of the selected keypoints in ascending order
+    """
+    strongest_order = np.argsort(-responses, kind="stable")
+    if radius <= 0:
+        return np.sort(strongest_order[:max_keypoints])
+
+    squared_radius = radius * radius
+    selected_positions = np.empty((max_keypoints, 2), dtype=np.float32)
+    selected_indices: List[int] = []
+    for keypoint_index in strongest_order:
+        position = keypoint_positions[keypoint_index]
+        selected_count = len(selected_indices)
+        if selected_count > 0 and np.min(np.sum(np.square(
+                selected_positions[:selected_count] - position),
+                axis=1)) < squared_radius:
+            continue
+        selected_positions[selected_count] = position
+        selected_indices.append(keypoint_index)
+        if len(selected_indices) == max_keypoints:
+            break
+    return np.sort(np.array(selected_indices, dtype=np.int64))
 
 
 class ImageSearch():
@@ -301,80 +697,307 @@ class ImageSearch():
             is less unique
                 (https://stackoverflow.com/questions/51197091/
                 how-does-the-lowes-ratio-test-work)
+        max_keypoints: maximum number of keypoints to keep from each portrait
+            and each searched segment, None to keep every keypoint
+        keypoint_radius: radius in pixels of the non-maximum suppression
+            applied when capping keypoints
+        index_backend: name of the approximate nearest neighbor backend
+            descriptors are searched with(see descriptor_index.INDEX_BACKENDS)
+        descriptor_dimensions: number of PCA dimensions descriptors are
+            projected to before they are indexed and searched, None keeps all
+            128 dimensions
+        root_sift: apply RootSIFT normalization to descriptors before they
+            are indexed and searched
+        binary_shortlist: number of heroes an ORB first stage shortlists for
+            each segment before its SIFT descriptors are matched against only
+            those heroes, None matches every segment against the whole
+            database
+        global_shortlist: number of heroes shortlisted for each segment by
+            the distance between global image descriptors, combined with the
+            binary shortlist when both are set
+        verify_candidates: number of top heroes re-ranked by the inliers of a
+            RANSAC homography when the votes of a search are ambiguous, None
+            retries ambiguous searches with every keypoint instead
+        enriched_db: whether `add_heroes` adds every hero a second time with
+            parts of the image border removed when it is not told otherwise
     """
 
-    def __init__(self, lowes_ratio: int = 0.8):
+    def __init__(self, lowes_ratio: int = 0.8, max_keypoints: int = None,
+                 keypoint_radius: float = 0.0,
+                 index_backend: str = DEFAULT_INDEX_BACKEND,
+                 descriptor_dimensions: int = None, root_sift: bool = False,
+                 binary_shortlist: int = None, global_shortlist: int = None,
+                 verify_candidates: int = None, enriched_db: bool = False):
         self.ratio = lowes_ratio
-        index_param = {"algorithm": FLANN_INDEX_KDTREE, "trees": 5}
-        search_param = {"checks": 50}
-        patch_size = 16
-        self.count = 0
-
-        self.matcher = cv2.FlannBasedMatcher(index_param, search_param)
+        # Cap on the keypoints kept from each portrait and segment, None
+        #   keeps every keypoint(see `select_keypoints`)
+        self.max_keypoints = max_keypoints
+        self.keypoint_radius = keypoint_radius
+        self.enriched_db = enriched_db
+
+        self.matcher = SegmentedIndex(
+            index_backend, DescriptorTransform(descriptor_dimensions, root_sift))
         # self.matcher = cv2.BFMatcher(cv2.NORM_L1)
-        self.extractor = cv2.SIFT_create(edgeThreshold=patch_size)
-
-        self.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        self.binary_prefilter: BinaryPrefilter = None
+        if binary_shortlist is not None:
+            self.binary_prefilter = BinaryPrefilter(binary_shortlist)
+        self.global_prefilter: GlobalPrefilter = None
+        if global_shortlist is not None:
+            self.global_prefilter = GlobalPrefilter(global_shortlist)
+        self.verifier: GeometricVerifier = None
+        if verify_candidates is not None:
+            self.verifier = GeometricVerifier(verify_candidates)
+
+        # SIFT and CLAHE objects keep internal buffers, so every thread that
+        #   extracts features gets its own instance(see `extractor`/`clahe`)
+        self._thread_local = threading.local()
 
-        # self.extractor = cv2.ORB_create(
-        #     edgeThreshold=patchSize, patchSize=patchSize)
         self.hero_lookup: Dict[str, ImageDatabaseHero] = {}
         self.index_lookup: Dict[int, ImageDatabaseHero] = {}
+        # Whether the image at each index was cropped before extraction
+        self.cropped_images: List[bool] = []
+        # Integer id for every hero name and the hero id of every image index
+        #   so votes can be counted with np.bincount
+        self.hero_names: List[str] = []
+        self.hero_ids: Dict[str, int] = {}
+        self.image_hero_ids = np.empty(0, dtype=np.int64)
+        # Mask of the image indices that have not been removed
+        self.live_images = np.empty(0, dtype=bool)
+        # Identifies the database contents for cached search results
+        self.database_key = ""
+        # Identifies the descriptor store the database was saved to or loaded
+        #   from, see descriptor_store.py
+        self.store_id: str = None
+
+        self.descriptor_cache = DescriptorCache(GV.DESCRIPTOR_CACHE_SIZE,
+                                                GV.DESCRIPTOR_CACHE_DIR)
 
-    def __getstate__(self) -> image_search_dict:
+    @property
+    def extractor(self) -> cv2.SIFT:
+        """
+        SIFT feature extractor for the current thread
+        """
+        if not hasattr(self._thread_local, "extractor"):
+            self._thread_local.extractor = cv2.SIFT_create(
+                edgeThreshold=SIFT_PATCH_SIZE)
+        return self._thread_local.extractor
+
+    @property
+    def clahe(self) -> cv2.CLAHE:
+        """
+        CLAHE histogram equalizer for the current thread
+        """
+        if not hasattr(self._thread_local, "clahe"):
+            self._thread_local.clahe = cv2.createCLAHE(
+                clipLimit=2.0, tileGridSize=(8, 8))
+        return self._thread_local.clahe
+
+    def copy(self) -> "ImageSearch":
         """
-        Serialize the ImageSearch Object into a savable state
+        Copy of the database that images can be added to or removed from
+            without changing this database, so searches running on it are not
+            affected. Descriptors, keypoints and indexes are shared until the
+            copy replaces them
 
         Returns:
-            [dict]: Dictionary with "images", "names", "matcher" and
-                "descriptors" as keys
+            ImageSearch: the copy
+        """
+        image_db = copy.copy(self)
+        # Removed heroes are only in `index_lookup`
+        database_heroes: Dict[int, ImageDatabaseHero] = {
+            id(database_hero): database_hero
+            for database_hero in [*self.hero_lookup.values(),
+                                  *self.index_lookup.values()]}
+        hero_copies = {hero_key: database_hero.copy() for
+                       hero_key, database_hero in database_heroes.items()}
+        image_db.hero_lookup = {
+            hero_name: hero_copies[id(database_hero)]
+            for hero_name, database_hero in self.hero_lookup.items()}
+        image_db.index_lookup = {
+            hero_index: hero_copies[id(database_hero)]
+            for hero_index, database_hero in self.index_lookup.items()}
+        image_db.cropped_images = list(self.cropped_images)
+        image_db.matcher = self.matcher.copy()
+        if self.binary_prefilter is not None:
+            image_db.binary_prefilter = self.binary_prefilter.copy()
+        if self.global_prefilter is not None:
+            image_db.global_prefilter = self.global_prefilter.copy()
+        if self.verifier is not None:
+            image_db.verifier = self.verifier.copy()
+        return image_db
+
+    def update_hero_ids(self):
+        """
+        Rebuild `hero_names`, `hero_ids` and `image_hero_ids` from
+            `index_lookup`
+        """
+        # Removed heroes keep their id so the image indices of their
+        #   tombstoned descriptors still map to a hero
+        self.hero_names = list(dict.fromkeys(
+            self.index_lookup[hero_index].name
+            for hero_index in range(len(self.index_lookup))))
+        self.hero_ids = {hero_name: hero_id for hero_id, hero_name in
+                         enumerate(self.hero_names)}
+        self.image_hero_ids = np.array(
+            [self.hero_ids[self.index_lookup[hero_index].name]
+             for hero_index in range(len(self.index_lookup))],
+            dtype=np.int64)
+        self.live_images = np.array(
+            [not self.matcher.is_removed(hero_index)
+             for hero_index in range(len(self.index_lookup))], dtype=bool)
+
+        database_hash = hashlib.blake2b(digest_size=16)
+        database_hash.update(
+            f"{self.ratio}:{self.keypoint_settings}:"
+            f"{self.matcher.backend_name}:"
+            f"{self.matcher.transform.checksum()}:"
+            f"{self.binary_shortlist}:"
+            f"{self.global_shortlist}:"
+            f"{self.verify_candidates}".encode("utf-8"))
+        # Cached results spilled to disk outlive the database, a portrait
+        #   replaced under the same name only changes the descriptors
+        for segment in self.matcher.segments:
+            database_hash.update(
+                segment.descriptor_checksum().encode("utf-8"))
+        for hero_index, hero_id in enumerate(self.image_hero_ids):
+            database_hash.update(self.hero_names[hero_id].encode("utf-8"))
+            if self.matcher.is_removed(hero_index):
+                database_hash.update(b"removed")
+        self.database_key = database_hash.hexdigest()
+
+    @property
+    def binary_shortlist(self) -> int:
+        """
+        Number of heroes the BinaryPrefilter shortlists, None without one
+        """
+        if self.binary_prefilter is None:
+            return None
+        return self.binary_prefilter.shortlist_size
+
+    @property
+    def global_shortlist(self) -> int:
+        """
+        Number of heroes the GlobalPrefilter shortlists, None without one
+        """
+        if self.global_prefilter is None:
+            return None
+        return self.global_prefilter.shortlist_size
+
+    @property
+    def verify_candidates(self) -> int:
+        """
+        Number of heroes the GeometricVerifier re-ranks, None without one
         """
+        if self.verifier is None:
+            return None
+        return self.verifier.candidate_count
+
+    @property
+    def has_prefilter(self) -> bool:
+        """
+        True when segments are shortlisted before being matched against the
+            whole database
+        """
+        return (self.binary_prefilter is not None or
+                self.global_prefilter is not None)
 
-        file_name = str(GV.DATABASE_FLAN_PATH)
-        self.matcher.write(file_name)
-        return {"hero_lookup": self.hero_lookup,
-                "index_lookup": self.index_lookup,
-                "matcher": file_name,
-                "descriptors": self.matcher.getTrainDescriptors()
-                }
+    @property
+    def keypoint_settings(self) -> str:
+        """
+        Identifies the keypoint cap features are extracted with
+        """
+        return f"{self.max_keypoints}:{self.keypoint_radius}"
 
-    def __setstate__(self, incoming: image_search_dict):
+    def detect_keypoints(self, processed_image: np.ndarray):
         """
-        Deserialize the ImageSearch Object into a savable state
+        Run SIFT on a preprocessed image and apply the keypoint cap
 
         Args:
-            incoming ([image_search_dict]): [description]
+            processed_image (np.ndarray): image returned by `image_pre_process`
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: (n, 2) float32 (x, y) keypoint
+                positions and (n, 128) float32 descriptors
+        """
+        keypoints, descriptor = self.extractor.detectAndCompute(
+            processed_image, None)
+        if descriptor is None:
+            descriptor = np.empty(
+                (0, self.extractor.descriptorSize()), dtype=np.float32)
+        keypoint_positions = np.array(
+            [keypoint.pt for keypoint in keypoints],
+            dtype=np.float32).reshape(-1, 2)
+
+        if (self.max_keypoints is not None and
+                len(keypoints) > self.max_keypoints):
+            responses = np.array([keypoint.response for keypoint in keypoints],
+                                 dtype=np.float32)
+            selected_keypoints = select_keypoints(
+                keypoint_positions, responses, self.max_keypoints,
+                self.keypoint_radius)
+            keypoint_positions = keypoint_positions[selected_keypoints]
+            descriptor = descriptor[selected_keypoints]
+        return keypoint_positions, descriptor
+
+    @classmethod
+    def _count_cache(cls, cache_name: str, hit: bool,
+                     context: RequestContext):
         """
-        self.matcher: cv2.FlannBasedMatcher
-        self.__init__()
-        self.hero_lookup = incoming["hero_lookup"]
-        self.index_lookup = incoming["index_lookup"]
-        descriptors = incoming["descriptors"]
-        for des in descriptors:
-            self.matcher.add([des])
-        self.matcher.read(incoming["matcher"])
+        Record a cache hit or miss on the timer of the request
+        """
+        context.timer.count(f"{cache_name} Cache {'Hit' if hit else 'Miss'}")
 
-    def get_good_features(self, matches: list, ratio: int):
+    def get_good_features(self, matches: KnnMatches, ratio: int):
         """
-        Return a list of "good" features from 'matches' that pass the Lowe's
-            ratio test at the ratio passed in
+        Return a mask of the "good" features from 'matches' that pass the
+            Lowe's ratio test at the ratio passed in
         https://docs.opencv.org/3.4/d5/d6f/tutorial_feature_flann_matcher.html
 
         Args:
-            matches: list of keypoint descriptors
+            matches: k=2 knn matches of keypoint descriptors
             ratio: integer representing what ratio Lowes' test must pass,
                 default ratio is 0.8
 
         Return:
-            list of 'matches' that pass the Lowe's ratio test at the given
-                ratio
+            boolean mask of 'matches' that pass the Lowe's ratio test at the
+                given ratio
         """
-        good_features = []
-        for best_match, second_best_match in matches:
-            if best_match.distance < ratio * second_best_match.distance:
-                good_features.append(best_match)
+        # The same comparison as `solve_ratio`, so the ratio it picks lets
+        #   exactly the number of features it counted pass
+        return matches.ratios() < ratio
 
-        return good_features
+    def solve_ratio(self, matches: KnnMatches, min_features: int):
+        """
+        Find the smallest ratio on the ladder of
+            (self.ratio + RATIO_STEP, self.ratio + 2 * RATIO_STEP, ...) that
+            lets at least `min_features` of `matches` pass the Lowe's ratio
+            test, in a single pass over the sorted match ratios
+
+        Args:
+            matches: k=2 knn matches of keypoint descriptors
+            min_features: minimum number of "good_features" to find
+
+        Returns:
+            float: the ratio to filter 'matches' with, when no ratio on the
+                ladder passes enough features the loosest ratio is returned
+        """
+        ratio_ladder: List[float] = []
+        ratio = self.ratio
+        while ratio <= 1.0:
+            ratio_ladder.append(ratio + RATIO_STEP)
+            ratio += RATIO_STEP
+        if not ratio_ladder:
+            return self.ratio
+
+        match_ratios = np.sort(matches.ratios())
+
+        # Number of ratios strictly below each ratio on the ladder
+        passing_counts = np.searchsorted(match_ratios, ratio_ladder,
+                                         side="left")
+        passing_ladder_indices = np.flatnonzero(passing_counts >= min_features)
+        if len(passing_ladder_indices) == 0:
+            return ratio_ladder[-1]
+        return ratio_ladder[passing_ladder_indices[0]]
 
     def image_pre_process(self, hero_image: np.ndarray,
                           crop_info: CropImageInfo = None,
@@ -407,6 +1030,176 @@ class ImageSearch():
 
         return clahe_image
 
+    def add_heroes(self, image_list: List[HeroImage],
+                   enriched_db: bool = None, workers: int = None):
+        """
+        Add hero portraits to the database, only the index segment holding the
+            new images is built so the rest of the database is untouched
+
+        Portraits are decoded and have their features extracted in a process
+            pool, the results are added in the order of `image_list` so the
+            image indices do not depend on the number of workers
+
+        Args:
+            image_list (List[HeroImage]): hero portraits to add, portraits
+                without an image are read from their image_path
+            enriched_db (bool, optional): flag to add every hero to the database
+                a second time with parts of the the image border removed from
+                each side. Defaults to the `enriched_db` the database was
+                created with
+            workers (int, optional): number of processes to extract features
+                with. Defaults to GV.WORKER_COUNT
+        """
+        if enriched_db is None:
+            enriched_db = self.enriched_db
+        crop_info = None
+        if enriched_db:
+            crop_info = CropImageInfo(0.15, 0.08, 0.25, 0.2)
+        crop_info_list = [None, crop_info]
+
+        if workers is None:
+            workers = GV.WORKER_COUNT
+        if workers > 1 and len(image_list) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                descriptor_lists = list(executor.map(
+                    _hero_descriptors, image_list, repeat(crop_info_list),
+                    repeat(self.extractor_settings),
+                    chunksize=max(1, len(image_list) // (workers * 4))))
+        else:
+            descriptor_lists = [
+                self.hero_descriptors(hero_info, crop_info_list)
+                for hero_info in image_list]
+
+        for hero_info, descriptor_list in zip(image_list, descriptor_lists):
+            for hero_crop_info, portrait_descriptors in zip(crop_info_list,
+                                                            descriptor_list):
+                self.add_descriptors(hero_info,
+                                     portrait_descriptors.descriptors,
+                                     hero_crop_info is not None,
+                                     portrait_descriptors.binary_descriptors,
+                                     portrait_descriptors.global_descriptor,
+                                     portrait_descriptors.keypoints)
+
+        self.matcher.train()
+        if self.binary_prefilter is not None:
+            self.binary_prefilter.train()
+        if self.global_prefilter is not None:
+            self.global_prefilter.train()
+        if self.verifier is not None:
+            self.verifier.train()
+        self.update_hero_ids()
+
+    @property
+    def extractor_settings(self) -> dict:
+        """
+        ImageSearch arguments a database build worker needs to extract the
+            same features as this database
+        """
+        return {"max_keypoints": self.max_keypoints,
+                "keypoint_radius": self.keypoint_radius,
+                "binary_shortlist": self.binary_shortlist,
+                "global_shortlist": self.global_shortlist,
+                "verify_candidates": self.verify_candidates}
+
+    def hero_descriptors(self, hero_info: HeroImage,
+                         crop_info_list: List[CropImageInfo]
+                         ) -> List[PortraitDescriptors]:
+        """
+        Extract the SIFT descriptors, and the ORB descriptors, global
+            descriptors and keypoint positions when the database has a
+            BinaryPrefilter, GlobalPrefilter or GeometricVerifier, of a hero
+            portrait once for every entry of `crop_info_list`
+
+        Args:
+            hero_info (HeroImage): hero portrait, read from its image_path when
+                it has no image
+            crop_info_list (List[CropImageInfo]): crop to apply before each
+                extraction, None for no cropping
+
+        Raises:
+            FileNotFoundError: raised when the portrait cannot be read from
+                its image_path
+
+        Returns:
+            List[PortraitDescriptors]: descriptors for each entry of
+                `crop_info_list`
+        """
+        hero_image = hero_info.image
+        if hero_image is None:
+            hero_image = cv2.imread(str(hero_info.image_path))
+            if hero_image is None:
+                raise FileNotFoundError(
+                    f"Hero Image not found: {hero_info.image_path}")
+
+        # Computed from the portrait's center, the same for every crop
+        portrait_global_descriptor = None
+        if self.global_prefilter is not None:
+            portrait_global_descriptor = global_descriptor(hero_image)
+
+        descriptor_list = []
+        for crop_info in crop_info_list:
+            processed_image = self.image_pre_process(hero_image, crop_info)
+            keypoint_positions, descriptor = self.detect_keypoints(
+                processed_image)
+            if self.verifier is None:
+                keypoint_positions = None
+            binary_descriptor = None
+            if self.binary_prefilter is not None:
+                binary_descriptor = self.binary_prefilter.detect(processed_image)
+            if GV.verbosity(2):
+                print(f"Extracted Hero: {hero_info.name} from "
+                      f"{hero_info.image_path} Size: ({hero_image.shape[0]}, "
+                      f"{hero_image.shape[1]}) -> {processed_image.shape[:2]} "
+                      f"{'(cropped)' if crop_info else ''}")
+            descriptor_list.append(PortraitDescriptors(
+                descriptor, binary_descriptor, portrait_global_descriptor,
+                keypoint_positions))
+        return descriptor_list
+
+    def remove_hero(self, hero_name: str):
+        """
+        Remove every portrait of `hero_name` from the database. The
+            descriptors are tombstoned and only the index segments that held
+            them are rebuilt
+
+        Args:
+            hero_name (str): name of the hero to remove
+
+        Raises:
+            KeyError: raised when `hero_name` is not in the database
+        """
+        if hero_name not in self.hero_lookup:
+            raise KeyError(f"{hero_name} is not in the hero database")
+
+        database_hero = self.hero_lookup[hero_name]
+        for hero_index in list(database_hero.hero_index_lookup):
+            if not self.matcher.is_removed(hero_index):
+                self.tombstone_image(hero_index)
+
+        self.matcher.train()
+        self.update_hero_ids()
+
+    def tombstone_image(self, hero_index: int):
+        """
+        Exclude the image at `hero_index` from search results. The image keeps
+            its index and stays in `index_lookup`, the hero is removed from
+            `hero_lookup` once none of its images are left. The index needs to
+            be trained again before searching
+
+        Args:
+            hero_index (int): index of the image to remove
+        """
+        self.matcher.remove_image(hero_index)
+        database_hero = self.index_lookup[hero_index]
+        hero_record = database_hero.hero_index_lookup[hero_index]
+        if (hero_record in database_hero.hero_instances and
+                all(self.matcher.is_removed(record_index) for record_index in
+                    hero_record.index_range)):
+            database_hero.hero_instances.remove(hero_record)
+        if (not database_hero.hero_instances and
+                self.hero_lookup.get(database_hero.name) is database_hero):
+            del self.hero_lookup[database_hero.name]
+
     def add_image(self, hero_info: HeroImage,
                   crop_info: CropImageInfo = None):
         """
@@ -423,36 +1216,202 @@ class ImageSearch():
             None
         """
 
-        hero_image = self.image_pre_process(hero_info.image, crop_info)
-
-        _keypoint, descriptor = self.extractor.detectAndCompute(
-            hero_image, None)
+        portrait_descriptors, = self.hero_descriptors(hero_info, [crop_info])
+        self.add_descriptors(hero_info, portrait_descriptors.descriptors,
+                             crop_info is not None,
+                             portrait_descriptors.binary_descriptors,
+                             portrait_descriptors.global_descriptor,
+                             portrait_descriptors.keypoints)
+
+    def add_descriptors(self, hero_info: HeroImage, descriptor: np.ndarray,
+                        cropped: bool = False,
+                        binary_descriptor: np.ndarray = None,
+                        image_global_descriptor: np.ndarray = None,
+                        keypoints: np.ndarray = None):
+        """
+        Adds already extracted image features to the image database. The
+            database is only searchable once the matcher and prefilters are
+            trained and `update_hero_ids` is called, like `add_heroes` does
 
-        self.matcher.add([descriptor])
+        Args:
+            hero_info: (HeroImage): hero the features were extracted from, the
+                image itself is not needed
+            descriptor (np.ndarray): SIFT descriptors of the hero image
+            cropped (bool, optional): flag for when the hero image was cropped
+                before its features were extracted. Defaults to False.
+            binary_descriptor (np.ndarray, optional): ORB descriptors of the
+                hero image, needed when the database has a BinaryPrefilter.
+                Defaults to None.
+            image_global_descriptor (np.ndarray, optional): global descriptor
+                of the hero image, needed when the database has a
+                GlobalPrefilter. Defaults to None.
+            keypoints (np.ndarray, optional): position of each SIFT
+                descriptor, needed when the database has a GeometricVerifier.
+                Defaults to None.
+        """
+        self.matcher.add(descriptor)
+        if self.binary_prefilter is not None:
+            self.binary_prefilter.add(binary_descriptor)
+        if self.global_prefilter is not None:
+            self.global_prefilter.add(image_global_descriptor)
+        if self.verifier is not None:
+            self.verifier.add(keypoints)
+        self.register_image(hero_info, cropped)
+
+    def register_image(self, hero_info: HeroImage, cropped: bool = False):
+        """
+        Assign the next image index to `hero_info` without adding any
+            descriptors, used when the descriptors are loaded into the matcher
+            directly. Only the name and path of `hero_info` are kept, its
+            image is never stored in the database
 
+        Args:
+            hero_info: (HeroImage): hero to register
+            cropped (bool, optional): flag for when the hero image was cropped
+                before its features were extracted. Defaults to False.
+        """
         hero_index = len(self.index_lookup)
-
-        if GV.verbosity(2):
-            print(f"Added Hero ({hero_index}): {hero_info.name} from "
-                  f"{hero_info.image_path} Size: ({hero_image.shape[0]}, "
-                  f"{hero_image.shape[1]}) -> {hero_image.shape[:2]} "
-                  f"{'(cropped)' if crop_info else ''}")
+        self.cropped_images.append(cropped)
 
         if hero_info.name not in self.hero_lookup:
-            database_hero = ImageDatabaseHero(
-                hero_info.name, hero_info, hero_index)
-            self.hero_lookup[hero_info.name] = database_hero
-        else:
-            database_hero = self.hero_lookup[hero_info.name]
-            database_hero.hero_index_lookup[hero_index] = hero_info
-            database_hero.hero_instances.append(hero_info)
+            self.hero_lookup[hero_info.name] = ImageDatabaseHero(
+                hero_info.name)
+        database_hero = self.hero_lookup[hero_info.name]
+        database_hero.add_index(hero_index, hero_info.image_path)
 
         self.index_lookup[hero_index] = database_hero
 
+    def extract_features(self, segment_info: SegmentResult,
+                         crop_info: CropImageInfo = None,
+                         image_multiplier=1.0,
+                         context: RequestContext = None) -> SegmentFeatures:
+        """
+        Preprocess a segmented image and extract its SIFT keypoints and
+            descriptors, and its ORB and global descriptors when the database
+            has a BinaryPrefilter or GlobalPrefilter
+
+        Args:
+            segment_info: info describing the location of a segmented image
+                that represents a subsection of a larger image
+            crop_info (CropImageInfo): Named Tuple that contains information on
+                how much to crop 'hero'. When this is None no cropping happens
+            image_multiplier (float, optional): multiplier applied to
+                GV.HERO_PORTRAIT_SIZE when resizing. Defaults to 1.0.
+            context (RequestContext, optional): request cache hits and misses
+                are counted on, built from the global variables when None.
+                Defaults to None.
+
+        Returns:
+            SegmentFeatures: keypoint positions and float32 descriptors, has 0
+                rows when no keypoints were found
+        """
+        if context is None:
+            context = RequestContext.from_globals()
+        hero_image = self.image_pre_process(
+            segment_info.image, crop_info, image_multiplier)
+
+        hero_image_key = image_key(hero_image)
+        if self.global_prefilter is not None:
+            # The global descriptor comes from the color segment image, which
+            #   the grayscale preprocessed image does not identify
+            hero_image_key = (
+                f"{hero_image_key}:{image_key(segment_info.image)}")
+        cache_key = (f"features:{self.keypoint_settings}:"
+                     f"{self.binary_prefilter is not None}:"
+                     f"{self.global_prefilter is not None}:{hero_image_key}")
+        segment_features: SegmentFeatures = self.descriptor_cache.get(
+            cache_key)
+        self._count_cache("Descriptor", segment_features is not None,
+                          context)
+        if segment_features is not None:
+            return segment_features
+
+        keypoint_positions, descriptor = self.detect_keypoints(hero_image)
+        binary_descriptor = None
+        if self.binary_prefilter is not None:
+            binary_descriptor = self.binary_prefilter.detect(hero_image)
+        segment_global_descriptor = None
+        if self.global_prefilter is not None:
+            segment_global_descriptor = global_descriptor(segment_info.image)
+        segment_features = SegmentFeatures(
+            keypoint_positions, descriptor, hero_image.shape[:2],
+            hero_image_key, binary_descriptor, segment_global_descriptor)
+        self.descriptor_cache.put(cache_key, segment_features)
+        return segment_features
+
+    def extract_many(self, segment_list: List[SegmentResult],
+                     crop_info: CropImageInfo = None,
+                     image_multiplier=1.0,
+                     workers: int = None,
+                     context: RequestContext = None
+                     ) -> List[SegmentFeatures]:
+        """
+        Run `extract_features` on every segment in `segment_list` using a
+            pool of `workers` threads. OpenCV releases the GIL while
+            preprocessing and extracting so the segments are processed
+            concurrently
+
+        Args:
+            segment_list: segmented images to extract descriptors from
+            crop_info (CropImageInfo): Named Tuple that contains information on
+                how much to crop each segment. When this is None no cropping
+                happens
+            image_multiplier (float, optional): multiplier applied to
+                GV.HERO_PORTRAIT_SIZE when resizing. Defaults to 1.0.
+            workers (int, optional): number of threads to extract with.
+                Defaults to the worker count of `context`
+            context (RequestContext, optional): options of the request, built
+                from the global variables when None. Defaults to None.
+
+        Returns:
+            List[SegmentFeatures]: features for each segment in the same order
+                as `segment_list`
+        """
+        if context is None:
+            context = RequestContext.from_globals()
+        if workers is None:
+            workers = context.worker_count
+        workers = min(workers, len(segment_list))
+
+        if workers <= 1:
+            return [self.extract_features(segment_info, crop_info,
+                                          image_multiplier, context)
+                    for segment_info in segment_list]
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(
+                lambda segment_info: self.extract_features(
+                    segment_info, crop_info, image_multiplier, context),
+                segment_list))
+
+    def knn_many(self, descriptor_list: List[np.ndarray]) -> List[KnnMatches]:
+        """
+        Stack the descriptors in `descriptor_list` and match them against the
+            database with a single knn_search call, then split the matches back
+            apart using an offsets table
+
+        Args:
+            descriptor_list (List[np.ndarray]): descriptors to match
+
+        Returns:
+            List[KnnMatches]: k=2 matches for each entry of `descriptor_list`
+        """
+        offsets = np.cumsum(
+            [0] + [len(descriptor) for descriptor in descriptor_list])
+        query = np.empty((0, 128), dtype=np.float32)
+        if offsets[-1] > 0:
+            query = np.vstack(descriptor_list)
+        matches = KnnMatches.from_neighbors(*self.matcher.knn_search(query))
+
+        return [matches.slice(offsets[descriptor_index],
+                              offsets[descriptor_index + 1])
+                for descriptor_index in range(len(descriptor_list))]
+
     def search(self, segment_info: SegmentResult,
                min_features: int = 5,
                crop_info: CropImageInfo = CropImageInfo(0.15, 0.08, 0.25, 0.2),
-               image_multiplier=1.0):
+               image_multiplier=1.0,
+               context: RequestContext = None):
         """
         Find closest matching image in the database
 
@@ -465,99 +1424,389 @@ class ImageSearch():
                 hero votes to attemp to find on a search
             crop_info (CropImageInfo): Named Tuple that contains information on
                 how much to crop 'hero'. When this is None no cropping happens
+            context (RequestContext, optional): options and timer of the
+                request, built from the global variables when None. Defaults
+                to None.
         Returns:
-            Tuple containing
-                (hero_info: image_processing.hero_data.HeroImage,
-                 image: np.ndarray)
-            of the closest matching image in the database
+            HeroMatchList: matches for the closest images in the database
         """
 
-        hero_image = self.image_pre_process(
-            segment_info.image, crop_info, image_multiplier)
+        return self.search_many([segment_info], min_features, crop_info,
+                                image_multiplier, context)[0]
 
-        _keypoint, descriptor = self.extractor.detectAndCompute(
-            hero_image, None)
-        matches = self.matcher.knnMatch(np.array(descriptor), k=2)
+    def search_many(self, segment_list: List[SegmentResult],
+                    min_features: int = 5,
+                    crop_info: CropImageInfo = CropImageInfo(
+                        0.15, 0.08, 0.25, 0.2),
+                    image_multiplier=1.0,
+                    context: RequestContext = None):
+        """
+        Find the closest matching image in the database for every segment in
+            `segment_list`. The descriptors of all segments are stacked and
+            matched against the database with a single knn_search call, then
+            split back apart per segment
 
-        ratio = self.ratio
-        good_features: List[cv2.DMatch] = []
+        Features are extracted once from each uncropped segment, the first
+            pass only uses the keypoints inside the `crop_info` window. When
+            the first pass is not confident the remaining keypoints are
+            matched and the search is redone over every keypoint, without
+            extracting the segment a second time
 
-        while len(good_features) < min_features and ratio <= 1.0:
-            good_features = self.get_good_features(matches, ratio+0.05)
-            ratio += 0.05
+        Args:
+            segment_list: segmented images to search for
+            min_features: minimum number of both "good_features" and single
+                hero votes to attemp to find on a search
+            crop_info (CropImageInfo): Named Tuple that contains information on
+                how much to crop each segment. When this is None no cropping
+                happens
+            image_multiplier (float, optional): multiplier applied to
+                GV.HERO_PORTRAIT_SIZE when resizing. Defaults to 1.0.
+            context (RequestContext, optional): options and timer of the
+                request, built from the global variables when None. Defaults
+                to None.
+        Returns:
+            List[HeroMatchList]: matches for each segment in the same order as
+                `segment_list`
+        """
+        if len(segment_list) == 0:
+            return []
+        if context is None:
+            context = RequestContext.from_globals()
+
+        features_list = self.extract_many(
+            segment_list, image_multiplier=image_multiplier, context=context)
+
+        # Search results are cached by image and search parameters, feature
+        #   detail is not cached so results are always recomputed in debug mode
+        result_keys = [
+            (f"matches:{self.database_key}:{segment_features.image_key}:"
+             f"{min_features}:{tuple(crop_info) if crop_info else None}")
+            for segment_features in features_list]
+        hero_match_list: List[HeroMatchList] = [None] * len(segment_list)
+        if not context.debug:
+            for segment_index, result_key in enumerate(result_keys):
+                summary = self.descriptor_cache.get(result_key)
+                self._count_cache("Match", summary is not None, context)
+                if summary is not None:
+                    hero_match_list[segment_index] = (
+                        HeroMatchList.from_summary(self.hero_names, summary))
+
+        search_indices = [segment_index for segment_index, hero_matches in
+                          enumerate(hero_match_list) if hero_matches is None]
+        search_results = self._search_features(
+            [features_list[segment_index] for segment_index in search_indices],
+            min_features, crop_info, context)
+        for segment_index, hero_matches in zip(search_indices,
+                                               search_results):
+            hero_match_list[segment_index] = hero_matches
+            if not context.debug:
+                self.descriptor_cache.put(result_keys[segment_index],
+                                          hero_matches.summary())
+
+        for hero_matches in hero_match_list:
+            if self.hero_lookup[hero_matches.best().name].first() is None:
+                raise NoMatchException(
+                    f"Unable to find a match for {hero_matches.best().name}")
+
+            if context.verbosity(2):
+                print(hero_matches.best(), hero_matches)
+
+        return hero_match_list
+
+    def _search_features(self, features_list: List[SegmentFeatures],
+                         min_features: int,
+                         crop_info: CropImageInfo,
+                         context: RequestContext) -> List[HeroMatchList]:
+        """
+        Match the features of each segment against the database, first using
+            only the keypoints inside the `crop_info` window and then every
+            keypoint for the segments that were not confidently matched
 
-        assert (len(good_features) >= min_features), (
-            f"Failed to find enough \"good\" features ({len(good_features)}) "
-            "from database to match a similar image. Expected at least "
-            f"({min_features}) good features to be found")
+        With a BinaryPrefilter or GlobalPrefilter each segment is first
+            matched against only the heroes it shortlisted, segments that are
+            not confidently matched that way fall back to the whole database.
+            With a GeometricVerifier the top heroes of ambiguous segments are
+            re-ranked by homography inliers, only segments that cannot be
+            verified are searched again over every keypoint
 
-        hero_matches = self._search_results(good_features)
-        if crop_info:
-            self.count += 1
-            self.count %= 20
-        # if self.count in (12, 19):
-        #     print(f"{self.count} {hero_matches}\n")
-        #     for hero_match in hero_matches:
-        #         print(hero_match.name, self.hero_lookup[hero_match.name])
-        #         for feature_match in hero_match.matches:
-        #             print(
-        #                 self.index_lookup[
-        # feature_match.hero_index].hero_index_lookup[
-        # feature_match.hero_index].image.shape)
+        Args:
+            features_list: features extracted from each uncropped segment
+            min_features: minimum number of both "good_features" and single
+                hero votes to attemp to find on a search
+            crop_info (CropImageInfo): Named Tuple that contains information on
+                the crop window to use for the first pass. When this is None
+                every keypoint is used
+            context: options of the request being searched for
+
+        Returns:
+            List[HeroMatchList]: matches for each entry of `features_list`
+        """
+        if len(features_list) == 0:
+            return []
+
+        window_masks = [segment_features.window_mask(crop_info)
+                        for segment_features in features_list]
+        hero_match_list: List[HeroMatchList] = [None] * len(features_list)
+        if self.has_prefilter:
+            for segment_index, segment_features in enumerate(features_list):
+                hero_match_list[segment_index] = self._shortlist_search(
+                    segment_features, window_masks[segment_index],
+                    min_features, context)
+
+        # Segments without a confident shortlist match are searched against
+        #   the whole database
+        full_indices = [segment_index for segment_index, hero_matches in
+                        enumerate(hero_match_list) if hero_matches is None]
+        window_matches: Dict[int, KnnMatches] = dict(zip(
+            full_indices, self.knn_many(
+                [features_list[segment_index].descriptors[
+                    window_masks[segment_index]]
+                 for segment_index in full_indices])))
+        for segment_index in full_indices:
+            hero_match_list[segment_index] = self._match_results(
+                window_matches[segment_index], min_features, context)
+
+        verified_indices = set()
+        if self.verifier is not None:
+            verified_indices = {
+                segment_index for segment_index in full_indices
+                if self.verifier.is_ambiguous(
+                    hero_match_list[segment_index].match_counts,
+                    CONFIDENT_MATCH_COUNT) and
+                self._verify_matches(
+                    features_list[segment_index].keypoints[
+                        window_masks[segment_index]],
+                    window_matches[segment_index],
+                    hero_match_list[segment_index], context)}
 
         # Check for a better hero match with different image preprocessing or
         #   log diagnostic information about the hero_matches if no better
         #   preprocessing is possible
-        if hero_matches.best().match_count < 10 or not crop_info:
-            if crop_info:
-                if GV.verbosity(1):
-                    print(f"\tOriginal {hero_matches}")
-                new_matches = self.search(segment_info, crop_info=None)
-                hero_matches.extend(new_matches)
-            else:
-                if GV.verbosity(1):
-                    print(f"\tRedo {hero_matches}")
-
-        if self.hero_lookup[hero_matches.best().name].first() is None:
-            raise NoMatchException(
-                f"Unable to find a match for {hero_matches.best().name}")
-
-        if GV.verbosity(2):
-            print(hero_matches.best(), hero_matches)
+        retry_indices: List[int] = []
+        for segment_index in full_indices:
+            if segment_index in verified_indices:
+                continue
+            hero_matches = hero_match_list[segment_index]
+            if (hero_matches.best().match_count < CONFIDENT_MATCH_COUNT or
+                    not crop_info):
+                if crop_info:
+                    context.print_verbose(f"\tOriginal {hero_matches}",
+                                          verbose_level=1)
+                    retry_indices.append(segment_index)
+                else:
+                    context.print_verbose(f"\tRedo {hero_matches}",
+                                          verbose_level=1)
+
+        # Redo the search over every keypoint, only the keypoints outside of
+        #   the crop window still need to be matched
+        outside_matches = self.knn_many(
+            [features_list[segment_index].descriptors[
+                ~window_masks[segment_index]]
+             for segment_index in retry_indices])
+        for segment_index, segment_outside_matches in zip(retry_indices,
+                                                          outside_matches):
+            segment_matches = KnnMatches.from_mask(
+                window_masks[segment_index], window_matches[segment_index],
+                segment_outside_matches)
+            new_matches = self._match_results(segment_matches, 5, context)
+            context.print_verbose(f"\tRedo {new_matches}", verbose_level=1)
+            hero_match_list[segment_index].extend(new_matches)
+
+        return hero_match_list
+
+    def _shortlist_search(self, segment_features: SegmentFeatures,
+                          window_mask: np.ndarray,
+                          min_features: int,
+                          context: RequestContext) -> HeroMatchList:
+        """
+        Match the SIFT descriptors inside the crop window of a segment against
+            only the images of the heroes shortlisted by its ORB descriptors,
+            its global descriptor, or the union of both
+
+        Args:
+            segment_features: features extracted from the segment
+            window_mask: mask of the keypoints inside of the crop window
+            min_features: minimum number of "good_features" to find
+            context: options of the request being searched for
 
+        Returns:
+            HeroMatchList: matches for the segment, None when the shortlist
+                was not confident and the whole database needs to be searched
+        """
+        hero_shortlists: List[np.ndarray] = []
+        if self.global_prefilter is not None:
+            hero_shortlists.append(self.global_prefilter.shortlist(
+                segment_features.global_descriptor, self.image_hero_ids,
+                self.live_images))
+        if self.binary_prefilter is not None:
+            hero_shortlists.append(self.binary_prefilter.shortlist(
+                segment_features.binary_descriptors, self.image_hero_ids,
+                self.live_images))
+        hero_shortlists = [hero_shortlist for hero_shortlist in hero_shortlists
+                           if hero_shortlist is not None]
+        window_descriptors = segment_features.descriptors[window_mask]
+        if not hero_shortlists or len(window_descriptors) < min_features:
+            return None
+        hero_shortlist = np.unique(np.concatenate(hero_shortlists))
+
+        candidate_images = np.flatnonzero(
+            np.isin(self.image_hero_ids, hero_shortlist) & self.live_images)
+        matches = KnnMatches.from_neighbors(*self.matcher.knn_search_images(
+            window_descriptors, candidate_images))
+        hero_matches = self._match_results(matches, min_features, context)
+        if hero_matches.best().match_count < CONFIDENT_MATCH_COUNT:
+            return None
+        context.print_verbose(f"\tShortlist {hero_matches}", verbose_level=1)
         return hero_matches
 
-    def _search_results(self, good_features: List[cv2.DMatch]):
+    def _verify_matches(self, query_keypoints: np.ndarray,
+                        matches: KnnMatches,
+                        hero_matches: HeroMatchList,
+                        context: RequestContext) -> bool:
+        """
+        Re-rank the top heroes of `hero_matches` by the inliers of a RANSAC
+            homography between the segment and each of their portraits
+
+        The correspondences of a portrait are the segment keypoints whose
+            nearest database descriptor is in that portrait, so no descriptors
+            are matched again. The correspondences bound the inliers a
+            portrait can have, so a portrait is skipped without fitting a
+            homography when its bound is below min_inliers or not above the
+            inliers already found for its hero
+
+        The verified confidence is the share of the best hero's inliers out of
+            the best and runner up inliers, a runner up that was skipped uses
+            its bound
+
+        Args:
+            query_keypoints: (n, 2) positions of the keypoints `matches` were
+                found for
+            matches: k=2 knn matches of the segment's keypoints
+            hero_matches: matches of the segment, updated in place when
+                verification succeeds
+            context: options of the request being searched for
+
+        Returns:
+            bool: True when the best hero had at least min_inliers inliers
         """
-        Organises good_feature matches by hero that each keypoint descriptor
-            matched to
+        candidate_heroes = hero_matches.hero_ids[
+            :self.verifier.candidate_count]
+        candidate_images = np.flatnonzero(
+            np.isin(self.image_hero_ids, candidate_heroes) & self.live_images)
+        image_matches: List[tuple] = []
+        for image_index in candidate_images:
+            image_mask = matches.image_indices == image_index
+            image_matches.append((int(np.count_nonzero(image_mask)),
+                                  int(self.image_hero_ids[image_index]),
+                                  image_index,
+                                  matches.train_indices[image_mask],
+                                  query_keypoints[image_mask]))
+        image_matches.sort(key=lambda image_match: -image_match[0])
+
+        # Inliers of each verified hero, or the bound on its inliers for
+        #   heroes whose portraits were all skipped
+        hero_inliers: Dict[int, int] = {}
+        hero_bounds: Dict[int, int] = {}
+        for match_count, hero_id, image_index, train_indices, query_points in (
+                image_matches):
+            if (match_count < self.verifier.min_inliers or
+                    match_count <= hero_inliers.get(hero_id, -1)):
+                hero_bounds[hero_id] = max(hero_bounds.get(hero_id, 0),
+                                           match_count)
+                continue
+            inliers = self.verifier.inlier_count(
+                query_points, self.verifier.image_keypoints(
+                    image_index, train_indices))
+            hero_inliers[hero_id] = max(hero_inliers.get(hero_id, 0), inliers)
+
+        best_inliers = max(hero_inliers.values(), default=0)
+        if best_inliers < self.verifier.min_inliers:
+            return False
+        best_hero = max(hero_inliers, key=hero_inliers.get)
+        runner_up = max([inliers for hero_id, inliers in hero_inliers.items()
+                         if hero_id != best_hero] +
+                        [bound for hero_id, bound in hero_bounds.items()
+                         if hero_id not in hero_inliers] + [0])
+        hero_matches.set_inliers(
+            np.array(list(hero_inliers), dtype=np.int64),
+            np.array(list(hero_inliers.values()), dtype=np.int64),
+            best_inliers / (best_inliers + runner_up))
+        context.print_verbose(
+            f"\tVerified {hero_matches.best()} confidence="
+            f"{hero_matches.verified_confidence:.2f}", verbose_level=1)
+        return True
+
+    def _match_results(self, matches: KnnMatches, min_features: int,
+                       context: RequestContext):
+        """
+        Apply Lowe's ratio test to the knn matches of a single segment,
+            loosening the ratio until at least `min_features` pass
+
         Args:
-            good_features: keypoint descriptors that have passed the lowe's
-                ratio test.
+            matches: k=2 knn matches for each descriptor of a segment
+            min_features: minimum number of "good_features" to find
+            context: options of the request being searched for
 
         Return:
             HeroMatchList object containing all HeroMatches extracted
-                from good_features
+                from 'matches'
         """
+        ratio = self.solve_ratio(matches, min_features)
+        good_mask = self.get_good_features(matches, ratio)
+        good_feature_count = int(np.count_nonzero(good_mask))
 
-        hero_matches_dict: Dict[str, HeroMatch] = {}
-        for flann_match in good_features:
-            hero_index: int = flann_match.imgIdx
-            hero_name = self.index_lookup[hero_index].name
-            feature = FeatureMatch(hero_name, hero_index, flann_match)
+        assert (good_feature_count >= min_features), (
+            f"Failed to find enough \"good\" features ({good_feature_count}) "
+            "from database to match a similar image. Expected at least "
+            f"({min_features}) good features to be found")
 
-            if hero_name not in hero_matches_dict:
-                hero_matches_dict[hero_name] = HeroMatch(hero_name)
-            hero_matches_dict[hero_name].add_match(feature)
+        return self._search_results(matches, good_mask, context)
 
-        hero_matches = HeroMatchList(hero_matches_dict.values())
+    def _search_results(self, matches: KnnMatches, good_mask: np.ndarray,
+                        context: RequestContext):
+        """
+        Count the hero votes of the good_feature matches by the hero each
+            keypoint descriptor matched to
+        Args:
+            matches: k=2 knn matches for each descriptor of a segment
+            good_mask: mask of the 'matches' that passed the lowe's ratio test
+            context: options of the request, feature detail is recorded for
+                debug requests
 
-        return hero_matches
+        Return:
+            HeroMatchList object containing all HeroMatches extracted
+                from the good features in 'matches'
+        """
+
+        good_hero_ids = self.image_hero_ids[matches.image_indices[good_mask]]
+
+        features = None
+        if context.debug:
+            good_matches = KnnMatches(*[match_array[good_mask]
+                                        for match_array in matches])
+            features = {
+                int(hero_id): KnnMatches(*[
+                    match_array[good_hero_ids == hero_id]
+                    for match_array in good_matches])
+                for hero_id in np.unique(good_hero_ids)}
+
+        return HeroMatchList.from_votes(
+            self.hero_names, good_hero_ids,
+            matches.distances[good_mask, 0], features)
 
 
 def build_flann(image_list: list[HeroImage],
                 ratio: int = 0.8,
-                enriched_db=False) -> "ImageSearch":
+                enriched_db=False,
+                workers: int = None,
+                max_keypoints: int = None,
+                keypoint_radius: float = 0.0,
+                index_backend: str = DEFAULT_INDEX_BACKEND,
+                descriptor_dimensions: int = None,
+                root_sift: bool = False,
+                binary_shortlist: int = None,
+                global_shortlist: int = None,
+                verify_candidates: int = None) -> "ImageSearch":
     """
     Build database of heroes to match against
 
@@ -569,21 +1818,64 @@ def build_flann(image_list: list[HeroImage],
             (https://stackoverflow.com/questions/51197091/how-does-the-lowes-ratio-test-work)
         enriched_db (bool): flag to add every hero to the database a second
             time with parts of the the image border removed from each side
+        workers (int, optional): number of processes to extract features
+            with. Defaults to GV.WORKER_COUNT
+        max_keypoints (int, optional): maximum number of keypoints to keep
+            from each portrait and searched segment, None to keep every
+            keypoint. Defaults to None.
+        keypoint_radius (float, optional): radius in pixels of the non-maximum
+            suppression applied when capping keypoints. Defaults to 0.0.
+        index_backend (str, optional): approximate nearest neighbor backend to
+            search descriptors with. Defaults to DEFAULT_INDEX_BACKEND.
+        descriptor_dimensions (int, optional): number of PCA dimensions
+            descriptors are projected to, fit on the descriptors of
+            `image_list`. Defaults to None, keeping all 128 dimensions.
+        root_sift (bool, optional): apply RootSIFT normalization to
+            descriptors. Defaults to False.
+        binary_shortlist (int, optional): number of heroes an ORB first
+            stage shortlists before SIFT matching, None to match every segment
+            against the whole database. Defaults to None.
+        global_shortlist (int, optional): number of heroes shortlisted by
+            global image descriptors before SIFT matching, None to disable.
+            Defaults to None.
+        verify_candidates (int, optional): number of top heroes re-ranked by
+            RANSAC homography inliers when a search is ambiguous, None to
+            disable. Defaults to None.
 
     Return:
         An instance of ImageSearch() with image_list added to it with the
             matcher trained on them
     """
-    image_database = ImageSearch(lowes_ratio=ratio)
+    image_database = ImageSearch(lowes_ratio=ratio,
+                                 max_keypoints=max_keypoints,
+                                 keypoint_radius=keypoint_radius,
+                                 index_backend=index_backend,
+                                 descriptor_dimensions=descriptor_dimensions,
+                                 root_sift=root_sift,
+                                 binary_shortlist=binary_shortlist,
+                                 global_shortlist=global_shortlist,
+                                 verify_candidates=verify_candidates,
+                                 enriched_db=enriched_db)
+    image_database.add_heroes(image_list, workers=workers)
+
+    return image_database
 
-    crop_info = None
-    if enriched_db:
-        crop_info = CropImageInfo(0.15, 0.08, 0.25, 0.2)
 
-    for image_info in image_list:
-        image_database.add_image(image_info)
-        image_database.add_image(image_info, crop_info=crop_info)
+# ImageSearch used to extract portrait features in a database build worker
+#   process
+_WORKER_DATABASE: "ImageSearch" = None
 
-    image_database.matcher.train()
 
-    return image_database
+def _hero_descriptors(hero_info: HeroImage,
+                      crop_info_list: List[CropImageInfo],
+                      extractor_settings: dict) -> List[PortraitDescriptors]:
+    """
+    Process pool entry point for ImageSearch.hero_descriptors,
+        `extractor_settings` are the ImageSearch.extractor_settings of the
+        database being built
+    """
+    global _WORKER_DATABASE  # pylint: disable=global-statement
+    if (_WORKER_DATABASE is None or
+            _WORKER_DATABASE.extractor_settings != extractor_settings):
+        _WORKER_DATABASE = ImageSearch(**extractor_settings)
+    return _WORKER_DATABASE.hero_descriptors(hero_info, crop_info_list)
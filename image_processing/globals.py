@@ -48,9 +48,15 @@ parser.add_argument("-v", "--verbose", help="Increase verbosity of output"
 parser.add_argument("-p", "--parallel", help="Utilize as many cores as"
                     "possible while processing",
                     action="store_true")
+parser.add_argument("-w", "--workers", help="Number of threads to use while"
+                    "processing, overrides the core count used by --parallel",
+                    type=int, default=None)
 parser.add_argument("-t", "--truth", help="Argument to pass in a truth value"
                     "to file being ran",
                     action="store_true")
+parser.add_argument("-b", "--batch_size", help="Number of hero images to pass"
+                    "to the attribute models in a single forward pass",
+                    type=int, default=16)
 
 
 ARGS: argparse.Namespace = None
@@ -58,6 +64,7 @@ TRUTH: bool = None
 DEBUG: bool = None
 REBUILD: bool = None
 PARALLEL: bool = None
+WORKER_COUNT: int = 1
 IMAGE_SS: numpy.ndarray = None
 IMAGE_SS_NAME: str = None
 VERBOSE_LEVEL: int = 0
@@ -70,8 +77,41 @@ ENGRAVING_DB: EngravingSearch = None
 ROOT_DIR: pathlib.Path = pathlib.Path(__file__).parent.resolve()
 HERO_PORTRAIT_SIZE = 512
 MODEL_IMAGE_SIZE = 416
+MODEL_BATCH_SIZE = 16
 GLOBAL_TIMER = None
 
+# Bytes of SIFT features and search results ImageSearch keeps in memory,
+#   evicted entries are spilled to DESCRIPTOR_CACHE_DIR when it is set
+DESCRIPTOR_CACHE_SIZE = 256 * 1024 * 1024
+DESCRIPTOR_CACHE_DIR: pathlib.Path = None
+
+# Keypoints kept from each hero portrait when building the image database,
+#   strongest first with weaker keypoints closer than KEYPOINT_NMS_RADIUS
+#   pixels dropped. None keeps every keypoint
+MAX_KEYPOINTS: int = None
+KEYPOINT_NMS_RADIUS = 4.0
+# Nearest neighbor backend hero descriptors are searched with, one of
+#   "flann", "hnsw" or "ivfpq". None builds with "flann" and loads with the
+#   backend the database was built with
+IMAGE_INDEX_BACKEND: str = None
+# PCA dimensions hero descriptors are projected to before indexing, None keeps
+#   all 128 dimensions. ROOT_SIFT applies RootSIFT normalization first
+DESCRIPTOR_DIMENSIONS: int = None
+ROOT_SIFT = False
+# Number of heroes an ORB first stage shortlists for each segment before its
+#   SIFT descriptors are matched against them, None disables the first stage
+BINARY_SHORTLIST: int = None
+# Number of heroes shortlisted for each segment by global image descriptors,
+#   None disables it
+GLOBAL_SHORTLIST: int = None
+# Segments whose difference hashes are within this many bits of each other are
+#   searched for once and share the result, None searches every segment
+SEGMENT_HASH_DISTANCE: int = 10
+# Number of top heroes re-ranked by RANSAC homography inliers when the votes
+#   of a search are ambiguous, None retries ambiguous searches with every
+#   keypoint instead
+VERIFY_CANDIDATES: int = None
+
 
 # Stores cached function results
 CACHED = {}
@@ -79,6 +119,8 @@ THREADS: dict[str, threading.Thread] = {}
 
 ZMQ_HOST = "127.0.0.1"
 ZMQ_PORT = 5555
+# Worker processes the processing server forks to handle requests in parallel
+ZMQ_WORKER_COUNT = 1
 
 
 def verbosity(verbose_level: int) -> bool:
@@ -97,29 +139,60 @@ def verbosity(verbose_level: int) -> bool:
     return VERBOSE_LEVEL >= verbose_level
 
 
-def global_parse_args(arg_string: Union[str, List[str]] = None):
+def parse_args(arg_string: Union[str, List[str]] = None
+               ) -> argparse.Namespace:
     """
-    Function to load global arguments from either arg_string or sys.argv.
-    The results of the parsing are stored in global argument `ARGS`
+    Parse command line arguments from either arg_string or sys.argv without
+        changing any global variables
 
     Args:
         arg_string (str, optional): string to parse into command line
             arguments, loads sys.argv when this is None. Defaults to None.
+
+    Returns:
+        argparse.Namespace: the parsed arguments
     """
-    global ARGS, TRUTH, DEBUG, REBUILD, PARALLEL, IMAGE_SS, IMAGE_SS_NAME, VERBOSE_LEVEL  # pylint: disable=global-statement
     if isinstance(arg_string, str):
         parsed_args = shlex.split(arg_string)
     elif isinstance(arg_string, list):
         parsed_args = arg_string
     else:
         parsed_args = None
-    ARGS = parser.parse_args(args=parsed_args)
+    return parser.parse_args(args=parsed_args)
+
+
+def args_worker_count(args: argparse.Namespace) -> int:
+    """
+    Number of threads to process with for the parsed arguments `args`, from
+        --workers when it is set, otherwise every core with --parallel and a
+        single thread without it
+    """
+    if args.workers is not None:
+        return max(args.workers, 1)
+    if args.parallel:
+        return os.cpu_count() or 1
+    return 1
+
+
+def global_parse_args(arg_string: Union[str, List[str]] = None):
+    """
+    Function to load global arguments from either arg_string or sys.argv.
+    The results of the parsing are stored in global argument `ARGS`
+
+    Args:
+        arg_string (str, optional): string to parse into command line
+            arguments, loads sys.argv when this is None. Defaults to None.
+    """
+    global ARGS, TRUTH, DEBUG, REBUILD, PARALLEL, IMAGE_SS, IMAGE_SS_NAME, VERBOSE_LEVEL, MODEL_BATCH_SIZE, WORKER_COUNT  # pylint: disable=global-statement
+    ARGS = parse_args(arg_string)
 
     TRUTH = ARGS.truth
     DEBUG = ARGS.DEBUG
     REBUILD = ARGS.rebuild
     PARALLEL = ARGS.parallel
+    WORKER_COUNT = args_worker_count(ARGS)
     VERBOSE_LEVEL = ARGS.verbose
+    MODEL_BATCH_SIZE = ARGS.batch_size
 
     IMAGE_SS = load.load_image(ARGS.image_path)
     IMAGE_SS_NAME = os.path.basename(ARGS.image_path)
@@ -169,10 +242,8 @@ IMAGE_PROCESSING_PORTRAITS = pathlib.Path(
     os.path.join(DATABASE_DIR, "images", "heroes"))
 HERO_PORTRAIT_DIRECTORIES.append(IMAGE_PROCESSING_PORTRAITS)
 
-DATABASE_FLAN_PATH = pathlib.Path(
-    os.path.join(DATABASE_DIR, "IMAGE_DB.flann"))
-DATABASE_PICKLE_PATH = pathlib.Path(
-    os.path.join(DATABASE_DIR, 'IMAGE_DB.pickle'))
+DATABASE_STORE_DIR = pathlib.Path(
+    os.path.join(DATABASE_DIR, "IMAGE_DB"))
 DATABASE_LEVELS_DATA_DIR = pathlib.Path(
     os.path.join(DATABASE_DIR, "levels"))
 DATABASE_STAMINA_TEMPLATES_DIR = pathlib.Path(
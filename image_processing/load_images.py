@@ -100,6 +100,39 @@ def find_files(path: str, flag=True, lower=False):
     return sorted(valid_images)
 
 
+def crop_window(image_shape: tuple, crop_info: CropImageInfo,
+                border_width=0.25):
+    """
+    Calculate the area of an image that `crop_heroes` keeps
+
+    Args:
+        image_shape (tuple): shape of the image getting cropped
+        crop_info (CropImageInfo): Named Tuple that contains information on
+            how much to crop from each side
+        border_width: percentage of border to take off of each side of the
+            image when a side in `crop_info` is None
+    Returns:
+        tuple[int, int, int, int]: (top, bottom, left, right) pixel
+            boundaries of the cropped area, bottom and right are exclusive
+    """
+    sides = {"x_left": crop_info.x_left, "x_right": crop_info.x_right,
+             "y_top": crop_info.y_top, "y_bottom": crop_info.y_bottom}
+
+    for _name, _side in sides.items():
+        if _side is None:
+            sides[_name] = border_width
+
+    x_coord = image_shape[0]
+    y_coord = image_shape[1]
+
+    left = round(sides["x_left"] * x_coord)
+    right = round(sides["x_right"] * x_coord)
+    top = round(sides["y_top"] * y_coord)
+    bottom = round(sides["y_bottom"] * y_coord)
+
+    return top, x_coord - bottom, left, y_coord - right
+
+
 def crop_heroes(images: list[np.ndarray], crop_info: CropImageInfo,
                 border_width=0.25):
     """
@@ -114,25 +147,12 @@ def crop_heroes(images: list[np.ndarray], crop_info: CropImageInfo,
         dict of name as key and  images as values with 'border_width'
             removed from each side of the images
     """
-    sides = {"x_left": crop_info.x_left, "x_right": crop_info.x_right,
-             "y_top": crop_info.y_top, "y_bottom": crop_info.y_bottom}
-
     cropped_heroes: List[np.ndarray] = []
-    for _name, _side in sides.items():
-        if _side is None:
-            sides[_name] = border_width
 
     for image in images:
-        shape = image.shape
-        x_coord = shape[0]
-        y_coord = shape[1]
-
-        left = round(sides["x_left"] * x_coord)
-        right = round(sides["x_right"] * x_coord)
-        top = round(sides["y_top"] * y_coord)
-        bottom = round(sides["y_bottom"] * y_coord)
-
-        crop_img = image[top: x_coord-bottom, left: y_coord-right]
+        top, bottom, left, right = crop_window(image.shape, crop_info,
+                                               border_width)
+        crop_img = image[top: bottom, left: right]
         cropped_heroes.append(crop_img)
 
     return cropped_heroes
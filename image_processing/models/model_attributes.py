@@ -58,3 +58,17 @@ class ModelResult(NamedTuple):
             _type_: _description_
         """
         return {"label": self.label, "score": self.score}
+
+    @classmethod
+    def from_list(cls, model_result: list):
+        """
+        Create a ModelResult from the list returned by `to_list`
+        """
+        return ModelResult(model_result[0], model_result[1])
+
+    def to_list(self):
+        """
+        Convert the ModelResult into a [label, score] list, the positional
+            layout used by the msgpack wire format
+        """
+        return [self.label, float(self.score)]
@@ -1,20 +1,27 @@
 import asyncio
-import json
 import logging
 from collections import deque
 import time
-from typing import Any, Callable, Coroutine, Iterable, NamedTuple
+from typing import (
+    Any, AsyncIterator, Callable, Coroutine, Iterable, NamedTuple)
 from enum import Enum
 from uuid import uuid4
 import concurrent.futures
 
+import numpy as np
 import zmq
 import zmq.asyncio
 from zmq.log.handlers import PUBHandler
 from image_processing.processing.async_processing.processing_response import (
-    ProcessingResponse)
+    JSON_FORMAT, ProcessingResponse)
+from image_processing.processing.async_processing.processing_request import (
+    DEFAULT_IMAGE_NAME, args_request_frames, image_request_frames)
+from image_processing.processing.async_processing.processing_stream import (
+    StreamEvent, parse_stream_frames)
 
 ProcessingArgs = list[str]
+# Encoded image bytes or a BGR image sent with a request
+ProcessingImage = bytes | np.ndarray | None
 AsyncTask = Coroutine[Any, Any, ProcessingResponse]
 # AsyncArgs = tuple[str, ProcessingArgs, int, str]
 ProcessingCallback = Callable | None
@@ -227,7 +234,10 @@ class AsyncProcessingClient:
                             timeout: int,
                             callback_wrapper: CallbackWrapper | None,
                             task_uuid: TaskUUID | None = None,
-                            index: int = APPEND_INDEX):
+                            index: int = APPEND_INDEX,
+                            image: ProcessingImage = None,
+                            image_name: str = DEFAULT_IMAGE_NAME,
+                            response_format: str = JSON_FORMAT):
         """
         Add a processing task to the queue and wait until it returns or
         `queue_timeout` is reached
@@ -241,6 +251,13 @@ class AsyncProcessingClient:
                 `queue_timeout`
             index (int, optional): The index to insert the processing task
                 into the queue at. Defaults to APPEND_INDEX.
+            image (ProcessingImage, optional): image sent to the remote
+                server along with the request, `processing_args` then leave
+                out the image path. Defaults to None.
+            image_name (str, optional): name of `image`. Defaults to
+                DEFAULT_IMAGE_NAME.
+            response_format (str, optional): format the remote server
+                encodes the response with. Defaults to JSON_FORMAT.
 
         Returns:
             (ProcessingResponse): a response from the remote server
@@ -252,7 +269,8 @@ class AsyncProcessingClient:
             task_uuid = str(uuid4())
 
         image_processing_task = self._async_remote_compute(
-            address, processing_args, timeout, task_uuid)
+            address, processing_args, timeout, task_uuid, image, image_name,
+            response_format)
 
         processing_task_args = ProcessingTaskArgs(
             image_processing_task, task_uuid, callback_wrapper)
@@ -282,7 +300,10 @@ class AsyncProcessingClient:
     async def _async_remote_compute(self, address: str,
                                     processing_args: ProcessingArgs,
                                     timeout: int,
-                                    task_uuid: TaskUUID):
+                                    task_uuid: TaskUUID,
+                                    image: ProcessingImage = None,
+                                    image_name: str = DEFAULT_IMAGE_NAME,
+                                    response_format: str = JSON_FORMAT):
         """
         A helper function that will allow a compute task to be started but
         block the task from beginning remote computation until the task has
@@ -294,6 +315,12 @@ class AsyncProcessingClient:
             timeout (int): timeout to wait for remote process
             task_uuid (TaskUUID): unique id associated with this task, that is
                 track the currently running task in the compute_engine
+            image (ProcessingImage, optional): image sent to the remote
+                process as a multipart image request. Defaults to None.
+            image_name (str, optional): name of `image`. Defaults to
+                DEFAULT_IMAGE_NAME.
+            response_format (str, optional): format the remote process
+                encodes the response with. Defaults to JSON_FORMAT.
 
         Returns:
             (ProcessingResponse): response from remote server
@@ -342,12 +369,76 @@ class AsyncProcessingClient:
         self.zmq_socket.connect(address)
         self.zmq_socket.setsockopt(zmq.RCVTIMEO, timeout)
 
-        self.zmq_socket.send_string(json.dumps(processing_args))
+        if image is None:
+            await self.zmq_socket.send_multipart(args_request_frames(
+                processing_args, response_format=response_format))
+        else:
+            await self.zmq_socket.send_multipart(
+                image_request_frames(image, processing_args, image_name,
+                                     response_format=response_format),
+                copy=False)
         received = await self.zmq_socket.recv()
         processing_response = ProcessingResponse.from_bytes(received)
 
         return processing_response
 
+    async def async_compute_stream(self,
+                                   processing_args: ProcessingArgs,
+                                   address: str,
+                                   timeout: int,
+                                   image: ProcessingImage = None,
+                                   image_name: str = DEFAULT_IMAGE_NAME,
+                                   response_format: str = JSON_FORMAT
+                                   ) -> AsyncIterator[StreamEvent]:
+        """
+        Run a streaming processing task, yielding the roster layout and each
+            hero as soon as the remote server has detected them
+
+        Streaming tasks do not wait in the processing queue, each one uses
+            its own socket so its messages are not mixed up with the replies
+            of queued tasks
+
+        Args:
+            processing_args (ProcessingArgs): the arguments passed to the
+                remote server, leaving out the image path when `image` is set
+            address (str): the address the remote server is running at
+            timeout (int): the time to wait for each message from the remote
+                server
+            image (ProcessingImage, optional): image sent to the remote
+                server along with the request. Defaults to None.
+            image_name (str, optional): name of `image`. Defaults to
+                DEFAULT_IMAGE_NAME.
+            response_format (str, optional): format the remote server
+                encodes the messages with. Defaults to JSON_FORMAT.
+
+        Yields:
+            StreamEvent: the roster layout, then each hero, then the status
+                message with the full ProcessingResponse
+        """
+        stream_socket: zmq.Socket = self.zmq_context.socket(
+            zmq.DEALER)  # pylint: disable=no-member
+        try:
+            stream_socket.connect(address)
+            stream_socket.setsockopt(zmq.RCVTIMEO, timeout)
+            if image is None:
+                await stream_socket.send_multipart(args_request_frames(
+                    processing_args, stream=True,
+                    response_format=response_format))
+            else:
+                await stream_socket.send_multipart(
+                    image_request_frames(image, processing_args, image_name,
+                                         stream=True,
+                                         response_format=response_format),
+                    copy=False)
+            while True:
+                stream_event = parse_stream_frames(
+                    await stream_socket.recv_multipart())
+                yield stream_event
+                if stream_event.done:
+                    return
+        finally:
+            stream_socket.close(linger=0)
+
     async def process_callbacks(self):
         """
         Process all callbacks in the processing_queue using a threadpool
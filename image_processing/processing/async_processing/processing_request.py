@@ -0,0 +1,245 @@
+"""
+Module containing the multipart image request format of the processing server
+
+An image request is sent as the frames [IMAGE_REQUEST_CODE, header, image],
+the header is a small JSON object with the CLI-style options of the request
+and the image frame holds the encoded image bytes. The server decodes the
+image straight from the frame buffer, so images a client already holds in
+memory do not need to be saved somewhere the server can load them from
+
+Argument requests are sent as [arguments] or [code, arguments]. The code
+frame holds flags joined by REQUEST_FLAG_SEPARATOR that ask for a streaming
+or msgpack response, unknown flags are ignored so older clients sending
+their own codes keep working. ProcessingRequest.from_frames reads either kind
+of request
+"""
+import json
+from typing import NamedTuple
+
+import cv2
+import numpy as np
+
+from image_processing.processing.async_processing.processing_response import (
+    JSON_FORMAT, MSGPACK_FORMAT, RESPONSE_FORMATS)
+from image_processing.processing.async_processing.processing_stream import (
+    STREAM_REQUEST_CODE)
+
+# Code frame marking a multipart image request
+IMAGE_REQUEST_CODE = b"image"
+# Flag of a request that wants its response encoded with msgpack
+MSGPACK_REQUEST_FLAG = b"msgpack"
+REQUEST_FLAG_SEPARATOR = b"+"
+# Name given to images sent without one, stands in for the image path
+#   argument of the request
+DEFAULT_IMAGE_NAME = "roster.png"
+
+
+class ImageRequestHeader(NamedTuple):
+    """
+    Options of a multipart image request
+
+    args: CLI-style arguments of the request, the image path argument is the
+        name of the image sent in the image frame
+    stream: flag to receive a streaming response, see processing_stream
+    response_format: format the response is encoded with, JSON_FORMAT or
+        MSGPACK_FORMAT
+    """
+    args: list[str]
+    stream: bool = False
+    response_format: str = JSON_FORMAT
+
+    def to_dict(self):
+        """
+        Convert the ImageRequestHeader into a serializable dictionary
+        """
+        return {"args": self.args, "stream": self.stream,
+                "format": self.response_format}
+
+    def to_bytes(self):
+        """
+        Convert the ImageRequestHeader into a byte-stream
+        """
+        return json.dumps(self.to_dict()).encode("utf-8")
+
+    @classmethod
+    def from_bytes(cls, header: bytes):
+        """
+        Create an ImageRequestHeader from bytes
+
+        Args:
+            header (bytes): bytes to turn into ImageRequestHeader
+
+        Raises:
+            ValueError: raised when the header is not a JSON object with a
+                list of arguments
+
+        Returns:
+            ImageRequestHeader: new ImageRequestHeader object
+        """
+        header_dict = json.loads(header)
+        if not isinstance(header_dict, dict) or not isinstance(
+                header_dict.get("args"), list):
+            raise ValueError(f"Malformed image request header: {header_dict}")
+        return cls(list(header_dict["args"]),
+                   bool(header_dict.get("stream", False)),
+                   header_dict.get("format", JSON_FORMAT))
+
+
+class ProcessingRequest(NamedTuple):
+    """
+    A request received by the processing server
+
+    code: code frame of the request, empty for a request sent without one
+    args: CLI-style arguments of the request
+    stream: flag to send a streaming response, see processing_stream
+    response_format: format the response is encoded with
+    image_buffer: buffer of the image frame of an image request, None for an
+        argument request
+    """
+    code: bytes
+    args: list[str]
+    stream: bool = False
+    response_format: str = JSON_FORMAT
+    image_buffer: memoryview | bytes | None = None
+
+    @classmethod
+    def from_frames(cls, frames: list[memoryview | bytes]):
+        """
+        Create a ProcessingRequest from the frames of a request
+
+        Args:
+            frames (list[memoryview | bytes]): frames of the request after
+                the identity frame
+
+        Raises:
+            ValueError: raised when the frames are not an argument or image
+                request
+
+        Returns:
+            ProcessingRequest: new ProcessingRequest object
+        """
+        if len(frames) == 1:
+            return cls(b"", _parse_args(frames[0]))
+        if len(frames) not in (2, 3):
+            raise ValueError(
+                f"Expected 1 to 3 request frames, received {len(frames)}")
+
+        code = bytes(frames[0])
+        flags = request_flags(code)
+        if (IMAGE_REQUEST_CODE in flags) != (len(frames) == 3):
+            raise ValueError(
+                f"Request with code ({code}) sent with {len(frames)} frames")
+        if len(frames) == 2:
+            response_format = (MSGPACK_FORMAT if MSGPACK_REQUEST_FLAG in flags
+                               else JSON_FORMAT)
+            return cls(code, _parse_args(frames[1]),
+                       STREAM_REQUEST_CODE in flags, response_format)
+
+        header = ImageRequestHeader.from_bytes(bytes(frames[1]))
+        response_format = header.response_format
+        if response_format not in RESPONSE_FORMATS:
+            response_format = JSON_FORMAT
+        return cls(code, header.args, header.stream, response_format,
+                   frames[2])
+
+
+def _parse_args(args_frame: memoryview | bytes) -> list[str]:
+    """
+    Parse the arguments frame of an argument request
+
+    Raises:
+        ValueError: raised when the frame is not a JSON list of str
+    """
+    args = json.loads(bytes(args_frame))
+    if not isinstance(args, list) or not all(
+            isinstance(arg, str) for arg in args):
+        raise ValueError(f"Request arguments are not a list of str: {args}")
+    return args
+
+
+def request_flags(code: bytes) -> set[bytes]:
+    """
+    Split the code frame of a request into its flags
+    """
+    return set(bytes(code).split(REQUEST_FLAG_SEPARATOR))
+
+
+def args_request_frames(args: list[str], stream: bool = False,
+                        response_format: str = JSON_FORMAT) -> list[bytes]:
+    """
+    Build the frames of an argument request
+
+    Args:
+        args (list[str]): CLI-style arguments of the request
+        stream (bool, optional): flag to receive a streaming response.
+            Defaults to False.
+        response_format (str, optional): format the response is encoded
+            with. Defaults to JSON_FORMAT.
+
+    Returns:
+        list[bytes]: the arguments frame, after a code frame with the flags
+            of the request when any are set
+    """
+    flags = []
+    if stream:
+        flags.append(STREAM_REQUEST_CODE)
+    if response_format == MSGPACK_FORMAT:
+        flags.append(MSGPACK_REQUEST_FLAG)
+    args_frame = json.dumps(args).encode("utf-8")
+    if not flags:
+        return [args_frame]
+    return [REQUEST_FLAG_SEPARATOR.join(flags), args_frame]
+
+
+def image_request_frames(image: bytes | np.ndarray, args: list[str],
+                         image_name: str = DEFAULT_IMAGE_NAME,
+                         stream: bool = False,
+                         response_format: str = JSON_FORMAT) -> list[bytes]:
+    """
+    Build the frames of a multipart image request
+
+    Args:
+        image (bytes | np.ndarray): encoded image file bytes, or a BGR image
+            that is encoded as a PNG
+        args (list[str]): CLI-style options of the request without an image
+            path
+        image_name (str, optional): name of the image, passed to the server
+            in place of the image path. Defaults to DEFAULT_IMAGE_NAME.
+        stream (bool, optional): flag to receive a streaming response.
+            Defaults to False.
+        response_format (str, optional): format the response is encoded
+            with. Defaults to JSON_FORMAT.
+
+    Returns:
+        list[bytes]: code, header and image frames
+    """
+    if isinstance(image, np.ndarray):
+        encoded, image_buffer = cv2.imencode(".png", image)
+        if not encoded:
+            raise ValueError("Unable to encode image as a PNG")
+        image = image_buffer.tobytes()
+    header = ImageRequestHeader([*args, image_name], stream, response_format)
+    return [IMAGE_REQUEST_CODE, header.to_bytes(), image]
+
+
+def decode_image(image_buffer: memoryview | bytes) -> np.ndarray:
+    """
+    Decode the image frame of an image request without copying the encoded
+        bytes out of the frame
+
+    Args:
+        image_buffer (memoryview | bytes): buffer of the image frame
+
+    Raises:
+        ValueError: raised when the buffer is not an image OpenCV can decode
+
+    Returns:
+        np.ndarray: decoded BGR image
+    """
+    encoded_image = np.frombuffer(image_buffer, dtype=np.uint8)
+    image = None
+    if len(encoded_image) > 0:
+        image = cv2.imdecode(encoded_image, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Unable to decode the image of an image request")
+    return image
@@ -1,12 +1,36 @@
+"""
+Module containing the response of the processing server and its wire formats
+
+Responses are sent as JSON by default. Clients that ask for MSGPACK_FORMAT
+receive a versioned msgpack array instead. The array holds the roster as
+nested positional lists, so it is encoded and decoded once. JSON payloads
+always start with "{" and msgpack payloads never do, so `from_bytes` reads
+either format without being told which one was sent
+"""
 import json
 from typing import NamedTuple
 
 import jsonpickle
+import msgpack
 
 from image_processing.afk.hero.hero_data import RosterJson
 from image_processing.processing.async_processing.processing_status import (
     ProcessingStatus)
 
+JSON_FORMAT = "json"
+MSGPACK_FORMAT = "msgpack"
+RESPONSE_FORMATS = (JSON_FORMAT, MSGPACK_FORMAT)
+# Version of the msgpack layout of a response, bumped whenever the positional
+#   layout of a response or any of the lists it contains changes
+MSGPACK_WIRE_VERSION = 1
+
+
+def is_json_payload(payload: bytes) -> bool:
+    """
+    Check if a response payload was encoded as JSON rather than msgpack
+    """
+    return bytes(payload[:1]) == b"{"
+
 
 class ProcessingResponse(NamedTuple):
     """
@@ -38,16 +62,36 @@ class ProcessingResponse(NamedTuple):
         response_dict = self.to_dict()
         return json.dumps(response_dict)
 
-    def to_bytes(self):
+    def to_bytes(self, response_format: str = JSON_FORMAT):
         """
         Convert the ProcessingResponse into a byte-stream
+
+        Args:
+            response_format (str, optional): JSON_FORMAT or MSGPACK_FORMAT.
+                Defaults to JSON_FORMAT.
         """
+        if response_format == MSGPACK_FORMAT:
+            return self.to_msgpack()
         return self.to_str().encode("utf-8")
 
+    def to_msgpack(self):
+        """
+        Convert the ProcessingResponse into a msgpack [version, status,
+            result, message] array
+        """
+        result = None
+        if self.status == ProcessingStatus.success:
+            result = self.result.to_list()
+        message = self.message
+        if message is not None and not isinstance(message, str):
+            message = str(message)
+        return msgpack.packb(
+            [MSGPACK_WIRE_VERSION, self.status.value, result, message])
+
     @classmethod
     def from_bytes(cls, response: bytes):
         """
-        Create a ProcessingResponse from bytes
+        Create a ProcessingResponse from bytes in either response format
 
         Args:
             response (bytes): bytes to turn into ProcessingResponse
@@ -55,8 +99,30 @@ class ProcessingResponse(NamedTuple):
         Returns:
             ProcessingResponse: new ProcessingResponse object
         """
+        if is_json_payload(response):
+            return cls.from_str(bytes(response).decode("utf-8"))
+        return cls.from_msgpack(response)
 
-        return cls.from_str(response.decode("utf-8"))
+    @classmethod
+    def from_msgpack(cls, response: bytes):
+        """
+        Create a ProcessingResponse from the bytes returned by `to_msgpack`
+
+        Raises:
+            ValueError: raised when the response was encoded with a wire
+                version this client does not know
+        """
+        version, raw_status, raw_result, message = msgpack.unpackb(response)
+        if version != MSGPACK_WIRE_VERSION:
+            raise ValueError(
+                f"Unsupported msgpack wire version {version}, expected "
+                f"{MSGPACK_WIRE_VERSION}")
+
+        status = ProcessingStatus(raw_status)
+        result = raw_result
+        if status == ProcessingStatus.success:
+            result = RosterJson.from_list(raw_result)
+        return ProcessingResponse(status, result, message)
 
     @classmethod
     def from_str(cls, response: str):
@@ -0,0 +1,121 @@
+"""
+Module containing the streaming response format of the processing server
+
+A request sent with the STREAM_REQUEST_CODE code frame, or an image request
+whose header sets `stream`, is answered with several messages instead of a
+single ProcessingResponse. The server first sends the layout of the roster
+once it has been segmented, then one message per hero as soon as that hero's
+attributes are detected, and finally a status message with the same
+ProcessingResponse a non-streaming request receives. Every message is the
+frames [frame type, payload], payloads are encoded in the response format
+the request asked for. A server that cannot read a request, or loses the
+worker processing it, answers with a single ProcessingResponse frame, which
+also ends the stream
+"""
+import json
+from typing import NamedTuple
+
+import msgpack
+
+from image_processing.afk.hero.hero_data import (
+    DetectedHeroData, RosterMatrixJson)
+from image_processing.processing.async_processing.processing_response import (
+    JSON_FORMAT, MSGPACK_FORMAT, ProcessingResponse, is_json_payload)
+
+# Code frame of an argument request that wants a streaming response
+STREAM_REQUEST_CODE = b"stream"
+# Frame types of the messages of a streaming response
+MATRIX_FRAME = b"matrix"
+HERO_FRAME = b"hero"
+STATUS_FRAME = b"status"
+
+
+class StreamEvent(NamedTuple):
+    """
+    A single message of a streaming response
+
+    frame_type: one of MATRIX_FRAME, HERO_FRAME or STATUS_FRAME
+    index: position of the hero in the roster layout for HERO_FRAME
+        messages, None otherwise
+    data: RosterMatrixJson, DetectedHeroData or ProcessingResponse depending
+        on `frame_type`
+    """
+    frame_type: bytes
+    index: int | None
+    data: RosterMatrixJson | DetectedHeroData | ProcessingResponse
+
+    @property
+    def done(self) -> bool:
+        """
+        True for the status message that ends a streaming response
+        """
+        return self.frame_type == STATUS_FRAME
+
+
+def matrix_frames(roster_matrix: RosterMatrixJson,
+                  response_format: str = JSON_FORMAT) -> list[bytes]:
+    """
+    Build the message with the layout of a segmented roster
+    """
+    if response_format == MSGPACK_FORMAT:
+        return [MATRIX_FRAME, msgpack.packb(roster_matrix.to_list())]
+    return [MATRIX_FRAME, roster_matrix.json().encode("utf-8")]
+
+
+def hero_frames(hero_index: int, hero_data: DetectedHeroData,
+                response_format: str = JSON_FORMAT) -> list[bytes]:
+    """
+    Build the message with the detected attributes of the hero at
+        `hero_index` in the roster layout
+    """
+    if response_format == MSGPACK_FORMAT:
+        return [HERO_FRAME, msgpack.packb([hero_index, hero_data.to_list()])]
+    hero_json = json.dumps({"index": hero_index, "hero": hero_data.to_dict()})
+    return [HERO_FRAME, hero_json.encode("utf-8")]
+
+
+def status_frames(response: ProcessingResponse,
+                  response_format: str = JSON_FORMAT) -> list[bytes]:
+    """
+    Build the message that ends a streaming response
+    """
+    return [STATUS_FRAME, response.to_bytes(response_format)]
+
+
+def parse_stream_frames(frames: list[bytes]) -> StreamEvent:
+    """
+    Parse a message of a streaming response
+
+    Args:
+        frames (list[bytes]): [frame type, payload] frames of the message, or
+            the single frame of a failure the server could not stream
+
+    Raises:
+        ValueError: raised when the frame type is not a streaming frame type
+
+    Returns:
+        StreamEvent: the parsed message
+    """
+    if len(frames) == 1:
+        return StreamEvent(STATUS_FRAME, None,
+                           ProcessingResponse.from_bytes(frames[0]))
+    frame_type, payload = frames
+    json_payload = is_json_payload(payload)
+    if frame_type == MATRIX_FRAME:
+        if json_payload:
+            return StreamEvent(frame_type, None,
+                               RosterMatrixJson.from_json(payload))
+        return StreamEvent(frame_type, None,
+                           RosterMatrixJson.from_list(msgpack.unpackb(payload)))
+    if frame_type == HERO_FRAME:
+        if json_payload:
+            hero_json = json.loads(payload)
+            return StreamEvent(frame_type, hero_json["index"],
+                               DetectedHeroData.from_dict(hero_json["hero"]))
+        hero_index, hero_list = msgpack.unpackb(payload)
+        return StreamEvent(frame_type, hero_index,
+                           DetectedHeroData.from_list(hero_list))
+    if frame_type == STATUS_FRAME:
+        return StreamEvent(frame_type, None,
+                           ProcessingResponse.from_bytes(payload))
+    raise ValueError(f"Unknown streaming frame type {frame_type}")
@@ -4,12 +4,17 @@ it is online, or start a new temporary feature detection section to parse the
 image/arguments passed to this script
 """
 import sys
-import json
 import pprint
-from typing import List
+from typing import Iterator, List
+
+import numpy as np
 
 from image_processing.processing.async_processing.processing_response import (
-    ProcessingResponse)
+    JSON_FORMAT, ProcessingResponse)
+from image_processing.processing.async_processing.processing_request import (
+    DEFAULT_IMAGE_NAME, args_request_frames, image_request_frames)
+from image_processing.processing.async_processing.processing_stream import (
+    StreamEvent, parse_stream_frames)
 from image_processing.processing.async_processing.processing_status import (
     ProcessingStatus)
 
@@ -31,7 +36,8 @@ class ProcessingClient:
 
     def remote_compute_results(self, address: str,
                                timeout: int,
-                               args: List[str]):
+                               args: List[str],
+                               response_format: str = JSON_FORMAT):
         """
         Connect to remote processing server and run image recognition
 
@@ -40,6 +46,8 @@ class ProcessingClient:
             timeout (int): timeout in ms to wait for results
             args (str): local path to image, or discord image URL and other
                 global args
+            response_format (str, optional): format the server encodes the
+                response with. Defaults to JSON_FORMAT.
 
         Returns:
             processing_response: response from remote computation
@@ -54,11 +62,101 @@ class ProcessingClient:
 
         print(f"Arguments: {args}")
 
-        self.zmq_socket.send_string(json.dumps(args))
+        self.zmq_socket.send_multipart(
+            args_request_frames(args, response_format=response_format))
+        received = self.zmq_socket.recv()
+        processing_response = ProcessingResponse.from_bytes(received)
+        return processing_response
+
+    def remote_compute_image(self, address: str,
+                             timeout: int,
+                             image: bytes | np.ndarray,
+                             args: List[str],
+                             image_name: str = DEFAULT_IMAGE_NAME,
+                             response_format: str = JSON_FORMAT):
+        """
+        Connect to remote processing server and run image recognition on an
+            image sent along with the request, so the server does not need to
+            be able to load it from a path or URL
+
+        Args:
+            address (str): address to connect the socket to
+            timeout (int): timeout in ms to wait for results
+            image (bytes | np.ndarray): encoded image file bytes, or a BGR
+                image that is sent as a PNG
+            args (List[str]): global args without an image path
+            image_name (str, optional): name of the image. Defaults to
+                DEFAULT_IMAGE_NAME.
+            response_format (str, optional): format the server encodes the
+                response with. Defaults to JSON_FORMAT.
+
+        Returns:
+            processing_response: response from remote computation
+        """
+        self.zmq_socket.connect(address)
+        # pylint: disable=no-member
+        self.zmq_socket.setsockopt(zmq.RCVTIMEO, timeout)
+
+        print(f"Arguments: {args} Image: {image_name}")
+
+        self.zmq_socket.send_multipart(
+            image_request_frames(image, args, image_name,
+                                 response_format=response_format),
+            copy=False)
         received = self.zmq_socket.recv()
         processing_response = ProcessingResponse.from_bytes(received)
         return processing_response
 
+    def remote_compute_stream(self, address: str,
+                              timeout: int,
+                              args: List[str],
+                              image: bytes | np.ndarray = None,
+                              image_name: str = DEFAULT_IMAGE_NAME,
+                              response_format: str = JSON_FORMAT
+                              ) -> Iterator[StreamEvent]:
+        """
+        Connect to remote processing server and run image recognition,
+            yielding the roster layout and each hero as soon as the server
+            has detected them
+
+        Args:
+            address (str): address to connect the socket to
+            timeout (int): timeout in ms to wait for each message
+            args (List[str]): local path to image, or discord image URL and
+                other global args. Leaves out the image path when `image` is
+                set
+            image (bytes | np.ndarray, optional): image sent along with the
+                request. Defaults to None.
+            image_name (str, optional): name of `image`. Defaults to
+                DEFAULT_IMAGE_NAME.
+            response_format (str, optional): format the server encodes the
+                messages with. Defaults to JSON_FORMAT.
+
+        Yields:
+            StreamEvent: the roster layout, then each hero, then the status
+                message with the full ProcessingResponse
+        """
+        self.zmq_socket.connect(address)
+        # pylint: disable=no-member
+        self.zmq_socket.setsockopt(zmq.RCVTIMEO, timeout)
+
+        print(f"Arguments: {args}")
+
+        if image is None:
+            self.zmq_socket.send_multipart(args_request_frames(
+                args, stream=True, response_format=response_format))
+        else:
+            self.zmq_socket.send_multipart(
+                image_request_frames(image, args, image_name, stream=True,
+                                     response_format=response_format),
+                copy=False)
+        while True:
+            stream_event = parse_stream_frames(
+                self.zmq_socket.recv_multipart())
+            yield stream_event
+            if stream_event.done:
+                return
+
     @classmethod
     def print_result(cls, processing_response: ProcessingResponse):
         """
@@ -4,29 +4,65 @@ Script used to start the feature detection server
 This script provides a way for outside clients or even local clients to connect
 to an environment that is already initialized and also has the Image database
 and ML models already loaded
+
+With more than one worker the server runs as a broker, the ROUTER socket
+clients connect to forwards requests over an ipc socket to worker processes
+forked after the models and database are loaded, so every worker shares them
+copy-on-write. Requests are only handed to idle workers, so a slow roster
+only holds up its own worker
 """
-import json
+import argparse
+import collections
+import multiprocessing
+import os
+import tempfile
 import time
 import traceback
-from typing import List
+from typing import Callable, List
 
+import cv2
+import torch
 import zmq
 
 import image_processing.globals as GV
 import image_processing.utils.load_models as LM
 import image_processing.afk.detect_image_attributes as detect
-from image_processing.build_db import load_database
+from image_processing.build_db import refresh_database
+from image_processing.processing.request_context import RequestContext
 from image_processing.processing.async_processing.processing_status import (
     ProcessingStatus)
 from image_processing.processing.async_processing.processing_response import (
-    ProcessingResponse)
+    JSON_FORMAT, ProcessingResponse)
+from image_processing.processing.async_processing.processing_request import (
+    ProcessingRequest, decode_image)
+from image_processing.processing.async_processing.processing_stream import (
+    hero_frames, matrix_frames, status_frames)
+from image_processing.afk.hero.hero_data import RosterMatrixJson
 
 DATABASE_LOAD_MESSAGE = "Database loaded successfully"
 RELOAD_COMMAND_LIST = ["reload"]
+# Message a worker sends the broker when it is ready for its first request
+WORKER_READY_MESSAGE = b"READY"
+# First frame of every message a worker sends back for a request, a worker is
+#   only idle again after the last message of a request, a streaming request
+#   sends several partial messages before it
+WORKER_DONE_MESSAGE = b"DONE"
+WORKER_PARTIAL_MESSAGE = b"PARTIAL"
+# Longest time in ms the broker waits for a message before checking that
+#   every worker is still running
+WORKER_CHECK_INTERVAL = 1000
+
+
+def worker_identity(worker_index: int) -> bytes:
+    """
+    Identity the broker routes requests to the worker at `worker_index` with
+    """
+    return f"processing_worker_{worker_index}".encode("utf-8")
 
 
 class ProcessingServer:
-    def __init__(self, host: str | None = None, port: int = GV.ZMQ_PORT):
+    def __init__(self, host: str | None = None, port: int = GV.ZMQ_PORT,
+                 worker_count: int = 1):
         """
         Initialize all the ZMQ variables to allow for the image processing
         server to run
@@ -36,7 +72,17 @@ class ProcessingServer:
                 on all address. Defaults to None. Host cannot be `localhost`
                 when binding, using ipv4 equivalent instead
             port (int): port to listen on. Defaults to GV.ZMQ_PORT
+            worker_count (int): number of worker processes requests are
+                distributed to, requests are processed in this process when
+                1. Defaults to 1.
         """
+        self.worker_count = max(worker_count, 1)
+        self.backend_address = (
+            f"ipc://{tempfile.gettempdir()}/afk_processing_{port}")
+        # Shared count of database reloads, set in broker mode so a reload
+        #   received by one worker is applied by every worker
+        self.reload_generation: multiprocessing.Value = None
+        self.database_generation = 0
         self.context = zmq.Context()
         # Rep Socket can only receive a single message at a time
         self.socket: zmq.Socket = self.context.socket(zmq.ROUTER)
@@ -58,6 +104,10 @@ class ProcessingServer:
         LM.load_files(str(GV.FI_SI_STARS_MODEL_PATH),
                       str(GV.ASCENSION_BORDER_MODEL_PATH))
 
+        if self.worker_count > 1:
+            self.broker()
+            return
+
         print("Ready to start listening to image requests...")
         try:
             while True:
@@ -66,6 +116,127 @@ class ProcessingServer:
             exception_message = traceback.format_exc()
             print(f"Aborting processing server due to \n\n{exception_message}")
 
+    def broker(self):
+        """
+        Fork `worker_count` workers that share the loaded models and database,
+            then forward requests from clients to idle workers and replies
+            back to clients indefinitely. Workers that exit are replaced
+        """
+        fork_context = multiprocessing.get_context("fork")
+        self.reload_generation = fork_context.Value("i", 0)
+
+        # A ROUTER backend instead of a DEALER, a DEALER hands requests to
+        #   workers round robin and queues them behind a worker busy with a
+        #   slow roster
+        backend_socket: zmq.Socket = self.context.socket(zmq.ROUTER)
+        # A replacement worker reconnects with the identity of the worker it
+        #   replaces, handover routes that identity to the new connection
+        backend_socket.setsockopt(zmq.ROUTER_HANDOVER, 1)
+        backend_socket.bind(self.backend_address)
+
+        def start_worker(worker_index: int):
+            worker = fork_context.Process(
+                target=self.work, args=(worker_index,), daemon=True,
+                name=f"processing_worker_{worker_index}")
+            worker.start()
+            return worker
+
+        workers = [start_worker(worker_index)
+                   for worker_index in range(self.worker_count)]
+        idle_workers: collections.deque[bytes] = collections.deque()
+        # Identity frame of the client each busy worker is replying to
+        busy_workers: dict[bytes, bytes] = {}
+        poller = zmq.Poller()
+        poller.register(backend_socket, zmq.POLLIN)
+
+        print(f"Ready to start listening to image requests with "
+              f"{self.worker_count} workers...")
+        try:
+            while True:
+                # Requests wait in the frontend socket until a worker is idle,
+                #   registering with no flags stops polling the socket
+                poller.register(self.socket,
+                                zmq.POLLIN if idle_workers else 0)
+                events = dict(poller.poll(WORKER_CHECK_INTERVAL))
+
+                if backend_socket in events:
+                    worker_id, worker_status, *reply = (
+                        backend_socket.recv_multipart())
+                    if worker_status != WORKER_PARTIAL_MESSAGE:
+                        busy_workers.pop(worker_id, None)
+                        idle_workers.append(worker_id)
+                    # The first frame of a reply is the identity frame the
+                    #   frontend added to the request, routing it back to the
+                    #   client
+                    if reply:
+                        self.socket.send_multipart(reply)
+
+                if idle_workers and self.socket in events:
+                    # Requests are forwarded without copying their frames,
+                    #   image requests can be several megabytes
+                    request = self.socket.recv_multipart(copy=False)
+                    worker_id = idle_workers.popleft()
+                    busy_workers[worker_id] = request[0].bytes
+                    backend_socket.send_multipart([worker_id, *request])
+
+                for worker_index, worker in enumerate(workers):
+                    if worker.is_alive():
+                        continue
+                    worker_id = worker_identity(worker_index)
+                    exit_message = (f"Processing worker {worker.name} exited "
+                                    f"with code {worker.exitcode}")
+                    print(f"{exit_message}, starting a new worker")
+                    if worker_id in idle_workers:
+                        idle_workers.remove(worker_id)
+                    if worker_id in busy_workers:
+                        self.socket.send_multipart([
+                            busy_workers.pop(worker_id),
+                            ProcessingResponse(
+                                ProcessingStatus.failure, result=None,
+                                message=exit_message).to_bytes()])
+                    workers[worker_index] = start_worker(worker_index)
+        except Exception as _exception:
+            exception_message = traceback.format_exc()
+            print(f"Aborting processing server due to \n\n{exception_message}")
+        finally:
+            for worker in workers:
+                worker.terminate()
+            backend_socket.close(linger=0)
+
+    def work(self, worker_index: int):
+        """
+        Process requests forwarded by the broker indefinitely, runs in a
+            forked worker process
+
+        Args:
+            worker_index (int): index of the worker, sets the identity the
+                broker routes requests to the worker with
+        """
+        # ZMQ contexts cannot be used across a fork, the parent's context and
+        #   sockets are left untouched and replaced by new ones
+        self.context = zmq.Context()
+        self.socket = self.context.socket(zmq.DEALER)
+        self.socket.setsockopt(zmq.IDENTITY, worker_identity(worker_index))
+        self.socket.connect(self.backend_address)
+        self.socket.send(WORKER_READY_MESSAGE)
+        # `database_generation` is inherited from the broker, which never
+        #   refreshes, so a replacement worker forked after a reload refreshes
+        #   the database on its first request
+
+        # Split the cores between the workers instead of every worker's
+        #   models and OpenCV starting a thread per core
+        thread_count = max((os.cpu_count() or 1) // self.worker_count, 1)
+        torch.set_num_threads(thread_count)
+        cv2.setNumThreads(thread_count)
+
+        print(f"Worker ({os.getpid()}) ready to process image requests...")
+        try:
+            while True:
+                self.run()
+        except Exception as _exception:
+            exception_message = traceback.format_exc()
+            print(f"Aborting processing worker due to \n\n{exception_message}")
+
     def run(self):
         """
         Listen for and process a single request
@@ -73,33 +244,97 @@ class ProcessingServer:
 
         #  Wait for next request from client
         # pylint: disable=unpacking-non-sequence
-        # output = self.socket.recv_multipart()
-        # print(output)
-        # # job_id
-        # message_id = output[0]
-        # byte_args = output
-        output = self.socket.recv_multipart()
-        print(output)
-        # Dealer response
-        if len(output) == 2:
-            message_id, byte_args = output
-            message_code = "No code"
+        # Frames are not copied so the image of an image request is decoded
+        #   straight from the frame buffer
+        output: List[zmq.Frame] = self.socket.recv_multipart(copy=False)
+        message_id = output[0].bytes
+        try:
+            request = ProcessingRequest.from_frames(
+                [frame.buffer for frame in output[1:]])
+        # A malformed request is answered with a failure instead of raising,
+        #   which would stop the server or worker
+        except ValueError as _exception:
+            exception_message = traceback.format_exc()
+            print(exception_message)
+            self.send_reply(message_id, [ProcessingResponse(
+                ProcessingStatus.failure, result=None,
+                message=exception_message).to_bytes()])
+            return
+        print(f"Received message: {message_id} with code "
+              f"({request.code or 'No code'})")
+
+        response_format = request.response_format
+        send_frames = None
+        if request.stream:
+            def send_frames(frames: List[bytes]):
+                self.send_reply(message_id, frames, last=False)
 
+        # A reload refreshes the database itself, syncing first would refresh
+        #   it twice
+        if request.args != RELOAD_COMMAND_LIST:
+            self.sync_database()
+        response = self.compute(request.args, request.image_buffer,
+                                send_frames, response_format)
+        if (response.status == ProcessingStatus.reload and
+                self.reload_generation is not None):
+            with self.reload_generation.get_lock():
+                self.reload_generation.value += 1
+                self.database_generation = self.reload_generation.value
+        if request.stream:
+            self.send_reply(message_id,
+                            status_frames(response, response_format))
         else:
-            message_id, message_code, byte_args = output
-        print(f"Received message: {message_id} with code ({message_code})")
-        args: List[str] = json.loads(byte_args)
+            self.send_reply(message_id, [response.to_bytes(response_format)])
+
+    def send_reply(self, message_id: bytes, frames: List[bytes],
+                   last: bool = True):
+        """
+        Send a message of the reply to a request
 
-        response = self.compute(args)
-        self.socket.send_multipart([message_id, response.to_bytes()])
+        Args:
+            message_id (bytes): identity frame of the request
+            frames (List[bytes]): frames of the message
+            last (bool, optional): flag for the last message of the reply,
+                a worker is only handed a new request by the broker after
+                it. Defaults to True.
+        """
+        if self.reload_generation is None:
+            self.socket.send_multipart([message_id, *frames])
+            return
+        worker_status = WORKER_DONE_MESSAGE if last else WORKER_PARTIAL_MESSAGE
+        self.socket.send_multipart([worker_status, message_id, *frames])
+
+    def sync_database(self):
+        """
+        Refresh the database when another worker has reloaded it since this
+            worker last did
+        """
+        if (self.reload_generation is None or
+                self.reload_generation.value == self.database_generation):
+            return
+        self.database_generation = self.reload_generation.value
+        GV.IMAGE_DB = refresh_database(GV.IMAGE_DB)
+        print(f"Worker ({os.getpid()}) refreshed database to generation "
+              f"{self.database_generation}")
 
     @classmethod
-    def compute(cls, args: list[str]):
+    def compute(cls, args: list[str], image_buffer: memoryview = None,
+                send_frames: Callable[[list[bytes]], None] = None,
+                response_format: str = JSON_FORMAT):
         """
         Run image_processing on list of arguments
 
         Args:
             args (list[str]): list of arguments to process on
+            image_buffer (memoryview, optional): encoded image sent with the
+                request, the image path argument is only used as the image's
+                name when set. Defaults to None.
+            send_frames (Callable[[list[bytes]], None], optional): sends a
+                message of a streaming response, the roster layout and each
+                detected hero are sent with it as soon as they are ready.
+                Defaults to None.
+            response_format (str, optional): format the streamed messages
+                are encoded with. Defaults to JSON_FORMAT.
 
         Returns:
             str: the response from running image processing
@@ -111,14 +346,27 @@ class ProcessingServer:
             database_reload = False
         try:
             if database_reload:
-                GV.IMAGE_DB = load_database()
+                GV.IMAGE_DB = refresh_database(GV.IMAGE_DB)
                 return ProcessingResponse(ProcessingStatus.reload,
                                           result=None,
                                           message=DATABASE_LOAD_MESSAGE)
             else:
-                GV.global_parse_args(args)
+                image = None
+                if image_buffer is not None:
+                    image = decode_image(image_buffer)
+                context = RequestContext.from_args(args, image)
+                if send_frames is not None:
+                    context.segments_callback = (
+                        lambda roster_matrix, segment_list: send_frames(
+                            matrix_frames(RosterMatrixJson.from_segments(
+                                roster_matrix, segment_list),
+                                response_format)))
+                    context.hero_callback = (
+                        lambda hero_index, hero_data: send_frames(
+                            hero_frames(hero_index, hero_data,
+                                        response_format)))
                 start_time = time.time()
-                roster_data = detect.detect_features(GV.IMAGE_SS)
+                roster_data = detect.detect_features(context.image, context)
                 detection_message = (
                     f"Detected features in: {time.time() - start_time}")
                 print(detection_message)
@@ -137,5 +385,13 @@ class ProcessingServer:
 
 
 if __name__ == "__main__":
-    processing_server = ProcessingServer(GV.ZMQ_HOST, GV.ZMQ_PORT)
+    server_parser = argparse.ArgumentParser(
+        description="Start the feature detection server")
+    server_parser.add_argument(
+        "-w", "--workers", type=int, default=GV.ZMQ_WORKER_COUNT,
+        help="Number of worker processes that process requests, requests are "
+        "processed in the server process when 1")
+    server_args = server_parser.parse_args()
+    processing_server = ProcessingServer(GV.ZMQ_HOST, GV.ZMQ_PORT,
+                                         server_args.workers)
     processing_server.listen()
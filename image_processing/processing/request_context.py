@@ -0,0 +1,141 @@
+"""
+Module containing the per-request state of the image processing path
+
+The image, options and timer of a request used to be stored in global
+variables by `GV.global_parse_args`, so only one request could be processed
+in a process at a time. A RequestContext carries them down the processing
+path instead, letting several requests run in threads of the same process
+"""
+import os
+from typing import TYPE_CHECKING, Callable, List, Union
+
+import numpy as np
+
+import image_processing.globals as GV
+import image_processing.utils.load_images as load
+from image_processing.utils.timer import Timer
+
+if TYPE_CHECKING:
+    from image_processing.afk.hero.hero_data import DetectedHeroData
+    from image_processing.afk.roster.matrix import Matrix
+    from image_processing.processing.image_data import SegmentResult
+
+# Called with the roster matrix and segments once a roster is segmented
+SegmentsCallback = Callable[["Matrix", List["SegmentResult"]], None]
+# Called with the index and detected data of each hero as soon as it is done
+HeroCallback = Callable[[int, "DetectedHeroData"], None]
+
+
+class RequestContext:
+    """
+    Image, options and timer of a single image processing request
+    """
+
+    def __init__(self, image: np.ndarray = None, image_name: str = None,
+                 debug: bool = False, verbose_level: int = 0,
+                 worker_count: int = 1,
+                 batch_size: int = GV.MODEL_BATCH_SIZE,
+                 timer: Timer = None,
+                 segments_callback: SegmentsCallback = None,
+                 hero_callback: HeroCallback = None):
+        """
+        Create the context of a request
+
+        Args:
+            image (np.ndarray, optional): BGR roster image to process.
+                Defaults to None.
+            image_name (str, optional): file name of `image`. Defaults to
+                None.
+            debug (bool, optional): record feature matches and draw detections
+                onto `image`. Defaults to False.
+            verbose_level (int, optional): level of output to print while
+                processing. Defaults to 0.
+            worker_count (int, optional): threads to process segments with.
+                Defaults to 1.
+            batch_size (int, optional): hero images passed to the attribute
+                models in a single forward pass. Defaults to
+                GV.MODEL_BATCH_SIZE.
+            timer (Timer, optional): timer the stages of the request are
+                recorded on, a new timer is created when None. Defaults to
+                None.
+            segments_callback (SegmentsCallback, optional): called once the
+                roster is segmented, before any hero is detected. Defaults to
+                None.
+            hero_callback (HeroCallback, optional): called as each hero is
+                detected, heroes are then run through the attribute models
+                one batch at a time so the first heroes finish early.
+                Defaults to None.
+        """
+        self.image = image
+        self.image_name = image_name
+        self.debug = debug
+        self.verbose_level = verbose_level
+        self.worker_count = worker_count
+        self.batch_size = batch_size
+        self.timer = timer if timer is not None else Timer()
+        self.segments_callback = segments_callback
+        self.hero_callback = hero_callback
+
+    @classmethod
+    def from_args(cls, arg_string: Union[str, List[str]] = None,
+                  image: np.ndarray = None) -> "RequestContext":
+        """
+        Create a context from command line arguments, the same arguments
+            `GV.global_parse_args` accepts
+
+        Args:
+            arg_string (str, optional): string to parse into command line
+                arguments, loads sys.argv when this is None. Defaults to None.
+            image (np.ndarray, optional): image already sent with the request,
+                the image path argument is only used as its name when set.
+                Defaults to None.
+
+        Returns:
+            RequestContext: context with `image`, or the image at the
+                argument's image path when `image` is None
+        """
+        args = GV.parse_args(arg_string)
+        if image is None:
+            image = load.load_image(args.image_path)
+        return cls(image=image,
+                   image_name=os.path.basename(args.image_path),
+                   debug=args.DEBUG,
+                   verbose_level=args.verbose,
+                   worker_count=GV.args_worker_count(args),
+                   batch_size=args.batch_size)
+
+    @classmethod
+    def from_globals(cls, image: np.ndarray = None) -> "RequestContext":
+        """
+        Create a context from the global variables set by
+            `GV.global_parse_args`, used when a caller does not pass a context
+
+        Args:
+            image (np.ndarray, optional): roster image to process, defaults
+                to GV.IMAGE_SS when None. Defaults to None.
+
+        Returns:
+            RequestContext: context sharing GV.GLOBAL_TIMER when it is set
+        """
+        return cls(image=GV.IMAGE_SS if image is None else image,
+                   image_name=GV.IMAGE_SS_NAME,
+                   debug=bool(GV.DEBUG),
+                   verbose_level=GV.VERBOSE_LEVEL,
+                   worker_count=GV.WORKER_COUNT,
+                   batch_size=GV.MODEL_BATCH_SIZE,
+                   timer=GV.GLOBAL_TIMER)
+
+    def verbosity(self, verbose_level: int) -> bool:
+        """
+        Check if the verbose level of the request is at least `verbose_level`,
+            the per-request equivalent of `GV.verbosity`
+        """
+        return self.verbose_level >= verbose_level
+
+    def print_verbose(self, message: str, verbose_level: int = 2):
+        """
+        Print `message` when the verbose level of the request is at least
+            `verbose_level`
+        """
+        if self.verbosity(verbose_level):
+            print(message)
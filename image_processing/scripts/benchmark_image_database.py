@@ -0,0 +1,269 @@
+"""
+Benchmark the hero detection accuracy and latency of the image database
+against the labelled roster screenshots in tests/data/test_data.json
+
+Every configuration builds a new in memory database from the hero portrait
+directories, searches the hero segments of each roster screenshot and reports
+how many of the labelled heroes were detected
+
+Example:
+    python image_processing/scripts/benchmark_image_database.py \
+        --max_keypoints 0 200 400 --index_backend flann hnsw ivfpq \
+        --descriptor_dimensions 0 64 32 --root_sift --binary_shortlist 0 3 \
+        --global_shortlist 0 10 --verify_candidates 0 3 \
+        --max_accuracy_drop 0.02
+
+The first configuration is the baseline, when --max_accuracy_drop is passed
+the script exits with a non zero status if any other configuration detects a
+smaller fraction of heroes than the baseline minus the allowed drop
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from collections import Counter
+from typing import List, NamedTuple
+
+import cv2
+
+import image_processing.globals as GV
+from image_processing.afk.hero.process_heroes import get_heroes
+from image_processing.build_db import find_hero_images
+from image_processing.database.descriptor_index import (
+    DEFAULT_INDEX_BACKEND, INDEX_BACKENDS)
+from image_processing.database.image_database import ImageSearch, build_flann
+from image_processing.processing.image_data import SegmentResult
+
+TEST_DATA_PATH = os.path.join(GV.TESTS_DIR, "data", "test_data.json")
+
+
+class LabelledRoster(NamedTuple):
+    """
+    Hero segments of a roster screenshot and the heroes labelled in it
+    """
+    image_path: str
+    segment_list: List[SegmentResult]
+    hero_names: List[str]
+
+
+class BenchmarkResult(NamedTuple):
+    """
+    Accuracy and latency of a single database configuration
+    """
+    name: str
+    build_time: float
+    descriptor_count: int
+    detected: int
+    labelled: int
+    search_time: float
+
+    @property
+    def accuracy(self) -> float:
+        """
+        Fraction of labelled heroes that were detected
+        """
+        return self.detected / max(self.labelled, 1)
+
+    def __str__(self):
+        return (f"{self.name:<64} accuracy={self.accuracy:.2%} "
+                f"({self.detected}/{self.labelled}) "
+                f"search={self.search_time:.3f}s "
+                f"build={self.build_time:.1f}s "
+                f"descriptors={self.descriptor_count}")
+
+
+def load_rosters(test_data_path: str = TEST_DATA_PATH) -> List[LabelledRoster]:
+    """
+    Segment every roster screenshot in `test_data_path`, screenshots that are
+        not on disk are skipped
+
+    Args:
+        test_data_path (str, optional): path to the labelled test data.
+            Defaults to TEST_DATA_PATH.
+
+    Returns:
+        List[LabelledRoster]: segmented rosters with their labelled heroes
+    """
+    with open(test_data_path, "r", encoding="utf-8") as test_data_file:
+        test_data: dict = json.load(test_data_file)
+
+    roster_list: List[LabelledRoster] = []
+    for image_path, roster_info in test_data.items():
+        full_image_path = os.path.join(GV.ROOT_DIR, os.path.pardir, image_path)
+        roster_image = cv2.imread(full_image_path)
+        if roster_image is None:
+            print(f"Skipping {image_path}, image not found")
+            continue
+        segment_dict, _segment_matrix = get_heroes(
+            roster_image, {"hsv_range": GV.HERO_ROSTER_HSV})
+
+        hero_names = []
+        for hero_row in roster_info["heroes"]:
+            for hero_label in hero_row:
+                if isinstance(hero_label, list):
+                    hero_label = hero_label[0]
+                hero_name = hero_label.split(" ")[0].lower()
+                if hero_name != "food":
+                    hero_names.append(hero_name)
+        roster_list.append(LabelledRoster(
+            image_path, list(segment_dict.values()), hero_names))
+    return roster_list
+
+
+def run_benchmark(name: str, image_db: ImageSearch, build_time: float,
+                  roster_list: List[LabelledRoster]) -> BenchmarkResult:
+    """
+    Search the segments of every roster in `roster_list` with `image_db`
+
+    Args:
+        name (str): name of the database configuration
+        image_db (ImageSearch): database to benchmark
+        build_time (float): seconds it took to build `image_db`
+        roster_list (List[LabelledRoster]): rosters to search
+
+    Returns:
+        BenchmarkResult: accuracy and latency of `image_db`
+    """
+    detected = 0
+    labelled = 0
+    search_time = 0.0
+    for roster in roster_list:
+        start_time = time.time()
+        hero_match_list = image_db.search_many(roster.segment_list)
+        search_time += time.time() - start_time
+
+        detected_names = Counter(hero_matches.best().name.lower()
+                                 for hero_matches in hero_match_list)
+        labelled_names = Counter(roster.hero_names)
+        detected += sum((detected_names & labelled_names).values())
+        labelled += len(roster.hero_names)
+
+    descriptor_count = sum(len(segment.descriptors)
+                           for segment in image_db.matcher.segments)
+    return BenchmarkResult(name, build_time, descriptor_count, detected,
+                           labelled, search_time)
+
+
+def accuracy_regressions(result_list: List[BenchmarkResult],
+                         max_accuracy_drop: float) -> List[BenchmarkResult]:
+    """
+    Find the configurations that detect a smaller fraction of heroes than
+        the first configuration minus `max_accuracy_drop`
+
+    Args:
+        result_list (List[BenchmarkResult]): benchmark results, the first one
+            is the baseline
+        max_accuracy_drop (float): largest accuracy drop from the baseline
+            that is allowed
+
+    Returns:
+        List[BenchmarkResult]: results that regressed
+    """
+    baseline = result_list[0]
+    return [result for result in result_list[1:]
+            if baseline.accuracy - result.accuracy > max_accuracy_drop]
+
+
+def main():
+    """
+    Benchmark each combination of keypoint cap, index backend, descriptor
+        dimensions, binary shortlist and global shortlist passed on the
+        command line
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark hero detection accuracy and latency of the "
+        "image database")
+    parser.add_argument("--test_data", type=str, default=TEST_DATA_PATH,
+                        help="Labelled roster screenshots to search")
+    parser.add_argument("--max_keypoints", type=int, nargs="+", default=[0],
+                        help="Keypoint caps to benchmark, 0 keeps every "
+                        "keypoint")
+    parser.add_argument("--keypoint_radius", type=float,
+                        default=GV.KEYPOINT_NMS_RADIUS,
+                        help="Non-maximum suppression radius used with a "
+                        "keypoint cap")
+    parser.add_argument("--index_backend", type=str, nargs="+",
+                        default=[DEFAULT_INDEX_BACKEND],
+                        choices=sorted(INDEX_BACKENDS),
+                        help="Nearest neighbor backends to benchmark")
+    parser.add_argument("--descriptor_dimensions", type=int, nargs="+",
+                        default=[0],
+                        help="PCA dimensions to project descriptors to, 0 "
+                        "keeps all 128 dimensions")
+    parser.add_argument("--root_sift", action="store_true",
+                        help="Also benchmark every projection with RootSIFT "
+                        "normalization")
+    parser.add_argument("--binary_shortlist", type=int, nargs="+",
+                        default=[0],
+                        help="Heroes shortlisted by the ORB first stage, 0 "
+                        "searches the whole database")
+    parser.add_argument("--global_shortlist", type=int, nargs="+",
+                        default=[0],
+                        help="Heroes shortlisted by global image descriptors, "
+                        "0 disables the global shortlist")
+    parser.add_argument("--verify_candidates", type=int, nargs="+",
+                        default=[0],
+                        help="Heroes re-ranked by RANSAC homography inliers "
+                        "for ambiguous searches, 0 disables verification")
+    parser.add_argument("--max_accuracy_drop", type=float, default=None,
+                        help="Fail when a configuration's accuracy is more "
+                        "than this below the first configuration's")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Processes used to build each database")
+    args = parser.parse_args()
+
+    roster_list = load_rosters(args.test_data)
+    hero_images = find_hero_images()
+
+    root_sift_options = [False, True] if args.root_sift else [False]
+    result_list: List[BenchmarkResult] = []
+    for (max_keypoints, index_backend, descriptor_dimensions, root_sift,
+         binary_shortlist, global_shortlist,
+         verify_candidates) in itertools.product(
+            args.max_keypoints, args.index_backend,
+            args.descriptor_dimensions, root_sift_options,
+            args.binary_shortlist, args.global_shortlist,
+            args.verify_candidates):
+        max_keypoints = max_keypoints or None
+        descriptor_dimensions = descriptor_dimensions or None
+        binary_shortlist = binary_shortlist or None
+        global_shortlist = global_shortlist or None
+        verify_candidates = verify_candidates or None
+        start_time = time.time()
+        image_db = build_flann(
+            hero_images, enriched_db=True, workers=args.workers,
+            max_keypoints=max_keypoints,
+            keypoint_radius=args.keypoint_radius,
+            index_backend=index_backend,
+            descriptor_dimensions=descriptor_dimensions,
+            root_sift=root_sift, binary_shortlist=binary_shortlist,
+            global_shortlist=global_shortlist,
+            verify_candidates=verify_candidates)
+        build_time = time.time() - start_time
+        result = run_benchmark(
+            f"{index_backend} max_keypoints={max_keypoints} "
+            f"dims={descriptor_dimensions or 128}"
+            f"{' rootsift' if root_sift else ''}"
+            f"{f' orb={binary_shortlist}' if binary_shortlist else ''}"
+            f"{f' global={global_shortlist}' if global_shortlist else ''}"
+            f"{f' verify={verify_candidates}' if verify_candidates else ''}",
+            image_db, build_time, roster_list)
+        result_list.append(result)
+        print(result)
+
+    if args.max_accuracy_drop is not None:
+        baseline = result_list[0]
+        regressions = accuracy_regressions(result_list,
+                                           args.max_accuracy_drop)
+        for result in regressions:
+            print(f"Accuracy regression: {result.name} "
+                  f"{result.accuracy:.2%} < {baseline.name} "
+                  f"{baseline.accuracy:.2%}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import time
+import threading
 
 from typing import NamedTuple
 
@@ -155,6 +156,8 @@ class Timer:
         self.current_timer: TimeDict = None
         self.current_cache = TimerCache(None)
         self.timer_stack = []
+        self.counters: dict[str, int] = {}
+        self._counter_lock = threading.Lock()
 
     def start(self, info: str, reset: bool = False):
         """
@@ -164,6 +167,7 @@ class Timer:
         if reset:
             self.current_cache = TimerCache(None)
             self.current_timer = None
+            self.counters = {}
 
         if self.current_timer:
             self.timer_stack.append(self.current_timer)
@@ -191,8 +195,22 @@ class Timer:
         else:
             self.current_timer = None
 
+    def count(self, name: str, amount: int = 1):
+        """
+        Increment the counter `name` by `amount`, counters are displayed
+            alongside the timers and cleared when the timer is reset
+
+        Args:
+            name (str): name of counter to increment
+            amount (int, optional): amount to increment by. Defaults to 1.
+        """
+        with self._counter_lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
     def display(self):
         """_summary_
         """
 
         self.current_cache.display(self.current_timer.event_name, 0)
+        for counter_name, counter_value in self.counters.items():
+            print(f"{counter_name}:{counter_value}")
@@ -0,0 +1,164 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from pandas import DataFrame
+
+import image_processing.afk.detect_image_attributes as detect_attributes
+import image_processing.globals as GV
+from image_processing.afk.detect_image_attributes import (
+    ASCENSION_STAR_THRESHOLD, detect_attributes_batch, needs_border_detection)
+from image_processing.afk.hero.hero_data import HeroMatchJson
+from image_processing.database.configs.ascension_constants import (
+    ABBREVIATED_ASCENSION_TYPES)
+from image_processing.models.model_attributes import (
+    ASCENSION_STAR_LABELS, FI_LABELS, SI_LABELS, ModelResult)
+from image_processing.processing.image_data import SegmentResult
+from image_processing.processing.request_context import RequestContext
+
+BATCH_SIZE = 3
+# Confidence of the star detection of each hero
+STAR_SCORES = [0.9, 0.5, 0.8, 0.74, ASCENSION_STAR_THRESHOLD, 0.2, 0.95]
+HERO_COUNT = len(STAR_SCORES)
+# Heroes the border model detects nothing for
+BORDERLESS_HEROES = {5}
+DETECTION_COLUMNS = ["xmin", "ymin", "xmax", "ymax", "confidence", "class"]
+
+
+def detection_frame(detections: list[tuple[int, float]]):
+    return DataFrame([[0, 0, 10, 10, confidence, model_class]
+                      for model_class, confidence in detections],
+                     columns=DETECTION_COLUMNS)
+
+
+def star_label(hero_index: int):
+    return list(ASCENSION_STAR_LABELS.values())[
+        hero_index % len(ASCENSION_STAR_LABELS)]
+
+
+def fi_si_star_detections(hero_index: int):
+    return [(list(FI_LABELS)[hero_index % len(FI_LABELS)], 0.9),
+            (list(SI_LABELS)[hero_index % len(SI_LABELS)], 0.9),
+            (ASCENSION_STAR_LABELS.inverse[star_label(hero_index)],
+             STAR_SCORES[hero_index])]
+
+
+def border_detections(hero_index: int):
+    if hero_index in BORDERLESS_HEROES:
+        return []
+    return [(hero_index % len(ABBREVIATED_ASCENSION_TYPES), 0.9)]
+
+
+class StubModel:
+    """
+    Stand in for a yolov5 model with fixed detections for each hero, the hero
+        of an image is read from its pixel values
+    """
+
+    def __init__(self, hero_detections):
+        self.hero_detections = hero_detections
+        # Heroes of every batch the model was called with
+        self.batches: list[list[int]] = []
+
+    def __call__(self, images: list[np.ndarray], size: int):
+        hero_indices = [int(image[0, 0, 0]) for image in images]
+        self.batches.append(hero_indices)
+        return SimpleNamespace(pandas=lambda: SimpleNamespace(
+            xyxy=[detection_frame(self.hero_detections(hero_index))
+                  for hero_index in hero_indices]))
+
+
+@pytest.fixture(name="models")
+def fixture_models(monkeypatch):
+    star_model = StubModel(fi_si_star_detections)
+    border_model = StubModel(border_detections)
+    monkeypatch.setattr(GV, "FI_SI_STAR_MODEL", star_model)
+    monkeypatch.setattr(GV, "ASCENSION_BORDER_MODEL", border_model)
+    # Engravings are read from the roster image, not from a model
+    monkeypatch.setattr(detect_attributes, "detect_engraving",
+                        lambda *args: ModelResult("0", 0))
+    return star_model, border_model
+
+
+def detect_heroes(hero_callback=None):
+    """
+    Detect the attributes of HERO_COUNT heroes, every pixel of a hero's
+        segment is its index
+    """
+    name_results = [HeroMatchJson(f"hero_{hero_index}", 10, 10)
+                    for hero_index in range(HERO_COUNT)]
+    segment_list = [SegmentResult(
+        f"segment_{hero_index}",
+        np.full((8, 8, 3), hero_index, dtype=np.uint8), None, None)
+        for hero_index in range(HERO_COUNT)]
+    context = RequestContext(batch_size=BATCH_SIZE,
+                             hero_callback=hero_callback)
+    return name_results, detect_attributes_batch(name_results, segment_list,
+                                                 context=context)
+
+
+@pytest.mark.parametrize("score, border_detection", [
+    (0.2, True),
+    (ASCENSION_STAR_THRESHOLD - 0.01, True),
+    (ASCENSION_STAR_THRESHOLD, False),
+    (0.9, False),
+])
+def test_needs_border_detection(score, border_detection):
+    assert needs_border_detection(ModelResult("A1", score)) == border_detection
+
+
+def test_uncertain_stars_use_border_model(models):
+    _star_model, border_model = models
+    _name_results, hero_data = detect_heroes()
+
+    uncertain_heroes = [hero_index for hero_index in range(HERO_COUNT)
+                        if STAR_SCORES[hero_index] < ASCENSION_STAR_THRESHOLD]
+    assert uncertain_heroes == [1, 3, 5]
+    assert border_model.batches == [uncertain_heroes]
+    for hero_index, hero_attributes in enumerate(hero_data):
+        if (hero_index in uncertain_heroes and
+                hero_index not in BORDERLESS_HEROES):
+            assert hero_attributes.ascension == ModelResult(
+                ABBREVIATED_ASCENSION_TYPES[hero_index], 0.9)
+        else:
+            assert hero_attributes.ascension == ModelResult(
+                star_label(hero_index), STAR_SCORES[hero_index])
+
+
+def assert_roster_order(name_results: list[HeroMatchJson], hero_data: list):
+    assert len(hero_data) == HERO_COUNT
+    for hero_index, hero_attributes in enumerate(hero_data):
+        assert hero_attributes.name is name_results[hero_index]
+        assert (hero_attributes.image == hero_index).all()
+        assert hero_attributes.furniture == ModelResult(
+            list(FI_LABELS.values())[hero_index % len(FI_LABELS)], 0.9)
+        assert hero_attributes.signature_item == ModelResult(
+            list(SI_LABELS.values())[hero_index % len(SI_LABELS)], 0.9)
+        if STAR_SCORES[hero_index] >= ASCENSION_STAR_THRESHOLD:
+            assert hero_attributes.ascension.label == star_label(hero_index)
+
+
+def test_batches_keep_roster_order(models):
+    star_model, _border_model = models
+    name_results, hero_data = detect_heroes()
+
+    assert star_model.batches == [[0, 1, 2], [3, 4, 5], [6]]
+    assert_roster_order(name_results, hero_data)
+
+
+def test_hero_callback_runs_one_batch_at_a_time(models):
+    star_model, border_model = models
+    callback_heroes = []
+
+    def hero_callback(hero_index: int, hero_attributes):
+        # Every hero of a batch is done before the next batch starts
+        callback_heroes.append((hero_index, len(star_model.batches)))
+        assert hero_attributes.name.hero_name == f"hero_{hero_index}"
+
+    name_results, hero_data = detect_heroes(hero_callback)
+
+    assert star_model.batches == [[0, 1, 2], [3, 4, 5], [6]]
+    assert border_model.batches == [[1], [3, 5]]
+    assert callback_heroes == [(0, 1), (1, 1), (2, 1), (3, 2), (4, 2),
+                               (5, 2), (6, 3)]
+    assert_roster_order(name_results, hero_data)
@@ -0,0 +1,90 @@
+import cv2
+import numpy as np
+
+import image_processing.globals as GV
+from image_processing.afk.hero.process_heroes import (
+    SEGMENT_HASH_SIZE, cluster_segments, segment_hash)
+from image_processing.processing.image_data import SegmentResult
+
+# Closest pairs of distinct bundled portraits by difference hash
+DISTINCT_HEROES = ["gwyneth", "solise", "arden", "saurus", "ainz", "baden"]
+
+
+def load_portrait(hero_name: str):
+    return cv2.imread(str(GV.IMAGE_PROCESSING_PORTRAITS.joinpath(
+        f"{hero_name}.required.1.png")))
+
+
+def compress(image):
+    _, image_buffer = cv2.imencode(".jpg", image,
+                                   [cv2.IMWRITE_JPEG_QUALITY, 80])
+    return cv2.imdecode(image_buffer, cv2.IMREAD_COLOR)
+
+
+def brighten(image):
+    return cv2.convertScaleAbs(image, alpha=1.0, beta=8)
+
+
+def shrink(image):
+    return cv2.resize(image, (image.shape[1] * 9 // 10,
+                              image.shape[0] * 9 // 10))
+
+
+def build_segments(images):
+    return [SegmentResult(f"segment_{index}", image, None, None)
+            for index, image in enumerate(images)]
+
+
+def hash_distance(image_a, image_b):
+    return int(np.unpackbits(
+        np.bitwise_xor(segment_hash(image_a), segment_hash(image_b))).sum())
+
+
+def test_segment_hash():
+    image = load_portrait("ainz")
+    image_hash = segment_hash(image)
+    assert image_hash.dtype == np.uint8
+    assert image_hash.shape == (SEGMENT_HASH_SIZE ** 2 // 8,)
+    assert np.array_equal(image_hash, segment_hash(image.copy()))
+
+
+def test_near_duplicates_are_close():
+    for hero_name in DISTINCT_HEROES:
+        image = load_portrait(hero_name)
+        for near_duplicate in (compress(image), brighten(image),
+                               shrink(image)):
+            assert (hash_distance(image, near_duplicate) <=
+                    GV.SEGMENT_HASH_DISTANCE)
+
+
+def test_near_duplicates_merge():
+    ainz, angelo, baden = (load_portrait(hero_name) for hero_name in
+                           ["ainz", "angelo", "baden"])
+    representative_indices, segment_clusters = cluster_segments(
+        build_segments([ainz, angelo, compress(ainz), baden, brighten(angelo),
+                        shrink(ainz)]),
+        GV.SEGMENT_HASH_DISTANCE)
+
+    assert representative_indices == [0, 1, 3]
+    assert segment_clusters == [0, 1, 0, 2, 1, 0]
+
+
+def test_distinct_heroes_do_not_merge():
+    representative_indices, segment_clusters = cluster_segments(
+        build_segments([load_portrait(hero_name)
+                        for hero_name in DISTINCT_HEROES]),
+        GV.SEGMENT_HASH_DISTANCE)
+
+    assert representative_indices == list(range(len(DISTINCT_HEROES)))
+    assert segment_clusters == list(range(len(DISTINCT_HEROES)))
+
+
+def test_zero_distance_only_merges_exact_duplicates():
+    brutus = load_portrait("brutus")
+    _, segment_clusters = cluster_segments(
+        build_segments([brutus, brutus.copy(), compress(brutus)]), 0)
+    assert segment_clusters == [0, 0, 1]
+
+
+def test_no_segments():
+    assert cluster_segments([], GV.SEGMENT_HASH_DISTANCE) == ([], [])
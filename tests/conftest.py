@@ -0,0 +1,3 @@
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "slow: builds hero databases, deselect with -m 'not slow'")
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+from image_processing.database.binary_prefilter import (
+    LSH_KEY_BITS, LSH_TABLE_COUNT, ORB_DESCRIPTOR_SIZE, BinaryPrefilter)
+
+FEATURE_COUNT = 15
+
+
+def random_descriptors(descriptor_count: int, seed: int):
+    return np.random.default_rng(seed).integers(
+        0, 256, (descriptor_count, ORB_DESCRIPTOR_SIZE), dtype=np.uint8)
+
+
+def with_siblings(features: np.ndarray, seed: int):
+    """
+    Stack `features` with a sibling of each that shares the key of the first
+        hash table, so a query of a feature finds the feature and then its
+        sibling
+    """
+    siblings = features.copy()
+    siblings[:, 4:12] = random_descriptors(len(features), seed)[:, 4:12]
+    return np.concatenate([features, siblings])
+
+
+@pytest.fixture(name="image_features")
+def fixture_image_features():
+    """
+    Descriptors of three images, one for each of heroes 0, 1 and 2
+    """
+    return [random_descriptors(FEATURE_COUNT, seed)
+            for seed in range(3)]
+
+
+def build_prefilter(image_descriptors: list, **prefilter_args):
+    prefilter = BinaryPrefilter(**prefilter_args)
+    for descriptors in image_descriptors:
+        prefilter.add(descriptors)
+    prefilter.train()
+    return prefilter
+
+
+def build_query(image_features: list, feature_counts: list):
+    return np.concatenate([features[:feature_count] for features,
+                           feature_count in zip(image_features,
+                                                feature_counts)])
+
+
+def test_shortlist_ranks_heroes_by_votes(image_features):
+    prefilter = build_prefilter(
+        [with_siblings(features, seed=10 + image_index)
+         for image_index, features in enumerate(image_features)],
+        shortlist_size=2)
+    query = build_query(image_features, [12, 15, 10])
+
+    assert prefilter.shortlist(query, np.arange(3),
+                               np.ones(3, dtype=bool)).tolist() == [1, 0]
+    # Images of the same hero add up their votes
+    assert prefilter.shortlist(query, np.array([0, 1, 0]),
+                               np.ones(3, dtype=bool)).tolist() == [0, 1]
+
+
+def test_too_few_votes(image_features):
+    prefilter = build_prefilter(
+        [with_siblings(features, seed=10 + image_index)
+         for image_index, features in enumerate(image_features)],
+        min_votes=10)
+    live_images = np.ones(3, dtype=bool)
+
+    assert prefilter.shortlist(build_query(image_features, [0, 0, 9]),
+                               np.arange(3), live_images) is None
+    assert prefilter.shortlist(build_query(image_features, [0, 0, 10]),
+                               np.arange(3), live_images).tolist() == [2]
+    assert prefilter.shortlist(
+        np.empty((0, ORB_DESCRIPTOR_SIZE), dtype=np.uint8), np.arange(3),
+        live_images) is None
+
+
+def test_removed_images_do_not_vote(image_features):
+    prefilter = build_prefilter(
+        [with_siblings(features, seed=10 + image_index)
+         for image_index, features in enumerate(image_features)],
+        min_votes=10)
+    query = build_query(image_features, [15, 12, 10])
+
+    assert prefilter.shortlist(query, np.arange(3), np.array(
+        [False, True, True])).tolist() == [1, 2]
+    assert prefilter.shortlist(query, np.arange(3), np.array(
+        [False, True, False])).tolist() == [1]
+    # Every vote left is below min_votes
+    assert prefilter.shortlist(
+        build_query(image_features, [15, 0, 9]), np.arange(3),
+        np.array([False, True, True])) is None
+
+
+def test_missing_neighbors_do_not_vote(image_features):
+    # Bytes hashed by the LSH tables are all 0 for hero 0 and all 0x11 * k for
+    #   the k-th feature of hero 1, so LSH only finds a hero 1 feature itself
+    #   and returns -1 for its second neighbor
+    hashed_bytes = LSH_TABLE_COUNT * LSH_KEY_BITS // 8
+    image_features[0][:, :hashed_bytes] = 0
+    image_features[1][:, :hashed_bytes] = 0x11 * np.arange(
+        1, FEATURE_COUNT + 1)[:, None]
+    prefilter = build_prefilter(image_features[:2], min_votes=8)
+    query = build_query(image_features, [8, FEATURE_COUNT])
+    _, rows = prefilter._index.search(query, 2)
+    assert (rows[8:, 0] >= 0).all() and (rows[8:, 1] < 0).all()
+
+    assert prefilter.shortlist(query, np.arange(2),
+                               np.ones(2, dtype=bool)).tolist() == [0]
+    assert prefilter.shortlist(
+        build_query(image_features, [0, FEATURE_COUNT]), np.arange(2),
+        np.ones(2, dtype=bool)) is None
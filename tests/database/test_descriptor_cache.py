@@ -0,0 +1,137 @@
+import cv2
+import numpy as np
+
+import image_processing.globals as GV
+from image_processing.afk.hero.hero_data import HeroImage
+from image_processing.database.descriptor_cache import (
+    DescriptorCache, entry_size, image_key)
+from image_processing.database.global_prefilter import global_descriptor
+from image_processing.database.image_database import (
+    ImageSearch, build_flann)
+from image_processing.processing.image_data import SegmentResult
+
+ENTRY_BYTES = 100
+
+
+def build_entry(value: int):
+    return np.full(ENTRY_BYTES, value, dtype=np.uint8)
+
+
+def test_image_key():
+    image = np.zeros((4, 4), dtype=np.uint8)
+    assert image_key(image) == image_key(image.copy())
+    assert image_key(image) != image_key(image.reshape(2, 8))
+    assert image_key(image) != image_key(image.astype(np.uint16))
+
+
+def test_lru_eviction():
+    cache = DescriptorCache(ENTRY_BYTES * 2)
+    cache.put("a", build_entry(1))
+    cache.put("b", build_entry(2))
+    assert cache.get("a") is not None
+    cache.put("c", build_entry(3))
+
+    assert cache.get("b") is None
+    assert cache.get("a")[0] == 1
+    assert cache.get("c")[0] == 3
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_byte_limit():
+    cache = DescriptorCache(ENTRY_BYTES * 3)
+    for value in range(10):
+        cache.put(str(value), build_entry(value))
+        assert cache.current_bytes <= cache.max_bytes
+    assert len(cache) == 3
+    assert cache.current_bytes == ENTRY_BYTES * 3
+
+    cache.put("large", np.zeros(ENTRY_BYTES * 4, dtype=np.uint8))
+    assert cache.get("large") is None
+    assert len(cache) == 3
+
+
+def test_replacing_an_entry():
+    cache = DescriptorCache(ENTRY_BYTES * 3)
+    cache.put("a", build_entry(1))
+    cache.put("a", build_entry(2))
+    assert len(cache) == 1
+    assert cache.current_bytes == ENTRY_BYTES
+    assert cache.get("a")[0] == 2
+
+
+def test_entry_size():
+    entry = (build_entry(1), build_entry(2))
+    assert entry_size(entry) > ENTRY_BYTES * 2
+    assert entry_size(build_entry(1)) == ENTRY_BYTES
+
+
+def test_spill_and_reload(tmp_path):
+    cache = DescriptorCache(ENTRY_BYTES, tmp_path)
+    cache.put("a", build_entry(1))
+    cache.put("b", build_entry(2))
+    assert len(cache) == 1
+    assert len(list(tmp_path.glob("*.pickle"))) == 1
+
+    assert cache.get("a")[0] == 1
+    assert cache.hits == 1
+    # Reloading "a" evicted "b" to disk
+    assert len(cache) == 1
+    assert len(list(tmp_path.glob("*.pickle"))) == 2
+
+    restarted_cache = DescriptorCache(ENTRY_BYTES, tmp_path)
+    assert restarted_cache.get("a")[0] == 1
+    assert restarted_cache.get("b")[0] == 2
+    assert restarted_cache.get("c") is None
+    assert (restarted_cache.hits, restarted_cache.misses) == (2, 1)
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_corrupt_spill_is_a_miss(tmp_path):
+    cache = DescriptorCache(ENTRY_BYTES, tmp_path)
+    cache.put("a", build_entry(1))
+    cache.put("b", build_entry(2))
+    spill_path, = tmp_path.glob("*.pickle")
+    spill_path.write_bytes(b"corrupt")
+
+    assert cache.get("a") is None
+    assert cache.misses == 1
+
+
+def test_global_descriptor_follows_segment_color():
+    # Red and this green have the same gray value, so both images preprocess
+    #   to the same grayscale image but have different global descriptors
+    pattern = np.random.default_rng(0).random((120, 120)) < 0.5
+    red_image = np.zeros((120, 120, 3), dtype=np.uint8)
+    red_image[pattern] = (0, 0, 255)
+    green_image = np.zeros((120, 120, 3), dtype=np.uint8)
+    green_image[pattern] = (0, 130, 0)
+    assert np.array_equal(cv2.cvtColor(red_image, cv2.COLOR_BGR2GRAY),
+                          cv2.cvtColor(green_image, cv2.COLOR_BGR2GRAY))
+
+    image_db = ImageSearch(global_shortlist=5)
+    red_features = image_db.extract_features(
+        SegmentResult("red", red_image, None, None))
+    green_features = image_db.extract_features(
+        SegmentResult("green", green_image, None, None))
+
+    assert red_features.image_key != green_features.image_key
+    assert np.array_equal(green_features.global_descriptor,
+                          global_descriptor(green_image))
+    assert not np.array_equal(red_features.global_descriptor,
+                              green_features.global_descriptor)
+
+
+def test_database_key_follows_descriptors():
+    portrait_path = GV.IMAGE_PROCESSING_PORTRAITS.joinpath(
+        "ainz.required.1.png")
+
+    def build_database(portrait_name: str):
+        portrait = cv2.imread(str(GV.IMAGE_PROCESSING_PORTRAITS.joinpath(
+            f"{portrait_name}.required.1.png")))
+        return build_flann([HeroImage("ainz", portrait, portrait_path)],
+                           workers=1)
+
+    database_key = build_database("ainz").database_key
+    assert build_database("ainz").database_key == database_key
+    # A portrait replaced under the same name and path
+    assert build_database("angelo").database_key != database_key
@@ -0,0 +1,146 @@
+import numpy as np
+import pytest
+from faiss import IndexFlat, downcast_index, extract_index_ivf
+
+from image_processing.database.descriptor_index import (
+    DESCRIPTOR_DIMENSIONS, FaissBackend, FaissHNSWBackend, FaissIVFPQBackend,
+    IndexSegment, create_backend)
+
+FAISS_BACKENDS = [FaissHNSWBackend.name, FaissIVFPQBackend.name]
+# Fewest rows an IVFPQ index is trained with instead of falling back to Flat
+TRAINING_ROWS = (FaissIVFPQBackend.TRAINING_POINTS *
+                 FaissIVFPQBackend.PQ_CENTROIDS)
+
+
+def build_descriptors(row_count: int, seed: int = 0):
+    return (np.random.default_rng(seed).random(
+        (row_count, DESCRIPTOR_DIMENSIONS), dtype=np.float32) * 100)
+
+
+def build_segment(backend_name: str, image_sizes: list[int],
+                  removed_images: set[int] = ()):
+    """
+    Trained segment of images with `image_sizes` random descriptors each
+    """
+    segment = IndexSegment(backend_name)
+    descriptors = build_descriptors(sum(image_sizes))
+    offsets = np.concatenate([[0], np.cumsum(image_sizes)])
+    for image_index in range(len(image_sizes)):
+        segment.add(descriptors[offsets[image_index]:
+                                offsets[image_index + 1]])
+    for image_index in removed_images:
+        segment.remove_image(image_index)
+    segment.train()
+    return segment
+
+
+def reload_segment(segment: IndexSegment, tmp_path):
+    """
+    Save the index of `segment` and load it into a new segment with the same
+        descriptors
+    """
+    index_path = tmp_path.joinpath("segment.index")
+    segment.save(index_path)
+    loaded_segment = IndexSegment(segment.backend_name)
+    loaded_segment.set_descriptors(segment.descriptors, segment.offsets,
+                                   segment.removed_images)
+    assert loaded_segment.load(index_path)
+    return loaded_segment
+
+
+def assert_finds_image(segment: IndexSegment, image_index: int,
+                       min_recall: float = 1.0):
+    """
+    Search with the descriptors of `image_index` and check that their nearest
+        neighbors are those same descriptors
+    """
+    descriptors = segment.image_descriptors(image_index)
+    distances, image_indices, train_indices = segment.knn_search(descriptors)
+    found = ((image_indices[:, 0] == image_index) &
+             (train_indices[:, 0] == np.arange(len(descriptors))))
+    assert found.mean() >= min_recall
+    assert np.isfinite(distances).all()
+
+
+@pytest.mark.parametrize("row_count, dimensions, index_key", [
+    (1, 128, "Flat"),
+    (TRAINING_ROWS - 1, 128, "Flat"),
+    (TRAINING_ROWS, 128, "IVF256,PQ16"),
+    # Limited by 4 * sqrt(row_count) instead of the training points
+    (100000, 128, "IVF1264,PQ16"),
+    (100000, 64, "IVF1264,PQ16"),
+    (100000, 24, "IVF1264,PQ8"),
+    (100000, 20, "IVF1264,PQ4"),
+])
+def test_ivfpq_index_key(row_count, dimensions, index_key):
+    assert FaissIVFPQBackend().index_key(row_count, dimensions) == index_key
+
+
+@pytest.mark.parametrize("backend_name", FAISS_BACKENDS)
+def test_small_segment(backend_name, tmp_path):
+    segment = build_segment(backend_name, [50, 30, 50], {1})
+    # Rows after the removed image are remapped to their descriptor rows
+    assert_finds_image(segment, 0)
+    assert_finds_image(segment, 2)
+
+    loaded_segment = reload_segment(segment, tmp_path)
+    if backend_name == FaissIVFPQBackend.name:
+        # Too few rows to train the quantizers
+        assert isinstance(segment._backend._index, IndexFlat)
+        assert isinstance(loaded_segment._backend._index, IndexFlat)
+    assert_finds_image(loaded_segment, 0)
+    assert_finds_image(loaded_segment, 2)
+    _, image_indices, _ = loaded_segment.knn_search(
+        build_descriptors(20, seed=1), k=5)
+    assert 1 not in image_indices
+
+
+@pytest.mark.parametrize("backend_name", FAISS_BACKENDS)
+def test_one_row_segment(backend_name):
+    segment = build_segment(backend_name, [1])
+    distances, image_indices, train_indices = segment.knn_search(
+        build_descriptors(3, seed=1), k=2)
+    assert np.isfinite(distances[:, 0]).all()
+    assert np.isinf(distances[:, 1]).all()
+    assert not image_indices.any() and not train_indices.any()
+
+    # Backends return a -1 row when the index has fewer rows than k
+    rows, distances = segment._backend.search(build_descriptors(3, seed=1), 2)
+    assert (rows[:, 1] == -1).all()
+    assert np.isinf(distances[:, 1]).all()
+
+
+@pytest.mark.parametrize("backend_name", FAISS_BACKENDS)
+def test_load_checks_row_count(backend_name, tmp_path):
+    index_path = tmp_path.joinpath("backend.index")
+    descriptors = build_descriptors(20)
+    backend: FaissBackend = create_backend(backend_name)
+    backend.build(descriptors)
+    backend.save(index_path)
+
+    assert create_backend(backend_name).load(descriptors, index_path)
+    assert not create_backend(backend_name).load(
+        build_descriptors(21), index_path)
+
+
+@pytest.mark.slow
+def test_trained_ivfpq_segment(tmp_path):
+    # Still at least TRAINING_ROWS rows once the middle image is removed
+    image_sizes = [TRAINING_ROWS // 2 + 10, 500, TRAINING_ROWS // 2 + 10]
+    segment = build_segment(FaissIVFPQBackend.name, image_sizes, {1})
+    ivf_index = downcast_index(extract_index_ivf(segment._backend._index))
+    assert ivf_index.nlist == 256
+    assert ivf_index.pq.M == 16
+    assert ivf_index.ntotal == TRAINING_ROWS + 20
+    # Product quantized distances are approximate
+    assert_finds_image(segment, 0, min_recall=0.95)
+    assert_finds_image(segment, 2, min_recall=0.95)
+
+    loaded_segment = reload_segment(segment, tmp_path)
+    assert extract_index_ivf(loaded_segment._backend._index).nlist == 256
+    assert_finds_image(loaded_segment, 2, min_recall=0.95)
+
+    # An index saved for other descriptors is rebuilt instead of loaded
+    segment.save(tmp_path.joinpath("segment.index"))
+    assert not create_backend(FaissIVFPQBackend.name).load(
+        segment.descriptors, tmp_path.joinpath("segment.index"))
@@ -0,0 +1,158 @@
+import json
+from pathlib import Path
+
+import cv2
+import pytest
+
+import image_processing.globals as GV
+from image_processing.afk.hero.hero_data import HeroImage
+from image_processing.database.descriptor_store import (
+    MANIFEST_FILE, STORE_VERSION, StoreVersionException, index_file_name,
+    load_store, read_manifest, refresh_store, save_store, update_store)
+from image_processing.database.image_database import ImageSearch, build_flann
+from image_processing.processing.image_data import SegmentResult
+
+BUILD_HEROES = ["ainz", "angelo", "arden", "baden"]
+ADDED_HERO = "brutus"
+
+
+def load_portrait(hero_name: str):
+    portrait_path = GV.IMAGE_PROCESSING_PORTRAITS.joinpath(
+        f"{hero_name}.required.1.png")
+    return HeroImage(hero_name, cv2.imread(str(portrait_path)), portrait_path)
+
+
+def best_match(image_db: ImageSearch, hero_name: str):
+    portrait = load_portrait(hero_name)
+    return image_db.search(
+        SegmentResult(hero_name, portrait.image, None, None)).best().name
+
+
+def edit_manifest(store_dir: Path, **changes):
+    manifest_path = store_dir.joinpath(MANIFEST_FILE)
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    manifest.update(changes)
+    manifest_path.write_text(json.dumps(manifest), encoding="utf-8")
+    return manifest
+
+
+def index_files(store_dir: Path):
+    return sorted(index_path.name for index_path in
+                  store_dir.glob(f"segment_*/{index_file_name('*', '*')}"))
+
+
+@pytest.fixture(name="store_dir")
+def fixture_store_dir(tmp_path):
+    image_db = build_flann([load_portrait(hero_name)
+                            for hero_name in BUILD_HEROES],
+                           enriched_db=True, workers=1)
+    store_dir = tmp_path.joinpath("store")
+    save_store(image_db, store_dir)
+    return store_dir
+
+
+def test_round_trip(store_dir):
+    image_db = load_store(store_dir)
+    manifest = read_manifest(store_dir)
+
+    assert manifest["enriched_db"]
+    assert image_db.enriched_db
+    assert image_db.store_id == manifest["store_id"]
+    assert image_db.cropped_images == [False, True] * len(BUILD_HEROES)
+    assert sorted(image_db.hero_lookup) == BUILD_HEROES
+    for hero_name in BUILD_HEROES:
+        assert best_match(image_db, hero_name) == hero_name
+    assert not list(store_dir.parent.glob("store.*"))
+    assert not list(store_dir.rglob("*.tmp"))
+
+
+def test_add_heroes(store_dir):
+    image_db = load_store(store_dir)
+    stale_db = load_store(store_dir)
+    image_db.add_heroes([load_portrait(ADDED_HERO)], workers=1)
+    update_store(image_db, store_dir)
+
+    manifest = read_manifest(store_dir)
+    assert len(manifest["segments"]) == 2
+    assert [image_record["cropped"] for image_record in
+            manifest["images"][-2:]] == [False, True]
+
+    refreshed_db = refresh_store(stale_db, store_dir)
+    assert refreshed_db is not stale_db
+    assert ADDED_HERO not in stale_db.hero_lookup
+    assert best_match(refreshed_db, ADDED_HERO) == ADDED_HERO
+    assert best_match(load_store(store_dir), ADDED_HERO) == ADDED_HERO
+
+
+def test_add_heroes_follows_enriched_db():
+    image_db = build_flann([load_portrait(BUILD_HEROES[0])], workers=1)
+    image_db.add_heroes([load_portrait(ADDED_HERO)], workers=1)
+    assert image_db.cropped_images == [False] * 4
+
+    image_db.add_heroes([load_portrait(BUILD_HEROES[1])], enriched_db=True,
+                        workers=1)
+    assert image_db.cropped_images[4:] == [False, True]
+
+
+def test_remove_hero_tombstones(store_dir):
+    removed_hero = BUILD_HEROES[0]
+    image_db = load_store(store_dir)
+    stale_db = load_store(store_dir)
+    old_index_files = index_files(store_dir)
+    image_db.remove_hero(removed_hero)
+    update_store(image_db, store_dir)
+
+    manifest = read_manifest(store_dir)
+    assert [image_record["removed"] for image_record in manifest["images"]
+            ] == [image_record["name"] == removed_hero
+                  for image_record in manifest["images"]]
+    # The rebuilt index replaced the old one
+    assert len(index_files(store_dir)) == 1
+    assert index_files(store_dir) != old_index_files
+
+    for loaded_db in (load_store(store_dir),
+                      refresh_store(stale_db, store_dir)):
+        assert removed_hero not in loaded_db.hero_lookup
+        assert len(loaded_db.index_lookup) == len(image_db.index_lookup)
+        assert best_match(loaded_db, removed_hero) != removed_hero
+        assert best_match(loaded_db, BUILD_HEROES[1]) == BUILD_HEROES[1]
+    assert removed_hero in stale_db.hero_lookup
+
+
+def test_checksum_mismatch_rebuilds_index(store_dir):
+    manifest = read_manifest(store_dir)
+    index_checksum = manifest["segments"][0]["index_checksum"]
+    for index_name in index_files(store_dir):
+        store_dir.joinpath("segment_000", index_name).unlink()
+    manifest["segments"][0]["index_checksum"] = "stale"
+    edit_manifest(store_dir, segments=manifest["segments"])
+
+    image_db = load_store(store_dir)
+    assert (read_manifest(store_dir)["segments"][0]["index_checksum"] ==
+            index_checksum)
+    assert index_files(store_dir) == [
+        index_file_name(index_checksum, image_db.matcher.backend_name)]
+    assert best_match(image_db, BUILD_HEROES[2]) == BUILD_HEROES[2]
+
+
+def test_version_mismatch(store_dir):
+    edit_manifest(store_dir, version=STORE_VERSION + 1)
+    with pytest.raises(StoreVersionException):
+        load_store(store_dir)
+
+    image_db = build_flann([load_portrait(ADDED_HERO)], workers=1)
+    update_store(image_db, store_dir)
+    assert load_store(store_dir).store_id == image_db.store_id
+
+
+def test_missing_store(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        load_store(tmp_path)
+
+
+def test_enriched_db_of_older_manifest(store_dir):
+    manifest = read_manifest(store_dir)
+    del manifest["enriched_db"]
+    store_dir.joinpath(MANIFEST_FILE).write_text(json.dumps(manifest),
+                                                 encoding="utf-8")
+    assert load_store(store_dir).enriched_db
@@ -0,0 +1,132 @@
+import cv2
+import numpy as np
+import pytest
+
+import image_processing.globals as GV
+from image_processing.database.geometric_verifier import (
+    MIN_HOMOGRAPHY_MATCHES, GeometricVerifier)
+from image_processing.database.image_database import (
+    HeroMatchList, ImageSearch, KnnMatches)
+from image_processing.processing.request_context import RequestContext
+
+HERO_NAMES = ["Lucius", "Shemira"]
+HOMOGRAPHY = np.array([[0.9, 0.05, 20.0],
+                       [-0.03, 1.1, 10.0],
+                       [1e-4, 5e-5, 1.0]])
+
+
+def random_points(point_count: int, seed: int = 0):
+    return (np.random.default_rng(seed).random((point_count, 2)) *
+            GV.HERO_PORTRAIT_SIZE).astype(np.float32)
+
+
+def project(points: np.ndarray):
+    return cv2.perspectiveTransform(points.reshape(-1, 1, 2),
+                                    HOMOGRAPHY).reshape(-1, 2)
+
+
+def test_inlier_count_of_a_homography():
+    verifier = GeometricVerifier()
+    query_points = random_points(60)
+    train_points = project(query_points)
+    # A third of the matches point somewhere else in the portrait
+    train_points[40:] = random_points(20, seed=1)
+
+    inliers = verifier.inlier_count(query_points, train_points)
+    assert 40 <= inliers < 40 + verifier.min_inliers
+
+
+def test_inlier_count_of_random_points():
+    verifier = GeometricVerifier()
+    assert verifier.inlier_count(
+        random_points(60), random_points(60, seed=1)) < verifier.min_inliers
+
+
+def test_inlier_count_of_too_few_matches():
+    query_points = random_points(MIN_HOMOGRAPHY_MATCHES - 1)
+    assert GeometricVerifier().inlier_count(
+        query_points, project(query_points)) == 0
+
+
+@pytest.mark.parametrize("match_counts, ambiguous", [
+    ([], False),
+    ([9], True),
+    ([10], False),
+    ([10, 5], True),
+    ([10, 4], False),
+    ([21, 10], False),
+    ([9, 1], True),
+])
+def test_is_ambiguous(match_counts, ambiguous):
+    verifier = GeometricVerifier(vote_ratio=0.5)
+    assert verifier.is_ambiguous(np.array(match_counts),
+                                 confident_count=10) == ambiguous
+
+
+def build_verified_database(train_keypoints: list):
+    """
+    ImageSearch with a single portrait of each hero in HERO_NAMES, only the
+        state verification reads is set
+    """
+    image_db = ImageSearch(verify_candidates=3)
+    image_db.hero_names = HERO_NAMES
+    image_db.image_hero_ids = np.arange(len(HERO_NAMES))
+    image_db.live_images = np.ones(len(HERO_NAMES), dtype=bool)
+    for keypoints in train_keypoints:
+        image_db.verifier.add(keypoints)
+    image_db.verifier.train()
+    return image_db
+
+
+def verify(image_db: ImageSearch, query_points: list):
+    """
+    Verify the matches of `query_points[i]` against the keypoints of image
+        `i` in the same order
+
+    Returns:
+        Tuple[bool, HeroMatchList]: result of the verification and the
+            matches it re-ranked
+    """
+    image_indices = np.concatenate(
+        [np.full(len(points), image_index) for image_index, points in
+         enumerate(query_points)])
+    train_indices = np.concatenate(
+        [np.arange(len(points)) for points in query_points])
+    matches = KnnMatches(np.ones((len(image_indices), 2)), image_indices,
+                         train_indices)
+    hero_matches = HeroMatchList.from_votes(
+        HERO_NAMES, image_db.image_hero_ids[image_indices],
+        np.ones(len(image_indices)))
+    verified = image_db._verify_matches(np.concatenate(query_points),
+                                        matches, hero_matches,
+                                        RequestContext())
+    return verified, hero_matches
+
+
+def test_verification_reorders_heroes_by_inliers():
+    lucius_points = random_points(40)
+    shemira_points = random_points(30, seed=1)
+    image_db = build_verified_database(
+        [random_points(40, seed=2), project(shemira_points)])
+    verified, hero_matches = verify(image_db,
+                                    [lucius_points, shemira_points])
+
+    assert verified
+    assert hero_matches.best().name == "Shemira"
+    assert hero_matches.best().match_count == 30
+    assert hero_matches.best().inliers == 30
+    assert hero_matches[1].name == "Lucius"
+    assert hero_matches[1].inliers < image_db.verifier.min_inliers
+    assert hero_matches.verified_confidence > 0.75
+
+
+def test_verification_without_a_homography():
+    image_db = build_verified_database(
+        [random_points(40, seed=2), random_points(30, seed=3)])
+    verified, hero_matches = verify(
+        image_db, [random_points(40), random_points(30, seed=1)])
+
+    assert not verified
+    assert hero_matches.best().name == "Lucius"
+    assert hero_matches.best().inliers is None
+    assert hero_matches.verified_confidence is None
@@ -0,0 +1,65 @@
+import numpy as np
+
+from image_processing.database.global_prefilter import (
+    GLOBAL_DESCRIPTOR_SIZE, GlobalPrefilter)
+
+# Hero of each database image, the images are in order of their distance to
+#   the query and every hero has two images
+IMAGE_HERO_IDS = np.array([2, 0, 2, 1, 3, 0, 1, 3])
+
+
+def build_prefilter(shortlist_size: int):
+    """
+    Prefilter with an image for every entry of IMAGE_HERO_IDS, image `i` is
+        the `i`-th closest to the returned query
+
+    Returns:
+        Tuple[GlobalPrefilter, np.ndarray]: the prefilter and the query
+    """
+    query = np.zeros(GLOBAL_DESCRIPTOR_SIZE, dtype=np.float32)
+    query[0] = 1
+    prefilter = GlobalPrefilter(shortlist_size)
+    for image_index in range(len(IMAGE_HERO_IDS)):
+        descriptor = query.copy()
+        descriptor[1] = 0.1 * (image_index + 1)
+        prefilter.add(descriptor)
+    prefilter.train()
+    return prefilter, query
+
+
+def test_shortlist_keeps_the_closest_image_of_each_hero():
+    live_images = np.ones(len(IMAGE_HERO_IDS), dtype=bool)
+    prefilter, query = build_prefilter(3)
+    assert prefilter.shortlist(query, IMAGE_HERO_IDS,
+                               live_images).tolist() == [2, 0, 1]
+
+    prefilter, query = build_prefilter(5)
+    assert prefilter.shortlist(query, IMAGE_HERO_IDS,
+                               live_images).tolist() == [2, 0, 1, 3]
+
+
+def test_shortlist_skips_removed_images():
+    prefilter, query = build_prefilter(3)
+    live_images = np.ones(len(IMAGE_HERO_IDS), dtype=bool)
+    live_images[0] = False
+    assert prefilter.shortlist(query, IMAGE_HERO_IDS,
+                               live_images).tolist() == [0, 2, 1]
+
+    # Every image of hero 2 is removed
+    live_images[2] = False
+    assert prefilter.shortlist(query, IMAGE_HERO_IDS,
+                               live_images).tolist() == [0, 1, 3]
+
+
+def test_empty_shortlist():
+    query = np.zeros(GLOBAL_DESCRIPTOR_SIZE, dtype=np.float32)
+    prefilter = GlobalPrefilter()
+    assert prefilter.shortlist(query, IMAGE_HERO_IDS[:0],
+                               np.ones(0, dtype=bool)) is None
+    prefilter.train()
+    assert prefilter.shortlist(query, IMAGE_HERO_IDS[:0],
+                               np.ones(0, dtype=bool)) is None
+
+    prefilter, _query = build_prefilter(3)
+    live_images = np.ones(len(IMAGE_HERO_IDS), dtype=bool)
+    assert prefilter.shortlist(None, IMAGE_HERO_IDS, live_images) is None
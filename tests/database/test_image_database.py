@@ -0,0 +1,148 @@
+import numpy as np
+import pytest
+
+from image_processing.database.image_database import (
+    RATIO_STEP, HeroMatchList, ImageSearch, KnnMatches)
+
+HERO_NAMES = ["Lucius", "Shemira", "Brutus", "Thane"]
+
+
+def build_matches(best_distances, second_distances, dtype=np.float32):
+    distances = np.stack([best_distances, second_distances],
+                         axis=1).astype(dtype)
+    return KnnMatches(distances, np.zeros(len(distances), dtype=np.int64),
+                      np.zeros(len(distances), dtype=np.int64))
+
+
+def ratio_ladder(lowes_ratio):
+    ladder = []
+    ratio = lowes_ratio
+    while ratio <= 1.0:
+        ladder.append(ratio + RATIO_STEP)
+        ratio += RATIO_STEP
+    return ladder
+
+
+@pytest.fixture(name="image_db")
+def fixture_image_db():
+    return ImageSearch(lowes_ratio=0.8)
+
+
+def test_solve_ratio_picks_smallest_passing_ratio(image_db):
+    matches = build_matches([0.5, 0.7, 0.87, 0.92, 0.97],
+                            [1.0, 1.0, 1.0, 1.0, 1.0])
+    ladder = ratio_ladder(image_db.ratio)
+
+    assert image_db.solve_ratio(matches, 2) == ladder[0]
+    assert image_db.solve_ratio(matches, 3) == ladder[1]
+    assert image_db.solve_ratio(matches, 4) == ladder[2]
+
+
+def test_solve_ratio_falls_back_to_loosest_ratio(image_db):
+    matches = build_matches([0.5, 2.0], [1.0, 1.0])
+    assert (image_db.solve_ratio(matches, 5) ==
+            ratio_ladder(image_db.ratio)[-1])
+
+
+def test_solve_ratio_agrees_with_good_features_on_boundaries(image_db):
+    # Distances whose ratio lands exactly on a ladder step are where
+    #   d1 / d2 < r and d1 < r * d2 round to different answers
+    random = np.random.default_rng(0)
+    ladder = np.repeat(ratio_ladder(image_db.ratio), 150)
+    second_distances = random.uniform(50, 400, len(ladder))
+    matches = build_matches(ladder * second_distances, second_distances,
+                            np.float64)
+
+    loosest_count = np.count_nonzero(image_db.get_good_features(
+        matches, ratio_ladder(image_db.ratio)[-1]))
+    for min_features in range(1, loosest_count + 1, 7):
+        ratio = image_db.solve_ratio(matches, min_features)
+        assert np.count_nonzero(
+            image_db.get_good_features(matches, ratio)) >= min_features
+
+
+def test_missing_neighbors_never_pass(image_db):
+    matches = build_matches([np.inf, 0.0, 10.0], [np.inf, 0.0, np.inf])
+    assert image_db.get_good_features(matches, 1.05).tolist() == [
+        False, False, True]
+
+
+def hero_votes(hero_match_list: HeroMatchList):
+    return [(hero_match.name, hero_match.match_count, hero_match.inliers)
+            for hero_match in hero_match_list]
+
+
+def test_from_votes_counts_votes():
+    match_list = HeroMatchList.from_votes(
+        HERO_NAMES, np.array([2, 0, 2, 2, 0]),
+        np.array([1.0, 2.0, 3.0, 4.0, 5.0]))
+
+    assert hero_votes(match_list) == [("Brutus", 3, None),
+                                      ("Lucius", 2, None)]
+    assert match_list.distances.tolist() == [8.0, 7.0]
+    assert match_list.total_matches == 5
+    assert match_list[0].total_matches == 5
+
+
+def test_from_votes_ties_keep_first_vote_order():
+    match_list = HeroMatchList.from_votes(
+        HERO_NAMES, np.array([3, 1, 1, 3, 0]), np.ones(5))
+    assert hero_votes(match_list) == [("Thane", 2, None),
+                                      ("Shemira", 2, None),
+                                      ("Lucius", 1, None)]
+
+
+def test_set_inliers_ranks_verified_heroes_first():
+    match_list = HeroMatchList.from_votes(
+        HERO_NAMES, np.array([0, 0, 0, 1, 1, 2]), np.ones(6))
+    match_list.set_inliers(np.array([2, 1]), np.array([8, 12]), 0.5)
+
+    assert hero_votes(match_list) == [("Shemira", 2, 12),
+                                      ("Brutus", 1, 8),
+                                      ("Lucius", 3, None)]
+    assert match_list.verified_confidence == 0.5
+
+
+def test_extend_merges_matches_for_the_same_hero():
+    match_list = HeroMatchList.from_votes(
+        HERO_NAMES, np.array([0, 0, 1]), np.array([1.0, 1.0, 2.0]))
+    other_list = HeroMatchList.from_votes(
+        HERO_NAMES, np.array([2, 1, 1, 1]), np.array([1.0, 3.0, 3.0, 3.0]))
+    other_list.set_inliers(np.array([1]), np.array([9]), 0.75)
+    match_list.extend(other_list)
+
+    assert hero_votes(match_list) == [("Shemira", 4, 9),
+                                      ("Lucius", 2, None),
+                                      ("Brutus", 1, None)]
+    assert match_list.distances.tolist() == [11.0, 2.0, 1.0]
+    assert match_list.total_matches == 7
+    assert match_list.verified_confidence == 0.75
+
+
+def test_extend_ties_keep_existing_order():
+    match_list = HeroMatchList.from_votes(
+        HERO_NAMES, np.array([1, 0]), np.ones(2))
+    match_list.extend(HeroMatchList.from_votes(
+        HERO_NAMES, np.array([3, 0, 1]), np.ones(3)))
+
+    assert hero_votes(match_list) == [("Shemira", 2, None),
+                                      ("Lucius", 2, None),
+                                      ("Thane", 1, None)]
+
+
+def test_extend_empty_list():
+    match_list = HeroMatchList(HERO_NAMES)
+    match_list.extend(HeroMatchList.from_votes(
+        HERO_NAMES, np.array([2, 2]), np.ones(2)))
+    assert hero_votes(match_list) == [("Brutus", 2, None)]
+
+
+def test_summary_round_trip():
+    match_list = HeroMatchList.from_votes(
+        HERO_NAMES, np.array([0, 1, 1]), np.array([1.0, 2.0, 3.0]))
+    match_list.set_inliers(np.array([0]), np.array([6]), 0.25)
+    round_trip = HeroMatchList.from_summary(HERO_NAMES, match_list.summary())
+
+    assert hero_votes(round_trip) == hero_votes(match_list)
+    assert round_trip.distances.tolist() == match_list.distances.tolist()
+    assert round_trip.verified_confidence == 0.25
@@ -0,0 +1,112 @@
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+from image_processing.processing.async_processing.processing_request import (
+    DEFAULT_IMAGE_NAME, IMAGE_REQUEST_CODE, ImageRequestHeader,
+    ProcessingRequest, args_request_frames, decode_image,
+    image_request_frames)
+from image_processing.processing.async_processing.processing_response import (
+    JSON_FORMAT, MSGPACK_FORMAT)
+from image_processing.processing.async_processing.processing_stream import (
+    STREAM_REQUEST_CODE)
+
+
+def build_image():
+    image = np.zeros((40, 60, 3), dtype=np.uint8)
+    image[10:30, 20:40] = (255, 128, 0)
+    image[:, :5] = (0, 0, 255)
+    return image
+
+
+@pytest.mark.parametrize("response_format", [JSON_FORMAT, MSGPACK_FORMAT])
+@pytest.mark.parametrize("stream", [False, True])
+def test_image_request_round_trip(stream, response_format):
+    image = build_image()
+    frames = image_request_frames(image, ["-v"], stream=stream,
+                                  response_format=response_format)
+    request = ProcessingRequest.from_frames(
+        [memoryview(frame) for frame in frames])
+
+    assert request.code == IMAGE_REQUEST_CODE
+    assert request.args == ["-v", DEFAULT_IMAGE_NAME]
+    assert request.stream == stream
+    assert request.response_format == response_format
+    assert np.array_equal(decode_image(request.image_buffer), image)
+
+
+def test_image_request_with_encoded_image():
+    image = build_image()
+    _, image_buffer = cv2.imencode(".png", image)
+    frames = image_request_frames(image_buffer.tobytes(), [], "heroes.png")
+    request = ProcessingRequest.from_frames(frames)
+
+    assert request.args == ["heroes.png"]
+    assert np.array_equal(decode_image(request.image_buffer), image)
+
+
+@pytest.mark.parametrize("response_format", [JSON_FORMAT, MSGPACK_FORMAT])
+@pytest.mark.parametrize("stream", [False, True])
+def test_args_request_round_trip(stream, response_format):
+    frames = args_request_frames(["roster.png", "-v"], stream,
+                                 response_format)
+    request = ProcessingRequest.from_frames(frames)
+
+    assert request.args == ["roster.png", "-v"]
+    assert request.stream == stream
+    assert request.response_format == response_format
+    assert request.image_buffer is None
+
+
+def test_unknown_flags_are_ignored():
+    request = ProcessingRequest.from_frames(
+        [b"legacy+" + STREAM_REQUEST_CODE, json.dumps(["-v"]).encode()])
+    assert request.stream
+    assert request.args == ["-v"]
+
+
+def test_unknown_response_format():
+    header = ImageRequestHeader(["roster.png"], response_format="xml")
+    request = ProcessingRequest.from_frames(
+        [IMAGE_REQUEST_CODE, header.to_bytes(), b""])
+    assert request.response_format == JSON_FORMAT
+
+
+@pytest.mark.parametrize("image_buffer", [
+    b"", b"not an image", b"\x89PNG\r\n\x1a\n" + b"\x00" * 32])
+def test_decode_invalid_image(image_buffer):
+    with pytest.raises(ValueError):
+        decode_image(memoryview(image_buffer))
+
+
+def test_decode_truncated_image():
+    frames = image_request_frames(build_image(), [])
+    with pytest.raises(ValueError):
+        decode_image(frames[2][:len(frames[2]) // 4])
+
+
+@pytest.mark.parametrize("frames", [
+    [],
+    [IMAGE_REQUEST_CODE, b"{}", b"", b""],
+    # Image request without its image frame
+    [IMAGE_REQUEST_CODE, ImageRequestHeader(["roster.png"]).to_bytes()],
+    # Argument request with an image frame
+    [STREAM_REQUEST_CODE, b"[]", b""],
+], ids=["empty", "extra_frame", "missing_image", "unexpected_image"])
+def test_mismatched_frame_count(frames):
+    with pytest.raises(ValueError):
+        ProcessingRequest.from_frames(frames)
+
+
+@pytest.mark.parametrize("frames", [
+    [b"not json"],
+    [json.dumps({"args": []}).encode()],
+    [json.dumps(["-v", 1]).encode()],
+    [IMAGE_REQUEST_CODE, b"[]", b""],
+    [IMAGE_REQUEST_CODE, json.dumps({"args": "-v"}).encode(), b""],
+])
+def test_malformed_request(frames):
+    with pytest.raises(ValueError):
+        ProcessingRequest.from_frames(frames)
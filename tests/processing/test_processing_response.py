@@ -0,0 +1,137 @@
+import json
+
+import msgpack
+import pytest
+
+from image_processing.afk.hero.hero_data import (
+    DetectedHeroData, HeroMatchJson, RosterJson, RosterMatrixJson)
+from image_processing.models.model_attributes import ModelResult
+from image_processing.processing.async_processing.processing_response import (
+    JSON_FORMAT, MSGPACK_FORMAT, MSGPACK_WIRE_VERSION, ProcessingResponse,
+    is_json_payload)
+from image_processing.processing.async_processing.processing_status import (
+    ProcessingStatus)
+from image_processing.processing.async_processing.processing_stream import (
+    HERO_FRAME, MATRIX_FRAME, STATUS_FRAME, hero_frames, matrix_frames,
+    parse_stream_frames, status_frames)
+
+
+def build_hero(hero_name="Lucius", match_count=42):
+    return DetectedHeroData(
+        HeroMatchJson(hero_name, match_count, 60),
+        ModelResult("SI30", 0.875),
+        ModelResult("9F", 0.5),
+        ModelResult("A4", 0.75),
+        ModelResult("E60", 0.25))
+
+
+def build_roster(hero_count=4):
+    heroes = [build_hero(f"Hero{index}", index) for index in range(hero_count)]
+    return RosterJson(heroes, (hero_count + 4) // 5, min(hero_count, 5))
+
+
+def assert_same_hero(hero_a: DetectedHeroData, hero_b: DetectedHeroData):
+    assert hero_a.to_dict() == hero_b.to_dict()
+
+
+def assert_same_roster(roster_a: RosterJson, roster_b: RosterJson):
+    assert roster_a.json_dict() == roster_b.json_dict()
+
+
+def test_model_result_round_trip():
+    model_result = ModelResult("SI30", 0.875)
+    assert ModelResult.from_list(model_result.to_list()) == model_result
+
+
+def test_hero_match_round_trip():
+    hero_match = HeroMatchJson("Lucius", 42, 60)
+    round_trip = HeroMatchJson.from_list(
+        msgpack.unpackb(msgpack.packb(hero_match.to_list())))
+    assert round_trip.to_dict() == hero_match.to_dict()
+
+
+def test_hero_match_without_total_round_trip():
+    hero_match = HeroMatchJson("Lucius", 42, None)
+    round_trip = HeroMatchJson.from_list(hero_match.to_list())
+    assert round_trip.total_matches is None
+
+
+def test_detected_hero_round_trip():
+    hero = build_hero()
+    assert_same_hero(DetectedHeroData.from_list(
+        msgpack.unpackb(msgpack.packb(hero.to_list()))), hero)
+
+
+def test_roster_round_trip():
+    roster = build_roster()
+    assert_same_roster(RosterJson.from_list(
+        msgpack.unpackb(msgpack.packb(roster.to_list()))), roster)
+
+
+@pytest.mark.parametrize("response_format", [JSON_FORMAT, MSGPACK_FORMAT])
+def test_success_response_round_trip(response_format):
+    response = ProcessingResponse(ProcessingStatus.success, build_roster(), "")
+    payload = response.to_bytes(response_format)
+    assert is_json_payload(payload) == (response_format == JSON_FORMAT)
+
+    round_trip = ProcessingResponse.from_bytes(payload)
+    assert round_trip.status == ProcessingStatus.success
+    assert round_trip.message == ""
+    assert_same_roster(round_trip.result, response.result)
+
+
+@pytest.mark.parametrize("response_format", [JSON_FORMAT, MSGPACK_FORMAT])
+@pytest.mark.parametrize("status", [ProcessingStatus.failure,
+                                    ProcessingStatus.reload])
+def test_status_response_round_trip(response_format, status):
+    response = ProcessingResponse(status, None, "Traceback: error")
+    round_trip = ProcessingResponse.from_bytes(
+        response.to_bytes(response_format))
+    assert round_trip == response
+
+
+def test_json_response_is_unchanged():
+    response = ProcessingResponse(ProcessingStatus.success, build_roster(), "")
+    assert response.to_bytes() == response.to_str().encode("utf-8")
+    assert ProcessingResponse.from_str(
+        json.dumps(response.to_dict())).status == ProcessingStatus.success
+
+
+def test_unknown_wire_version():
+    payload = msgpack.packb([MSGPACK_WIRE_VERSION + 1,
+                             ProcessingStatus.failure.value, None, ""])
+    with pytest.raises(ValueError):
+        ProcessingResponse.from_bytes(payload)
+
+
+def test_msgpack_is_smaller():
+    response = ProcessingResponse(
+        ProcessingStatus.success, build_roster(200), "")
+    assert (len(response.to_bytes(MSGPACK_FORMAT)) <
+            len(response.to_bytes(JSON_FORMAT)) / 2)
+
+
+@pytest.mark.parametrize("response_format", [JSON_FORMAT, MSGPACK_FORMAT])
+def test_stream_frames_round_trip(response_format):
+    roster_matrix = RosterMatrixJson(1, 2, [
+        {"row": 0, "column": 0, "x": 10, "y": 20, "width": 96,
+         "height": 96},
+        {"row": 0, "column": 1, "x": 120, "y": 20, "width": 96,
+         "height": 96}])
+    matrix_event = parse_stream_frames(
+        matrix_frames(roster_matrix, response_format))
+    assert matrix_event.frame_type == MATRIX_FRAME
+    assert matrix_event.data.json_dict() == roster_matrix.json_dict()
+
+    hero = build_hero()
+    hero_event = parse_stream_frames(hero_frames(1, hero, response_format))
+    assert hero_event.frame_type == HERO_FRAME
+    assert hero_event.index == 1
+    assert_same_hero(hero_event.data, hero)
+
+    response = ProcessingResponse(ProcessingStatus.success, build_roster(), "")
+    status_event = parse_stream_frames(
+        status_frames(response, response_format))
+    assert status_event.frame_type == STATUS_FRAME
+    assert status_event.done
+    assert_same_roster(status_event.data.result, response.result)
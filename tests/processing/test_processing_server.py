@@ -0,0 +1,150 @@
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+import pytest
+import zmq
+
+from image_processing.afk.hero.hero_data import RosterJson, RosterMatrixJson
+from image_processing.processing.async_processing.processing_request import (
+    args_request_frames)
+from image_processing.processing.async_processing.processing_response import (
+    JSON_FORMAT, ProcessingResponse)
+from image_processing.processing.async_processing.processing_status import (
+    ProcessingStatus)
+from image_processing.processing.async_processing.processing_stream import (
+    matrix_frames, parse_stream_frames)
+from image_processing.processing.processing_server import ProcessingServer
+
+WORKER_COUNT = 2
+REPLY_TIMEOUT = 10000
+
+
+class StubServer(ProcessingServer):
+    """
+    ProcessingServer that answers with the pid of the worker instead of
+        processing a roster
+    """
+
+    @classmethod
+    def compute(cls, args: list[str], image_buffer: memoryview = None,
+                send_frames=None, response_format: str = JSON_FORMAT):
+        command, *options = args
+        if command == "crash":
+            os._exit(1)
+        if command == "sleep":
+            time.sleep(float(options[0]))
+        if command == "stream":
+            for _ in range(int(options[0])):
+                send_frames(matrix_frames(RosterMatrixJson(0, 0, []),
+                                          response_format))
+                time.sleep(0.1)
+        return ProcessingResponse(ProcessingStatus.success,
+                                  RosterJson([], 0, 0), str(os.getpid()))
+
+
+def serve(port: int):
+    StubServer("127.0.0.1", port, WORKER_COUNT).broker()
+
+
+def free_port():
+    with socket.socket() as port_socket:
+        port_socket.bind(("127.0.0.1", 0))
+        return port_socket.getsockname()[1]
+
+
+@pytest.fixture(name="client")
+def fixture_client():
+    port = free_port()
+    broker = multiprocessing.get_context("fork").Process(
+        target=serve, args=(port,))
+    broker.start()
+    context = zmq.Context()
+
+    def client(args: list[str] = None, frames: list[bytes] = None,
+               stream: bool = False) -> zmq.Socket:
+        client_socket = context.socket(zmq.DEALER)
+        client_socket.setsockopt(zmq.RCVTIMEO, REPLY_TIMEOUT)
+        client_socket.setsockopt(zmq.LINGER, 0)
+        client_socket.connect(f"tcp://127.0.0.1:{port}")
+        client_socket.send_multipart(
+            frames or args_request_frames(args, stream))
+        return client_socket
+
+    yield client
+    # Interrupting the broker terminates its workers
+    os.kill(broker.pid, signal.SIGINT)
+    broker.join(5)
+    if broker.is_alive():
+        broker.kill()
+    context.destroy(linger=0)
+
+
+def reply(client_socket: zmq.Socket) -> ProcessingResponse:
+    return ProcessingResponse.from_bytes(client_socket.recv())
+
+
+def worker_pids(client) -> set[str]:
+    """
+    Pids of the workers that answer two requests sent at the same time,
+        retried until both workers are running
+    """
+    for _ in range(20):
+        client_sockets = [client(["sleep", "0.5"])
+                          for _ in range(WORKER_COUNT)]
+        pids = {reply(client_socket).message
+                for client_socket in client_sockets}
+        if len(pids) == WORKER_COUNT:
+            return pids
+    raise AssertionError("Workers did not start")
+
+
+def test_requests_run_concurrently(client):
+    worker_pids(client)
+    start_time = time.time()
+    client_sockets = [client(["sleep", "1"]) for _ in range(WORKER_COUNT)]
+    responses = [reply(client_socket) for client_socket in client_sockets]
+
+    assert time.time() - start_time < 1.8
+    assert len({response.message for response in responses}) == WORKER_COUNT
+
+
+def test_partial_replies_keep_worker_busy(client):
+    worker_pids(client)
+    stream_socket = client(["stream", "20"], stream=True)
+    assert not parse_stream_frames(stream_socket.recv_multipart()).done
+
+    sleep_socket = client(["sleep", "1"])
+    time.sleep(0.2)
+    # Only the worker of the sleep request becomes idle before the stream
+    #   ends
+    next_socket = client(["sleep", "0"])
+    sleep_pid = reply(sleep_socket).message
+    assert reply(next_socket).message == sleep_pid
+
+    partial_count = 1
+    while not (stream_event := parse_stream_frames(
+            stream_socket.recv_multipart())).done:
+        partial_count += 1
+    assert partial_count == 20
+    assert stream_event.data.status == ProcessingStatus.success
+    assert stream_event.data.message != sleep_pid
+
+
+def test_malformed_request(client):
+    for frames in ([b"not json"], [b"image", b"[]"],
+                   [b"a", b"b", b"c", b"d"]):
+        assert reply(client(frames=frames)).status == ProcessingStatus.failure
+    assert reply(client(["sleep", "0"])).status == ProcessingStatus.success
+
+
+def test_crashed_worker_is_replaced(client):
+    old_pids = worker_pids(client)
+    response = reply(client(["crash"]))
+    assert response.status == ProcessingStatus.failure
+    assert "exited" in response.message
+
+    new_pids = worker_pids(client)
+    assert len(old_pids & new_pids) == WORKER_COUNT - 1
@@ -0,0 +1,93 @@
+import time
+
+import cv2
+import pytest
+
+import image_processing.globals as GV
+from image_processing.afk.hero.hero_data import HeroImage
+from image_processing.database.image_database import build_flann
+from image_processing.processing.image_data import SegmentResult
+from image_processing.scripts.benchmark_image_database import (
+    BenchmarkResult, LabelledRoster, accuracy_regressions, run_benchmark)
+
+pytestmark = pytest.mark.slow
+
+PORTRAIT_HEROES = ["ainz", "antandra", "brutus", "estrilda", "golus", "ira",
+                   "khasos", "lyca", "morvus", "oden", "raine", "satrana",
+                   "silvina", "tasi", "twins", "wukong"]
+MAX_ACCURACY_DROP = 0.02
+
+
+def degrade(image):
+    """
+    Resize, blur and compress a portrait so it looks like a segment of a
+        roster screenshot
+    """
+    image = cv2.GaussianBlur(cv2.resize(image, (208, 416)), (5, 5), 1.5)
+    _, image_buffer = cv2.imencode(".jpg", image,
+                                   [cv2.IMWRITE_JPEG_QUALITY, 70])
+    return cv2.imdecode(image_buffer, cv2.IMREAD_COLOR)
+
+
+def benchmark(name: str, hero_images, roster_list, **database_args):
+    start_time = time.time()
+    image_db = build_flann(hero_images, enriched_db=True, workers=1,
+                           **database_args)
+    return run_benchmark(name, image_db, time.time() - start_time,
+                         roster_list)
+
+
+@pytest.fixture(name="hero_images", scope="module")
+def fixture_hero_images():
+    hero_images = []
+    for hero_name in PORTRAIT_HEROES:
+        portrait_path = GV.IMAGE_PROCESSING_PORTRAITS.joinpath(
+            f"{hero_name}.required.1.png")
+        hero_images.append(HeroImage(
+            hero_name, cv2.imread(str(portrait_path)), portrait_path))
+    return hero_images
+
+
+@pytest.fixture(name="roster_list", scope="module")
+def fixture_roster_list(hero_images):
+    return [LabelledRoster(
+        "portraits",
+        [SegmentResult(hero_info.name, degrade(hero_info.image), None, None)
+         for hero_info in hero_images],
+        [hero_info.name for hero_info in hero_images])]
+
+
+@pytest.fixture(name="baseline", scope="module")
+def fixture_baseline(hero_images, roster_list):
+    return benchmark("baseline", hero_images, roster_list)
+
+
+def test_baseline_accuracy(baseline: BenchmarkResult):
+    assert baseline.labelled == len(PORTRAIT_HEROES)
+    assert baseline.accuracy == 1.0
+
+
+@pytest.mark.parametrize("database_args", [
+    {"max_keypoints": 200, "keypoint_radius": GV.KEYPOINT_NMS_RADIUS},
+    {"descriptor_dimensions": 64},
+    {"descriptor_dimensions": 64, "root_sift": True},
+    {"index_backend": "hnsw"},
+    {"index_backend": "ivfpq"},
+    {"verify_candidates": 3},
+    {"binary_shortlist": 3},
+    {"global_shortlist": 5},
+], ids=["max_keypoints", "pca", "pca_root_sift", "hnsw", "ivfpq",
+        "verify_candidates", "binary_shortlist", "global_shortlist"])
+def test_accuracy_regression(baseline, hero_images, roster_list,
+                             database_args):
+    result = benchmark(str(database_args), hero_images, roster_list,
+                       **database_args)
+    assert not accuracy_regressions([baseline, result], MAX_ACCURACY_DROP), (
+        f"{result} < {baseline}")
+
+
+def test_accuracy_regression_is_detected(baseline, hero_images, roster_list):
+    result = benchmark("max_keypoints=10", hero_images, roster_list,
+                       max_keypoints=10)
+    assert accuracy_regressions([baseline, result],
+                                MAX_ACCURACY_DROP) == [result]